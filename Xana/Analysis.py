@@ -1,3 +1,4 @@
+import os
 import numpy as np
 import time
 import copy
@@ -8,6 +9,8 @@ from .XpcsAna.Xpcs import Xpcs
 from .XsvsAna.Xsvs import Xsvs
 from .SaxsAna.Saxs import Saxs
 from .ProcData.Xdata import Xdata
+from .ProcData.Corrections import make_pipeline
+from .ProcData.RoiCache import roi_cache_key, roi_cache_file, write_roi_cache, read_roi_cache
 from .Decorators import Decorators
 from .misc.xsave import save_result
 
@@ -32,7 +35,7 @@ class Analysis(Xdata):
     @Decorators.input2list
     def analyze(self, series_id, method, first=0, last=np.inf, handle_existing='next',
                 nread_procs=1, chunk_size=200, verbose=True, dark=None,
-                dtype=np.float32, filename='', read_kwargs={}, **kwargs):
+                dtype=np.float32, filename='', read_kwargs={}, roi_cache=False, **kwargs):
         """Perform the analysis.
 
         Args:
@@ -44,12 +47,21 @@ class Analysis(Xdata):
                 +==========+=========================+
                 | saxs     | azimuthal intensity     |
                 +----------+-------------------------+
+                | saxs_tr  | azimuthal intensity of  |
+                |          | every image S(q,t)      |
+                +----------+-------------------------+
+                | cake     | I(q,phi,t) and angular  |
+                |          | correlations            |
+                +----------+-------------------------+
                 | xpcs     | correlation functions   |
                 +----------+-------------------------+
                 | xpcs_evt | event correlator        |
                 +----------+-------------------------+
                 | xsvs     | photon probabilities    |
                 +----------+-------------------------+
+                | xsvs_evt | photon probabilities    |
+                |          | from events             |
+                +----------+-------------------------+
 
             first (int, optional): Index of the first image to analyze. Defaults 0.
             last (int, optional): Index of the last image to analyze. Defaults :code:`nf-1`
@@ -61,6 +73,9 @@ class Analysis(Xdata):
             chunk_size (int, optional): Load the data in chunks of this many images.
             verbose (bool, optional): Print more detailed output if True (default).
             read_kwargs (dict, optional): Additional kwargs passed to the data reader.
+            roi_cache (bool, optional): For xpcs and xsvs, read the ROI pixels from a
+                cache file in :code:`savdir` which is created on the first run. The cache
+                is specific to the series, qrois, mask and corrections. Defaults to False.
             **kwargs: Additional kwargs are passed to the particular analysis routine depending
                 on the value of :code:`method`.
 
@@ -126,7 +141,14 @@ class Analysis(Xdata):
             digitized = np.digitize(ind_arange, bins)
             chunks = [ind_arange[np.where(digitized==i)] for i in np.unique(digitized)]
 
-            if method in ['xpcs', 'xsvs']:
+            use_cache = roi_cache and method in ['xpcs', 'xsvs']
+            if use_cache:
+                proc_dat, frame_mean = self._get_roi_cache(sid, rois, read_opt,
+                                                           first_proc, last_proc)
+                if method == 'xpcs':
+                    kwargs['frame_mean'] = frame_mean
+
+            elif method in ['xpcs', 'xsvs']:
 
                 # Register a shared PriorityQueue
                 MyManager.register("PriorityQueue", PriorityQueue)
@@ -142,6 +164,14 @@ class Analysis(Xdata):
                 read_opt['method'] = 'queue_chunk'
                 proc_dat['dataQ'] = dataQ
 
+                # only the pixels of the qrois are sent to the analysis
+                if 'output' not in read_kwargs and (
+                        method == 'xsvs' or
+                        kwargs.get('norm', 'symmetric_whole') != 'symmetric_whole'):
+                    read_opt['output'] = 'roi'
+                    read_opt['qroi'] = copy.deepcopy(rois)
+                    proc_dat['output'] = 'roi'
+
                 for i, chunk in enumerate(chunks):
                     indxQ.put((i, chunk))
 
@@ -167,7 +197,8 @@ class Analysis(Xdata):
                 nprocs = max([2, kwargs.pop('nprocs', 2)])
                 savd = Xpcs.pyxpcs(proc_dat, rois, dt=dt, qv=self.setup.qv,
                                    saxs=Isaxs, mask=self.setup.mask, ctr=self.setup.center,
-                                   qsec=self.setup.qsec[0], nprocs=nprocs, **kwargs)
+                                   qsec=self.setup.qsec[0], qsec_dim=self.setup.qsec_dim,
+                                   nprocs=nprocs, **kwargs)
 
             elif method == 'xpcs_evt':
                 dt = self._get_delay_time(sid)
@@ -188,6 +219,18 @@ class Analysis(Xdata):
                                    qv=self.setup.qv, qsec=self.setup.qsec[0],
                                    **kwargs)
 
+            elif method == 'xsvs_evt':
+                t_e = self._get_xsvs_args(sid,)
+                evt_dict = dict(method='events',
+                                verbose=True,
+                                qroi=rois,
+                                dtype=np.uint32,
+                )
+                read_opt.update(evt_dict)
+                evt = self.get_series(sid, **read_opt)
+                savd = Xsvs.evtxsvs(evt[1:], rois, t_e=t_e, qv=self.setup.qv,
+                                    **kwargs)
+
             elif method == 'saxs':
 
                 read_opt['output'] = '2d'
@@ -197,10 +240,28 @@ class Analysis(Xdata):
                             'mask': self.setup.mask}
                 savd = Saxs.pysaxs(proc_dat, **read_opt, **kwargs)
 
+            elif method == 'saxs_tr':
+
+                read_opt['output'] = 'lut'
+                proc_dat = {'get_series': self.get_series,
+                            'sid': sid,
+                            'setup': self.setup,
+                            'dt': self._get_delay_time(sid)}
+                savd = Saxs.pysaxs_tr(proc_dat, **read_opt, **kwargs)
+
+            elif method == 'cake':
+
+                read_opt['output'] = 'lut'
+                proc_dat = {'get_series': self.get_series,
+                            'sid': sid,
+                            'setup': self.setup,
+                            'dt': self._get_delay_time(sid)}
+                savd = Saxs.pycake(proc_dat, **read_opt, **kwargs)
+
             else:
                 raise ValueError('Analysis type %s not understood.' % method)
 
-            if method in ['xpcs', 'xsvs']:
+            if method in ['xpcs', 'xsvs'] and not use_cache:
                 # stopping processes
                 for ip in range(nread_procs):
                     procs[ip].join()
@@ -211,6 +272,8 @@ class Analysis(Xdata):
                 # indxQ.close()
                 # indxQ.join_thread()
 
+            savd['corrections'] = self._get_corrections(read_opt)
+
             f = self.datdir.split('/')[-2] + '_s' + \
                 str(self.meta.loc[sid, 'series']) + filename
             savfile = save_result(
@@ -223,7 +286,7 @@ class Analysis(Xdata):
         '''
         if saxs == 'compute':
             print('Calculating average SAXS image.')
-            Isaxs = self.get_series(sid, method='average', **read_opt)[0]
+            Isaxs = self.get_series(sid, method='average', **read_opt)['mean']
         elif isinstance(saxs, int):
             if saxs == -1:
                 saxs = self.db.shape[0] - 1
@@ -233,6 +296,46 @@ class Analysis(Xdata):
             Isaxs = saxs
         return Isaxs
 
+    def _get_roi_cache(self, sid, rois, read_opt, first, last):
+        ''' Load the ROI pixels of images first to last from the ROI cache of
+        the series. The cache is written if it does not exist.
+        '''
+        series = self.meta.loc[sid, 'series']
+        first_series = self.meta.loc[sid, 'first']
+        opt = dict(read_opt, first=first_series,
+                   last=first_series + self.meta.loc[sid, 'nframes'] - 1,
+                   qroi=copy.deepcopy(rois))
+        corrections = {k: opt.get(k) for k in ['dark', 'calib', 'cells', 'photonize',
+                                               'commonmode', 'dropletize', 'dropopt',
+                                               'dtype']}
+        key = roi_cache_key(self.datdir, series, rois, self.setup.mask,
+                            self.setup.qsec, corrections)
+        cachefile = roi_cache_file(self.savdir, series, key)
+        if os.path.isfile(cachefile):
+            print('Reading ROI cache {}.'.format(cachefile))
+        else:
+            print('Writing ROI cache {}.'.format(cachefile))
+            write_roi_cache(self.get_series, sid, cachefile, key, opt)
+        return read_roi_cache(cachefile, first - first_series, last - first_series)
+
+    def _get_corrections(self, read_opt):
+        ''' List of the corrections applied by the data reader.
+        '''
+        corrections = []
+        pipeline = make_pipeline(read_opt.get('dark'), read_opt.get('calib'))
+        if pipeline is not None:
+            corrections.extend(pipeline.applied)
+            if read_opt.get('cells') is not None:
+                corrections.append('cells')
+        h5opt = getattr(self, 'h5opt', {})
+        if read_opt.get('commonmode', True) and 'commonmode' in h5opt:
+            corrections.append('commonmode')
+        if read_opt.get('dropletize', False) and 'dropletize' in h5opt:
+            corrections.append('dropletize')
+        if read_opt.get('photonize', False):
+            corrections.append('photonize')
+        return corrections
+
     def _get_delay_time(self, sid):
         dt = 0
         for attr in ['t_delay', 't_exposure', 't_readout', 't_latency', 'rate',
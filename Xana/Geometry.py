@@ -0,0 +1,134 @@
+import os
+import hashlib
+import numpy as np
+from scipy import sparse
+
+# geometries of the last setups used in this session
+_memory = {}
+_memory_size = 4
+
+
+def geometry_key(setup, *extra):
+    """Hash of detector, distance, center, wavelength, the geometry of the
+    azimuthal integrator (which can be set independently, e.g., with tilts)
+    and extra items.
+    """
+    det = setup.detector
+    items = (det.aliases[0].lower(), tuple(det.shape), float(det.pixel1), float(det.pixel2),
+             float(setup.distance), tuple(float(x) for x in np.ravel(setup.center)),
+             float(setup.wavelength))
+    ai = setup.ai
+    if ai is not None:
+        items += tuple(float(getattr(ai, k) or 0) for k in
+                       ('dist', 'poni1', 'poni2', 'rot1', 'rot2', 'rot3', 'wavelength'))
+    items += extra
+    return hashlib.sha1(repr(items).encode()).hexdigest()[:16]
+
+
+def cache_dir(setup):
+    """Directory of the geometry cache; setup.cachedir or ~/.cache/xana.
+    """
+    cachedir = getattr(setup, 'cachedir', None)
+    if cachedir is None:
+        cachedir = os.path.join(os.path.expanduser('~'), '.cache', 'xana')
+    return cachedir
+
+
+def _remember(key, value):
+    if len(_memory) >= _memory_size:
+        _memory.pop(next(iter(_memory)))
+    _memory[key] = value
+    return value
+
+
+def _load(filename):
+    if not os.path.isfile(filename):
+        return None
+    with np.load(filename) as f:
+        return {k: f[k] for k in f.files}
+
+
+def _save(filename, arrays):
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmpfile = filename + '.tmp'
+        with open(tmpfile, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmpfile, filename)
+    except OSError as err:
+        print('Could not write geometry cache {}: {}'.format(filename, err))
+
+
+def _section(qsec):
+    if qsec is None:
+        return (slice(None), slice(None))
+    return (slice(qsec[0][0], qsec[1][0]+1), slice(qsec[0][1], qsec[1][1]+1))
+
+
+def get_geometry(setup, qsec=None):
+    """Geometry arrays of the detector or of the section qsec
+    ((row_min, col_min), (row_max, col_max)).
+
+    The arrays are computed once by the azimuthal integrator of the setup and
+    stored in the cache directory.
+
+    Returns:
+        dict: q (nm^-1), chi (rad), r (m) and solid_angle (relative) arrays.
+    """
+    key = geometry_key(setup)
+    geom = _memory.get(key)
+    if geom is None:
+        filename = os.path.join(cache_dir(setup), 'geometry_{}.npz'.format(key))
+        geom = _load(filename)
+        if geom is None:
+            ai = setup.ai
+            geom = {'q': ai.array_from_unit(unit='q_nm^-1'),
+                    'chi': ai.chiArray(),
+                    'r': ai.array_from_unit(unit='r_m'),
+                    'solid_angle': ai.solidAngleArray()}
+            _save(filename, geom)
+        _remember(key, geom)
+    sl = _section(qsec)
+    return {k: v[sl] for k, v in geom.items()}
+
+
+def get_lut(setup, nbins, mask=None, qsec=None):
+    """Sparse lookup table of the azimuthal integration.
+
+    Pixels are assigned to nbins equally spaced q-bins between the smallest
+    and largest q of the unmasked pixels (no pixel splitting). The table is
+    stored in the cache directory.
+
+    Returns:
+        dict: csr (scipy.sparse.csr_matrix of shape (nbins, number of pixels)
+            that sums the unmasked pixels of each bin), q (bin centers in nm^-1)
+            and norm (sum of the solid angles of the pixels in each bin).
+    """
+    geom = get_geometry(setup, qsec)
+    shape = geom['q'].shape
+    if mask is None:
+        mask = np.ones(shape, dtype=bool)
+    mask = np.asarray(mask, dtype=bool)
+    key = geometry_key(setup, int(nbins), qsec and tuple(map(tuple, np.asarray(qsec).tolist())),
+                       hashlib.sha1(np.packbits(mask).tobytes()).hexdigest())
+    if key in _memory:
+        return _memory[key]
+
+    filename = os.path.join(cache_dir(setup), 'lut_{}.npz'.format(key))
+    lut = _load(filename)
+    if lut is None:
+        q = geom['q'].ravel()
+        pix = np.flatnonzero(mask)
+        qpix = q[pix]
+        edges = np.linspace(qpix.min(), qpix.max(), nbins+1)
+        b = np.clip(np.searchsorted(edges, qpix, side='right') - 1, 0, nbins-1)
+        order = np.argsort(b, kind='stable')
+        lut = {'indices': pix[order].astype(np.int32),
+               'indptr': np.append(0, np.cumsum(np.bincount(b, minlength=nbins))),
+               'q': (edges[1:] + edges[:-1]) / 2,
+               'norm': np.bincount(b, geom['solid_angle'].ravel()[pix], minlength=nbins)}
+        _save(filename, lut)
+
+    csr = sparse.csr_matrix((np.ones(lut['indices'].size, dtype=np.float32), lut['indices'],
+                             lut['indptr']), shape=(nbins, np.prod(shape)))
+    return _remember(key, {'csr': csr, 'q': lut['q'], 'norm': lut['norm']})
@@ -1,8 +1,12 @@
 import numpy as np
 import sys
+from functools import lru_cache
 
 
-def arrange_cspad_tiles(img, ntiles=32, tile_size=(185,388), inverse=False, common_mode=False):
+def cspad_tile_geometry(ntiles=32, tile_size=(185,388)):
+    """Slices of the tiles in the arranged image and the transpose, left-right and
+    up-down flags of each tile.
+    """
     ffg = 0
     ffg2 = 0
     tile_location = np.array([[2,2], [3,2], [0,2], [0,3],
@@ -25,49 +29,112 @@ def arrange_cspad_tiles(img, ntiles=32, tile_size=(185,388), inverse=False, comm
  
     #tile_offset = np.array([[0, 0], [6, -15], [ 3, -1], [16, -3]])
     quad_offset = np.array([[10+ffg2, 0-ffg], [11-ffg, -10], [ 3, -1-ffg2], [16+ffg2, -3-ffg2]])
-    isUD = np.array([0, 0, 0, 0, 1, 1, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0], dtype=np.bool)
-    isLR = np.array([1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 1, 1], dtype=np.bool)
-    isTran = np.array([0, 0, 1, 1, 0, 0, 1, 1, 1, 1, 0, 0, 1, 1, 0, 0, 0, 0, 1, 1, 0, 0, 1, 1, 1, 1, 0, 0, 1, 1, 0, 0], dtype=np.bool)
+    isUD = np.array([0, 0, 0, 0, 1, 1, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0], dtype=bool)
+    isLR = np.array([1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 1, 1], dtype=bool)
+    isTran = np.array([0, 0, 1, 1, 0, 0, 1, 1, 1, 1, 0, 0, 1, 1, 0, 0, 0, 0, 1, 1, 0, 0, 1, 1, 1, 1, 0, 0, 1, 1, 0, 0], dtype=bool)
 
-    def get_slice(i):
+    slices = []
+    for i in range(ntiles):
         quad_ind =  int(np.floor(i/8))
         tile_location_final = tile_location2[i] + [50, -20] + quad_offset[quad_ind]
-        idx1 = slice(tile_location_final[0],tile_location_final[0]+tile_size[isTran[i]])
-        idx2 = slice(tile_location_final[1],tile_location_final[1]+tile_size[~isTran[i]])
-        return idx1, idx2
+        idx1 = slice(tile_location_final[0],tile_location_final[0]+tile_size[int(isTran[i])])
+        idx2 = slice(tile_location_final[1],tile_location_final[1]+tile_size[int(not isTran[i])])
+        slices.append((idx1, idx2))
 
-    # This is the arrangement of the 32 modules on the detector chip!
-    if inverse:
-        arr = np.empty((ntiles, *tile_size), dtype=np.float32)
-    else:
-        arr = np.zeros((1800, 1800), dtype=np.float32)
+    return slices, isTran[:ntiles], isLR[:ntiles], isUD[:ntiles]
 
-        
-    # ATTENTION: There is no final evaluation of all modules and their alignment!!!
-    for i in np.arange(ntiles):
-        
-        idx1, idx2 = get_slice(i)
 
-        if inverse:
-            buffer = img[idx1,idx2]
-        else:
-            buffer = img[i].copy()
+@lru_cache(maxsize=4)
+def cspad_index(ntiles=32, tile_size=(185,388), shape=(1800,1800)):
+    """Compile the tile arrangement into flat gather indices, e.g., to pick pixels
+    of the arranged image directly from tile space.
+
+    Returns:
+        tuple: index (image pixel -> tile pixel), inverse (tile pixel -> image pixel)
+            and the boolean mask of the image pixels not covered by any tile. Gaps
+            point to tile pixel 0 in index and have to be set to zero after gathering.
+    """
+    slices, isTran, isLR, isUD = cspad_tile_geometry(ntiles, tile_size)
+    npix = tile_size[0] * tile_size[1]
+    pos = np.arange(shape[0]*shape[1]).reshape(shape)
+    inverse = np.empty((ntiles, *tile_size), dtype=np.intp)
+    index = np.full(shape[0]*shape[1], -1, dtype=np.intp)
 
-        if common_mode and not inverse:
-            buffer -= common_mode(buffer)
+    # ATTENTION: There is no final evaluation of all modules and their alignment!!!
+    for i in range(ntiles):
+        buffer = pos[slices[i]]
         if isTran[i]:
                buffer = np.transpose(buffer)
         if isLR[i]:
                buffer = np.fliplr(buffer)
         if isUD[i]:
                buffer = np.flipud(buffer)
+        inverse[i] = buffer
+        # later tiles overwrite overlapping pixels as in the arranged image
+        index[buffer.ravel()] = np.arange(i*npix, (i+1)*npix)
+
+    gaps = index == -1
+    index[gaps] = 0
+    inverse = inverse.ravel()
+    for a in (index, inverse, gaps):
+        a.setflags(write=False)
+    return index, inverse, gaps
+
+
+def arrange_cspad_tiles(img, ntiles=32, tile_size=(185,388), inverse=False, common_mode=False,
+                        out=None, shape=(1800,1800)):
+    """Arrange CSPAD tiles (..., ntiles, *tile_size) to images (..., 1800, 1800) or
+    split images into tiles if inverse is True. Leading dimensions (e.g. frames of
+    a chunk) are processed at once with one strided copy per tile.
+    """
+    slices, isTran, isLR, isUD = cspad_tile_geometry(ntiles, tile_size)
+
+    if inverse:
+        lead = img.shape[:-2]
+        if out is None:
+            out = np.empty((*lead, ntiles, *tile_size), dtype=img.dtype)
+    else:
+        lead = img.shape[:-3]
+        if common_mode:
+            img = img.copy()
+            for tile in img.reshape(-1, *tile_size):
+                tile -= common_mode(tile)
+        if out is None:
+            out = np.zeros((*lead, *shape), dtype=img.dtype)
+        else:
+            out[...] = 0
 
+    # ATTENTION: There is no final evaluation of all modules and their alignment!!!
+    for i in range(ntiles):
         if inverse:
-            arr[i] = buffer
+            buffer = img[(Ellipsis, *slices[i])]
         else:
-            arr[idx1,idx2] = buffer
+            buffer = img[..., i, :, :]
+        if isTran[i]:
+            buffer = np.swapaxes(buffer, -1, -2)
+        if isLR[i]:
+            buffer = buffer[..., ::-1]
+        if isUD[i]:
+            buffer = buffer[..., ::-1, :]
+        if inverse:
+            out[..., i, :, :] = buffer
+        else:
+            out[(Ellipsis, *slices[i])] = buffer
+
+    return out
+
 
-    # image = np.transpose(image)
-    #im_blank = commonmode.commonmode(im_blank,commonmode.mask,searchoffset=200,COMrad=3)
-    return arr
+def gather_cspad_roi(arr, roi, ntiles=32, tile_size=(185,388), shape=(1800,1800)):
+    """Gather the pixels of roi (tuple of row and column indices in the arranged
+    image) directly from tile space without arranging the full images.
 
+    Returns:
+        np.ndarray: shape (..., number of roi pixels).
+    """
+    index, _, gaps = cspad_index(ntiles, tuple(tile_size), tuple(shape))
+    pix = np.ravel_multi_index(roi, shape)
+    src = index[pix]
+    flat = arr.reshape(*arr.shape[:-3], -1)
+    out = np.take(flat, src, axis=-1)
+    out[..., gaps[pix]] = 0
+    return out
@@ -0,0 +1,100 @@
+import numpy as np
+
+
+class CorrectionPipeline:
+    """Dark, gain and flatfield correction of image chunks.
+
+    The maps are combined once into an offset and a scale array such that
+    the corrected data are :code:`(raw - dark) / (gain * flatfield)`. Maps have
+    the shape of a frame, e.g., (ny, nx) or the tiles of a CSPAD (32, 185, 388),
+    or have one map per detector memory cell (ncells, ny, nx). A map is per cell
+    if it has one dimension more than the frames or if per_cell is True.
+    """
+
+    def __init__(self, dark=None, gain=None, flatfield=None, dtype=np.float32,
+                 per_cell=None):
+
+        self.applied = [] #: list: names of the corrections that are applied.
+        self.per_cell = per_cell #: bool: maps per memory cell; None to infer from the frames.
+        self.offset = None
+        self.scale = None
+
+        if dark is not None:
+            self.offset = np.ascontiguousarray(dark, dtype=dtype)
+            self.applied.append('dark')
+
+        scale = None
+        for name, m in (('gain', gain), ('flatfield', flatfield)):
+            if m is not None:
+                m = np.asarray(m, dtype=np.float64)
+                scale = m if scale is None else scale * m
+                self.applied.append(name)
+        if scale is not None:
+            scale = np.where(scale != 0, 1. / np.where(scale != 0, scale, 1.), 0)
+            self.scale = np.ascontiguousarray(scale, dtype=dtype)
+
+    def is_per_cell(self, frame_ndim):
+        """Whether the maps are given per memory cell for frames with
+        frame_ndim dimensions.
+        """
+        if self.per_cell is not None:
+            return bool(self.per_cell)
+        return any(m is not None and m.ndim > frame_ndim for m in (self.offset, self.scale))
+
+    def crop(self, qsec):
+        """Return a pipeline with maps cropped to the q-section. Only for 2D
+        frames; maps of tiled detectors are applied before the tiles are
+        arranged and are not cropped.
+        """
+        sl = (..., slice(qsec[0][0], qsec[1][0]+1), slice(qsec[0][1], qsec[1][1]+1))
+        new = CorrectionPipeline(per_cell=self.per_cell)
+        new.applied = list(self.applied)
+        if self.offset is not None:
+            new.offset = np.ascontiguousarray(self.offset[sl])
+        if self.scale is not None:
+            new.scale = np.ascontiguousarray(self.scale[sl])
+        return new
+
+    def __call__(self, arr, cells=None):
+        """Correct a chunk (nframes, ny, nx) of float data in place.
+
+        Args:
+            arr (np.ndarray): chunk of images.
+            cells (np.ndarray, optional): memory cell index of each frame. Needed
+                if the maps are given per memory cell.
+        """
+        per_cell = self.is_per_cell(arr.ndim - 1)
+        if per_cell and cells is None:
+            raise ValueError('Memory cell indices are needed for maps per cell.')
+
+        def get_map(m, i):
+            if m is None or not per_cell or m.ndim < arr.ndim:
+                return m
+            return m[cells[i]]
+
+        # correct frame by frame such that offset and scale are applied while
+        # the frame is in cache and without temporary arrays
+        for i in range(arr.shape[0]):
+            frame = arr[i]
+            offset = get_map(self.offset, i)
+            scale = get_map(self.scale, i)
+            if offset is not None:
+                np.subtract(frame, offset, out=frame)
+            if scale is not None:
+                np.multiply(frame, scale, out=frame)
+        return arr
+
+
+def make_pipeline(dark=None, calib=None, dtype=np.float32):
+    """Create a CorrectionPipeline from a dark image and calib, which is
+    None, a CorrectionPipeline or a dict with dark, gain and flatfield maps and
+    optionally per_cell.
+    """
+    if isinstance(calib, CorrectionPipeline):
+        return calib
+    calib = dict(calib) if calib is not None else {}
+    if dark is not None:
+        calib.setdefault('dark', dark)
+    if not any(calib.get(k) is not None for k in ('dark', 'gain', 'flatfield')):
+        return None
+    return CorrectionPipeline(dtype=dtype, **calib)
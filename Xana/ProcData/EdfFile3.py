@@ -31,7 +31,7 @@
     Interface:
     ===========================
     class EdfFile:          
-        __init__(self,FileName)	
+        __init__(self,FileName,fastedf=None,lazy=False)	
         GetNumImages(self)
         def GetData(self,Index, DataType="",Pos=None,Size=None):
         GetPixel(self,Index,Position)
@@ -141,17 +141,68 @@ class Image:
    
 ################################################################################
 
+class LazyImageList:
+    """ List of Image objects used by EdfFile in lazy mode. Only the header
+        positions and sizes are stored when the file is opened. An Image is
+        built by the parse function on its first access and cached afterwards.
+    """
+    def __init__(self, parse):
+        """ Constructor
+            parse:      function returning the Image for a given index
+        """
+        self.HeaderPositions=[]
+        self.HeaderSizes=[]
+        self.__parse=parse
+        self.__images=[]
+
+    def add(self, HeaderPosition, HeaderSize):
+        """ Adds an image that has not been parsed yet
+        """
+        self.HeaderPositions.append(HeaderPosition)
+        self.HeaderSizes.append(HeaderSize)
+        self.__images.append(None)
+
+    def append(self, img):
+        """ Adds an already parsed image
+        """
+        self.HeaderPositions.append(img.HeaderPosition)
+        self.HeaderSizes.append(img.DataPosition-img.HeaderPosition)
+        self.__images.append(img)
+
+    def DataPosition(self, Index):
+        """ Returns the position of the data block without parsing the header
+        """
+        return self.HeaderPositions[Index] + self.HeaderSizes[Index]
+
+    def __len__(self):
+        return len(self.__images)
+
+    def __getitem__(self, Index):
+        img = self.__images[Index]
+        if img is None:
+            img = self.__parse(Index)
+            self.__images[Index] = img
+        return img
+
+################################################################################
+
 class  EdfFile:    
     """
     """
     ############################################################################
     #Interface
-    def __init__(self,FileNameOrFileDescriptor,fastedf=None):
+    def __init__(self,FileNameOrFileDescriptor,fastedf=None,lazy=False):
         """ Constructor
             FileNameOrFileDescriptor:   Name of the file (either existing or to be created) or file descriptor
+            lazy:                       If true, the file is opened read-only and only the
+                                        offsets and sizes of the headers are indexed. Header
+                                        dictionaries are parsed on first access and GetData
+                                        returns views on a memory-mapped file.
         """
         self.Images=[]
         self.NumImages=0
+        self.lazy=lazy
+        self.__mmap=None
 
         if isinstance(FileNameOrFileDescriptor,str) :
             self.File = None
@@ -176,7 +227,7 @@ class  EdfFile:
                     self.File = open(self.FileName, "wb")
                     self.File.close()    
 
-                if (os.access(self.FileName,os.W_OK)):
+                if (os.access(self.FileName,os.W_OK)) and not lazy:
                     self.File=open(self.FileName, "r+b")
                 else : 
                     self.File=open(self.FileName, "rb")
@@ -193,6 +244,7 @@ class  EdfFile:
         Index=0
 
         self.__checkEdfFile = re.compile(r'^dim_1',re.IGNORECASE|re.MULTILINE)
+        self.__sizeRegex = re.compile(r'^\s*size\s*=\s*(\d+)',re.IGNORECASE|re.MULTILINE)
 
         self.File.seek(0, 0)
         if self.File.read(1) == '':
@@ -200,76 +252,30 @@ class  EdfFile:
         self.File.seek(0, 0)
 
         startHeaderPos = self.File.tell()
-        header,headersize = self.__readOneHeader()
-        while 1 :
-            img = Image()
-            img.HeaderPosition = startHeaderPos
-            img.DataPosition = startHeaderPos + headersize
-            StaticHeader = {}
-            for line in header.split('\n') :
-                posSemiColumn = line.rfind(';')
-                if posSemiColumn < 0: continue
-                else:
-                    line = line[:posSemiColumn]
+        if self.lazy:
+            #only the header offsets and sizes are indexed here, the key/value
+            #pairs are parsed when an image is accessed for the first time
+            self.Images = LazyImageList(self.__parseImage)
+            while 1 :
                 try:
-                    key,value = line.split('=')
-                    key = key.strip()
-                    value = value.strip()
-                except ValueError: continue
-                keyCap = key.upper()
-                if keyCap in STATIC_HEADER_ELEMENTS_CAPS :
-                    img.StaticHeader[key] = value
-                    StaticHeader[keyCap] = value
-                else:
-                    img.Header[key] = value
-            #Check Image Size
-            try:
-                stringSize = StaticHeader['SIZE']
-                imageSize = int(stringSize)
-                img.Size = imageSize
-                self.File.seek(img.DataPosition + imageSize)
+                    header,headersize = self.__readOneHeader()
+                except: break
+                match = self.__sizeRegex.search(header[:headersize])
+                if match is None:
+                    raise KeyError("EdfFile: Image doesn't have size information")
+                self.Images.add(startHeaderPos, headersize)
+                self.NumImages += 1
+                self.File.seek(startHeaderPos + headersize + int(match.group(1)))
                 startHeaderPos = self.File.tell()
-            except KeyError:
-                raise KeyError("EdfFile: Image doesn't have size information")
-            except ValueError:
-                raise ValueError("EdfFile: Image size information is not an integer")
-            #Check DataType
-            try:
-                img.DataType = StaticHeader["DATATYPE"]
-            except KeyError:
-                raise KeyError("EdfFile: Image doesn't have datatype information")
-            #Check ByteOrder
-            try:
-                img.ByteOrder = StaticHeader["BYTEORDER"]
-            except KeyError:
-                raise KeyError("EdfFile: Image doesn't have byteorder information")
-            #Check DIM1
-            try:
-                stringDim1 = StaticHeader["DIM_1"]
-                img.Dim1 = int(stringDim1)
-                try:
-                    img.Offset1 = int(StaticHeader.get('OFFSET_1','0'))
-                except ValueError:
-                    img.Offset1 = 0
-            except KeyError:
-                raise KeyError("EdfFile: Image doesn't have dimension information")
-            #DIM2
-            stringDim2 = StaticHeader.get("DIM_2",None)
-            if stringDim2 is not None:
-                img.Dim2 = int(stringDim2)
-                try:
-                    img.Offset2 = int(StaticHeader.get("OFFSET_2","0"))
-                except ValueError:
-                    img.Offset2 = 0
-                img.NumDim = 2
-            #DIM3
-            stringDim3 = StaticHeader.get("DIM_3",None)
-            if stringDim3 is not None:
-                img.Dim3 = int(stringDim3)
-                try:
-                    img.Offset3 = int(StaticHeader.get("OFFSET_3","0"))
-                except ValueError:
-                    img.Offset3 = 0
+            if self.__ownedOpen and self.NumImages:
+                self.__mmap = numpy.memmap(self.FileName, dtype=numpy.uint8, mode='r')
+            return
+
+        header,headersize = self.__readOneHeader()
+        while 1 :
+            img = self.__buildImage(header, startHeaderPos, headersize)
+            self.File.seek(img.DataPosition + img.Size)
+            startHeaderPos = self.File.tell()
             #APPEND IMAGE
             self.Images.append(img)
             self.NumImages += 1
@@ -317,7 +323,18 @@ class  EdfFile:
         fastedf = self.fastedf
         if Index < 0 or Index >= self.NumImages: raise ValueError("EdfFile: Index out of limit")
         if fastedf is None: fastedf = 0
-        if Pos is None and Size is None:
+        if Pos is None and Size is None and self.__mmap is not None:
+            datatype = self.__GetDefaultNumpyType__(self.Images[Index].DataType, index= Index)
+            if self.Images[Index].NumDim==3:
+                shape = (self.Images[Index].Dim3,self.Images[Index].Dim2, self.Images[Index].Dim1)
+            elif self.Images[Index].NumDim==2:
+                shape = (self.Images[Index].Dim2, self.Images[Index].Dim1)
+            else:
+                shape = (self.Images[Index].Dim1,)
+            #read-only view on the memory-mapped file, no data are read here
+            Data = numpy.ndarray(shape, datatype, buffer=self.__mmap,
+                                 offset=self.Images[Index].DataPosition)
+        elif Pos is None and Size is None:
             self.File.seek(self.Images[Index].DataPosition,0)
             datatype = self.__GetDefaultNumpyType__(self.Images[Index].DataType, index= Index)
             try:
@@ -681,10 +698,17 @@ class  EdfFile:
             return aux
         return Array
 
+    def close(self):
+        """ Closes the file if it has been opened by the object and releases
+            the memory map of the lazy mode
+        """
+        self.__mmap=None
+        if self.__ownedOpen and self.File is not None:
+            self.File.close()
+
     def __del__(self):
         try:
-            if self.__ownedOpen:
-                self.File.close()
+            self.close()
         except:
             pass
 
@@ -721,6 +745,86 @@ class  EdfFile:
             
         return GetDefaultNumpyType(EdfType)
         
+    def __buildImage(self, header, startHeaderPos, headersize):
+        """ Internal method: returns Image object from the header string
+        """
+        img = Image()
+        img.HeaderPosition = startHeaderPos
+        img.DataPosition = startHeaderPos + headersize
+        StaticHeader = {}
+        for line in header.split('\n') :
+            posSemiColumn = line.rfind(';')
+            if posSemiColumn < 0: continue
+            else:
+                line = line[:posSemiColumn]
+            try:
+                key,value = line.split('=')
+                key = key.strip()
+                value = value.strip()
+            except ValueError: continue
+            keyCap = key.upper()
+            if keyCap in STATIC_HEADER_ELEMENTS_CAPS :
+                img.StaticHeader[key] = value
+                StaticHeader[keyCap] = value
+            else:
+                img.Header[key] = value
+        #Check Image Size
+        try:
+            stringSize = StaticHeader['SIZE']
+            imageSize = int(stringSize)
+            img.Size = imageSize
+        except KeyError:
+            raise KeyError("EdfFile: Image doesn't have size information")
+        except ValueError:
+            raise ValueError("EdfFile: Image size information is not an integer")
+        #Check DataType
+        try:
+            img.DataType = StaticHeader["DATATYPE"]
+        except KeyError:
+            raise KeyError("EdfFile: Image doesn't have datatype information")
+        #Check ByteOrder
+        try:
+            img.ByteOrder = StaticHeader["BYTEORDER"]
+        except KeyError:
+            raise KeyError("EdfFile: Image doesn't have byteorder information")
+        #Check DIM1
+        try:
+            stringDim1 = StaticHeader["DIM_1"]
+            img.Dim1 = int(stringDim1)
+            try:
+                img.Offset1 = int(StaticHeader.get('OFFSET_1','0'))
+            except ValueError:
+                img.Offset1 = 0
+        except KeyError:
+            raise KeyError("EdfFile: Image doesn't have dimension information")
+        #DIM2
+        stringDim2 = StaticHeader.get("DIM_2",None)
+        if stringDim2 is not None:
+            img.Dim2 = int(stringDim2)
+            try:
+                img.Offset2 = int(StaticHeader.get("OFFSET_2","0"))
+            except ValueError:
+                img.Offset2 = 0
+            img.NumDim = 2
+        #DIM3
+        stringDim3 = StaticHeader.get("DIM_3",None)
+        if stringDim3 is not None:
+            img.Dim3 = int(stringDim3)
+            try:
+                img.Offset3 = int(StaticHeader.get("OFFSET_3","0"))
+            except ValueError:
+                img.Offset3 = 0
+        return img
+
+    def __parseImage(self, Index):
+        """ Internal method: parses the header of an image indexed in lazy mode
+        """
+        startHeaderPos = self.Images.HeaderPositions[Index]
+        headersize = self.Images.HeaderSizes[Index]
+        self.File.seek(startHeaderPos, 0)
+        header = self.File.read(headersize).decode('utf-8')
+        return self.__buildImage(header, startHeaderPos, headersize)
+
     def __readOneHeader(self) :
         buffer = self.File.read(512).decode('utf-8')
         # TEST if it's an EDF File
@@ -1,3 +1,4 @@
+import numpy as np
 from os.path import isfile
 from .EdfFile3 import EdfFile, EdfGzipFile
 
@@ -32,10 +33,34 @@ def saveedf(filename, data, imgn=0):
 def headeredf(filename, imgn=0):
     if isfile(filename):
         if filename.endswith('edf'):
-            f = EdfFile(filename)
+            f = EdfFile(filename, lazy=True)
         elif filename.endswith('edf.gz'):
-            f = EdfGzipFile(filename)
+            f = EdfGzipFile(filename, lazy=True)
         return f.GetHeader(imgn)
     else:
         print("file ", filename, " does not exist!")
         return 0
+
+
+def indexedf(filename):
+    """Return the data offsets of all images in a (multi image) edf file together
+    with the image shape and the numpy dtype including the byte order. Only the
+    first header is parsed; all images are assumed to have the same format.
+    """
+    f = EdfFile(filename, lazy=True)
+    try:
+        nimg = f.GetNumImages()
+        offsets = np.array([f.Images.DataPosition(i) for i in range(nimg)], dtype=np.int64)
+        img = f.Images[0]
+        if img.NumDim == 2:
+            shape = (img.Dim2, img.Dim1)
+        else:
+            shape = (img.Dim1,)
+        dtype = np.dtype(f.GetDefaultNumpyType(img.DataType, index=0))
+    finally:
+        f.close()
+    if img.ByteOrder.upper() == 'HIGHBYTEFIRST':
+        dtype = dtype.newbyteorder('>')
+    else:
+        dtype = dtype.newbyteorder('<')
+    return offsets, shape, dtype
@@ -112,3 +112,51 @@ def common_mode_from_hist(im, searchoffset=50):
     hist, _ = np.histogram(im,bins)
     CM = np.where(hist==hist.max())[0][0] - searchoffset
     return CM # has to be subtracted from the tail
+
+
+def common_mode(arr, method='hist', searchoffset=50, proportiontocut=0.1, block=8):
+    """Common mode of all tiles of all frames at once.
+
+    Args:
+        arr (np.ndarray): image tiles with shape (..., ny, nx).
+        method (str): 'hist' for the mode of the histogram of the floored values
+            in [-searchoffset, searchoffset) as in common_mode_from_hist, 'median'
+            or 'trimmed' for the mean after cutting proportiontocut at both tails.
+        block (int): number of tiles processed per call to limit the memory usage.
+
+    Returns:
+        np.ndarray: common mode with shape arr.shape[:-2] which has to be subtracted
+            from the tiles.
+    """
+    shape = arr.shape[:-2]
+    tiles = arr.reshape(-1, arr.shape[-2]*arr.shape[-1])
+    ntiles = tiles.shape[0]
+    cm = np.empty(ntiles, dtype=np.float64)
+
+    if method == 'hist':
+        # integer bins [k, k+1) for k in [-searchoffset, searchoffset); values out of
+        # range are clipped to an underflow and an overflow bin which are ignored
+        nbins = 2*searchoffset + 2
+        for i in range(0, ntiles, block):
+            t = tiles[i:i+block]
+            n = t.shape[0]
+            c = np.clip(t, -searchoffset-1, searchoffset).astype(np.float32, copy=False)
+            np.floor(c, out=c)
+            c += (np.arange(n, dtype=np.float32)*nbins + searchoffset + 1)[:, None]
+            hist = np.bincount(c.astype(np.intp).ravel(), minlength=n*nbins)
+            hist = hist.reshape(n, nbins)[:, 1:-1]
+            cm[i:i+n] = hist.argmax(1) - searchoffset
+    elif method == 'median':
+        for i in range(0, ntiles, block):
+            cm[i:i+block] = np.median(tiles[i:i+block], axis=1)
+    elif method == 'trimmed':
+        npix = tiles.shape[1]
+        lo = int(proportiontocut * npix)
+        hi = npix - lo
+        for i in range(0, ntiles, block):
+            t = np.partition(tiles[i:i+block], (lo, hi-1), axis=1)
+            cm[i:i+block] = t[:, lo:hi].mean(1)
+    else:
+        raise ValueError('Common mode method {} not understood.'.format(method))
+
+    return cm.reshape(shape)
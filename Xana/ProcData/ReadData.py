@@ -3,8 +3,12 @@ import numpy as np
 import multiprocessing as mp
 from ..XpcsAna.xpcsmethods import mat2evt
 from ..misc.progressbar import progress
+from ..misc.running_mean import RunningStats
 from . import EdfMethods as edf
 from . import CbfMethods as cbf
+from .Corrections import make_pipeline
+from .ArrangeModules import arrange_cspad_tiles, gather_cspad_roi
+from ..misc.qroi import QRoi, section_qroi
 
 
 def get_case(detector):
@@ -90,21 +94,36 @@ def rlock(lock):
         pass
 
 
-def rearrange_tiles(arr, func):
+def photon_dtype(max_photons):
+    """Smallest unsigned integer type that holds max_photons.
+    """
+    for dt in (np.uint8, np.uint16, np.uint32):
+        if max_photons <= np.iinfo(dt).max:
+            return dt
+    return np.uint64
 
-    if arr.ndim > 3:
-        for i in range(arr.shape[0]):
-            if i == 0:
-                tmp = func(arr[i])
-                arranged_arr = np.empty((arr.shape[0], *tmp.shape))
-                arranged_arr[i] = tmp
-            else:
-                arranged_arr[i] = func(arr[i])
-        del arr
-        arr = arranged_arr
-    else:
-        arr = func(arr)
-    return arr
+
+def photonize(arr, adusPphoton=1., threshold=.5, max_photons=255):
+    """Convert ADUs to photon counts. A pixel counts n photons if its value is
+    larger or equal to (n - 1 + threshold) * adusPphoton. adusPphoton can be a
+    gain map. The counts are clipped to [0, max_photons] and returned as the
+    smallest unsigned integer type.
+    """
+    dtype = photon_dtype(max_photons)
+    if arr.dtype.kind in 'ui' and np.all(adusPphoton == 1) and 0 < threshold <= 1:
+        # integer counts are already photons for thresholds in (0, 1]
+        return np.clip(arr, 0, max_photons).astype(dtype)
+    ph = arr / adusPphoton
+    ph += 1 - threshold
+    np.floor(ph, out=ph)
+    np.clip(ph, 0, max_photons, out=ph)
+    return ph.astype(dtype)
+
+
+def rearrange_tiles(arr, func):
+    """Arrange the tiles of an image or of a stack of images with func.
+    """
+    return func(arr)
 
 
 # -----------------------------------------------------------------------
@@ -122,8 +141,15 @@ class dataset:
         self.shape = None
         self.dstream = None
         self.variance = None
+        self.vmin = None
+        self.vmax = None
         self.chunk = None
         self.imgpf = None
+        self.stats = None
+        self.roi_index = None
+        self.roi_offsets = None
+        self.roi_tiles = None
+        self.chunk_mean = None
 
     def update_shape(self, nimg, dim):
 
@@ -132,7 +158,19 @@ class dataset:
     def init_output(self, ):
 
         if self.method == 'full':
-            self.dstream = np.empty(self.shape, dtype=self.dtype)
+            if self.output_file is None:
+                dtype = self.dtype
+                if 'photonize' in self.corrections:
+                    dtype = photon_dtype(self.phopt.get('max_photons', 255))
+                shape = self.shape
+                if self.roi_index is not None:
+                    shape = (shape[0], self.roi_index.size)
+                elif self.lut is not None:
+                    shape = (shape[0], self.lut.shape[0])
+                self.dstream = np.empty(shape, dtype=dtype)
+            else:
+                # allocated by write_chunk when the first chunk is known
+                self.dstream = None
         elif self.method == 'average':
             pass
         elif self.method == 'queue_chunk':
@@ -158,18 +196,24 @@ class dataset:
         else:
             self.dstream = self.dstream.mean(0).data
 
-    def process_chunk(self):
+    def process_chunk(self, indx=None):
 
-        arr = self.chunk.astype(self.dtype, copy=False)
+        if self.corrections and set(self.corrections) <= {'photonize', 'filter_value'}:
+            # photon counts are computed from the raw data
+            arr = self.chunk
+        else:
+            arr = self.chunk.astype(self.dtype, copy=False)
 
         for correction in self.corrections:
             if correction == 'commonmode':
-                for matr in arr:
-                    for tile in matr:
-                        tile -= self.commonmode(tile)
+                cm = self.commonmode(arr, method=self.commonmode_method)
+                arr -= cm[..., None, None].astype(arr.dtype, copy=False)
 
-            elif correction == 'dark':
-                arr -= self.dark[None, ...]
+            elif correction == 'calib':
+                cells = None
+                if self.cells is not None:
+                    cells = np.asarray(self.cells)[indx]
+                self.calib(arr, cells)
 
             # elif correction == 'mask':
             #     ind = (...,*mask)
@@ -179,7 +223,10 @@ class dataset:
                 arr[arr != self.filter_value] = 0
 
             elif correction == 'dropletize':
-                arr = self.dropletize(arr, self.dropopt)
+                arr = self.dropletize(arr, self.dropopt, mask=self.dropmask)
+
+            elif correction == 'photonize':
+                arr = photonize(arr, **self.phopt)
 
         if 'events' in self.method:
             # store mean intensity of frames in first list element
@@ -197,30 +244,112 @@ class dataset:
 
             arr = m
 
+        elif self.output == 'roi':
+            if self.frame_mean:
+                # mean intensity of the masked section, e.g., for normalization
+                if self.mask is not None and self.roi_tiles is None:
+                    self.chunk_mean = arr[(..., *self.mask)].mean(-1)
+                else:
+                    self.chunk_mean = arr.reshape(arr.shape[0], -1).mean(-1)
+            arr = self.gather_roi(arr)
+
+        elif self.output == 'lut':
+            arr = self.apply_lut(arr)
+
         self.chunk = arr
 
+    def gather_roi(self, arr):
+        """Gather the qroi pixels of a chunk into a contiguous array
+        (nframes, total number of roi pixels). The pixels of roi i are
+        arr[:, roi_offsets[i]:roi_offsets[i+1]].
+        """
+        if self.roi_tiles is not None:
+            if self.arrange_tiles is arrange_cspad_tiles:
+                return gather_cspad_roi(arr, self.roi_tiles)
+            arr = rearrange_tiles(arr, self.arrange_tiles)
+        flat = arr.reshape(arr.shape[0], -1)
+        return np.take(flat, self.roi_index, axis=1)
+
+
+    def apply_lut(self, arr):
+        """Reduce the images of a chunk with the sparse matrix lut (e.g., an
+        azimuthal integration) to an array (nframes, number of bins). lut can
+        also be a callable with a shape attribute like the sparse matrix.
+        """
+        if getattr(self, 'arrange_tiles', None) is not None and arr.ndim > 3:
+            arr = rearrange_tiles(arr, self.arrange_tiles)
+        flat = arr.reshape(arr.shape[0], -1)
+        if callable(self.lut):
+            return np.asarray(self.lut(flat), dtype=self.dtype)
+        return np.asarray(flat @ self.lut.T, dtype=self.dtype)
+
+    def init_output_file(self, shape, dtype):
+        """Create the array on disk that is filled chunk by chunk if the output of
+        method 'full' is written to output_file.
+        """
+        filename = self.output_file
+        if filename.endswith('.h5') or filename.endswith('.hdf5'):
+            f = h5py.File(filename, 'w')
+            out = f.create_dataset('data', shape, dtype=dtype,
+                                   chunks=(min(self.chunk_size, shape[0]), *shape[1:]),
+                                   compression=self.compression)
+            if self.frame_mean:
+                f.create_dataset('frame_mean', shape[:1], dtype=np.float64)
+        elif filename.endswith('.npy'):
+            out = np.lib.format.open_memmap(filename, mode='w+', dtype=dtype,
+                                            shape=shape)
+        else:
+            out = np.memmap(filename, mode='w+', dtype=dtype, shape=shape)
+        return out
+
+    def write_chunk(self, indx):
+        """Prepare the output of the current chunk and write it to the output file.
+        """
+        out = self.dstream
+        self.dstream = self.chunk
+        self.prepare_output(squeeze=False)
+        if out is None:
+            out = self.init_output_file((self.shape[0], *self.dstream.shape[1:]),
+                                        self.dstream.dtype)
+        out[indx[0]:indx[-1]+1] = self.dstream
+        if self.chunk_mean is not None and isinstance(out, h5py.Dataset):
+            out.file['frame_mean'][indx[0]:indx[-1]+1] = self.chunk_mean
+        self.dstream = out
+
+    def close_output_file(self):
+        """Flush the output file. HDF5 files are closed and the data are
+        returned as dataset of the file opened read-only.
+        """
+        if isinstance(self.dstream, np.memmap):
+            self.dstream.flush()
+        elif self.dstream is not None:
+            self.dstream.file.close()
+            self.dstream = h5py.File(self.output_file, 'r')['data']
 
-    def prepare_output(self):
+    def prepare_output(self, squeeze=True):
 
         if self.output == 'original':
             pass
         else:
             if '2d' in self.output:
+                # variance, minimum and maximum images are shaped like dstream
+                extra = [k for k in ('variance', 'vmin', 'vmax')
+                         if getattr(self, k) is not None]
                 if self.cond_rearrange_tiles():
                     self.dstream = rearrange_tiles(
                         self.dstream, self.arrange_tiles)
-                    if self.variance is not None:
-                        self.variance = rearrange_tiles(
-                            self.variance, self.arrange_tiles)
+                    for k in extra:
+                        setattr(self, k, rearrange_tiles(
+                            getattr(self, k), self.arrange_tiles))
                 if 'sec' in self.output:
                     if self.cond_section():
                         qsec = self.qsec
                         self.dstream = self.dstream[..., qsec[0][0]:qsec[1][0]+1,
                                                     qsec[0][1]:qsec[1][1]+1]
-                        if self.variance is not None:
-                            self.variance = self.variance[..., qsec[0][0]:qsec[1][0]+1,
-                                                          qsec[0][1]:qsec[1][1]+1]
-                if self.dstream.shape[0] == 1:
+                        for k in extra:
+                            setattr(self, k, getattr(self, k)[..., qsec[0][0]:qsec[1][0]+1,
+                                                              qsec[0][1]:qsec[1][1]+1])
+                if self.dstream.shape[0] == 1 and squeeze:
                     self.dstream = np.squeeze(self.dstream)
 
     def cond_rearrange_tiles(self):
@@ -387,73 +516,91 @@ class sglimgfmt(dataset):
 
 
 class multiedf(dataset):
+    """
+    Class to read series of edf files that contain many images each. A global
+    frame index maps every frame number to its file and data offset, and
+    chunks are read from memory-mapped files.
+    """
 
     def __init__(self, masterfile, datafiles, opt, use_chunks=True):
 
         super().__init__(opt)
         self.masterfile = masterfile
-        self.get_image = edf.loadedf
         self.datafiles = datafiles
         self.use_chunks = use_chunks
-        self.procs = []
-        self.in_queue = []
-        self.out_queue = []
+        self.frame_file = None
+        self.frame_offset = None
+        self.file_dtype = None
+        self.frame_dim = None
+        self.mmaps = {}
 
     def get_shape(self):
 
-        dim = self.get_image(self.masterfile).shape
-        nf = len(self.datafiles)
-        self.shape = (nf, *dim)
+        frame_file = []
+        frame_offset = []
+        dim = None
+        for i, f in enumerate(self.datafiles):
+            if f.endswith('gz'):
+                raise ValueError('Compressed multi image edf files are not supported.')
+            offsets, fdim, fdtype = edf.indexedf(f)
+            if dim is None:
+                dim = fdim
+                self.file_dtype = fdtype
+            elif fdim != dim or fdtype != self.file_dtype:
+                raise ValueError('Images in {} differ in shape or data type.'.format(f))
+            frame_file.append(np.full(offsets.size, i, dtype=np.int32))
+            frame_offset.append(offsets)
+        self.frame_file = np.concatenate(frame_file)
+        self.frame_offset = np.concatenate(frame_offset)
+        self.frame_dim = dim
+        self.shape = (self.frame_file.size, *dim)
         return self.shape
 
-    def load_chunk(self, indx):
+    def get_mmap(self, fi):
 
-        self.chunk = np.empty((len(indx), *self.shape[1:]), self.dtype)
-        for ip in range(self.nprocs):
-            self.in_queue[ip].put(
-                self.datafiles[indx[0]+ip:indx[-1]+1:self.nprocs])
+        if fi not in self.mmaps:
+            self.mmaps[fi] = np.memmap(self.datafiles[fi], dtype=np.uint8, mode='r')
+        return self.mmaps[fi]
 
-        ip = 0
-        for i in range(len(indx)):
-            self.chunk[i] = self.out_queue[ip].get()
-            ip += 1
-            if ip == self.nprocs:
-                ip = 0
+    def get_frames(self, fi, offsets):
+        """Return a view of the frames at the given offsets of file fi. Equally
+        spaced frames are read with a single strided view.
+        """
+        mm = self.get_mmap(fi)
+        dim = self.frame_dim
+        dtype = self.file_dtype
+        strides = (dim[1]*dtype.itemsize, dtype.itemsize)
+        if offsets.size > 1:
+            stride = np.unique(np.diff(offsets))
+        else:
+            stride = [0]
+        if len(stride) == 1:
+            return np.ndarray((offsets.size, *dim), dtype, buffer=mm, offset=int(offsets[0]),
+                              strides=(int(stride[0]), *strides))
+        else:
+            return np.stack([np.ndarray(dim, dtype, buffer=mm, offset=int(o))
+                             for o in offsets])
 
-    def load_proc(self, in_queue, out_queue, qsec=None, dtype=None):
+    def load_chunk(self, indx):
 
-        while True:
-            from_queue = in_queue.get()
-            if from_queue is None:
-                break
-            for f in from_queue:
-                matr = self.get_image(f).astype(dtype)
-                if qsec is not None:
-                    matr = matr[qsec[0][0]:qsec[1]
-                                [0]+1, qsec[0][1]:qsec[1][1]+1]
-                out_queue.put(matr)
+        qsec = self.qsec
+        self.chunk = np.empty((len(indx), *self.shape[1:]), self.dtype)
+        files = self.frame_file[indx]
+        for fi in np.unique(files):
+            sel = np.where(files == fi)[0]
+            frames = self.get_frames(fi, self.frame_offset[indx[sel]])
+            if qsec is not None:
+                frames = frames[:, qsec[0][0]:qsec[1][0]+1, qsec[0][1]:qsec[1][1]+1]
+            self.chunk[sel] = frames
 
     def start_reading_data(self):
 
-        for ip in range(self.nprocs):
-            self.in_queue.append(mp.Queue(self.nprocs))
-            self.out_queue.append(mp.Queue(self.nprocs))
-            self.procs.append(mp.Process(target=self.load_proc,
-                                         args=(
-                                             self.in_queue[ip], self.out_queue[ip],),
-                                         kwargs={'qsec': self.qsec,
-                                                 'dtype': self.dtype}))
-            self.procs[ip].start()
+        return None
 
     def stop_reading_data(self):
 
-        for ip in range(self.nprocs):
-            self.in_queue[ip].put(None)
-            self.in_queue[ip].close()
-            self.in_queue[ip].join_thread()
-            self.out_queue[ip].close()
-            self.out_queue[ip].join_thread()
-            self.procs[ip].join()
+        self.mmaps = {}
+        return None
 
 
 # ----------------------
@@ -464,7 +611,9 @@ def read_data(datafiles, detector=None, last=None, first=None, step=[1, 1, 1], q
               dtype=np.float32, var_weight=False, nprocs=1, datapath="", driver='stdio',
               extlinks=False, filter_value=False, dropopt=None, dropmask=None, xdata=None,
               indxQ=None, dataQ=None, lock=False, dark=None, commonmode=True,
-              dropletize=False, mask=False, mask_value=-1, **kwargs):
+              dropletize=False, mask=False, mask_value=-1, output_file=None,
+              frame_weights=None, photonize=False, calib=None, cells=None,
+              compression=None, frame_mean=False, lut=None, **kwargs):
 
 
     # ---------------------------------------------
@@ -499,14 +648,21 @@ def read_data(datafiles, detector=None, last=None, first=None, step=[1, 1, 1], q
     options = locals()
     options['corrections'] = []
 
-    if dark is not None:
-        if verbose:
-            print('Doing dark subtraction.')
-        options['dark'] = dark.astype(dtype)
-        options['corrections'].append('dark')
+    # output 'roi' reads the q-section and gathers the pixels of the qrois
+    use_sec = 'sec' in output or output == 'roi'
+    if output == 'roi':
+        if qroi is None:
+            raise ValueError('Output roi requires qroi.')
+        qroi_abs = qroi if isinstance(qroi, QRoi) else [
+            tuple(np.asarray(x) for x in q) for q in qroi]
+    if output == 'lut' and lut is None:
+        raise ValueError('Output lut requires the sparse matrix lut.')
+    if frame_mean and (output != 'roi' or output_file is None or
+                       not output_file.endswith(('.h5', '.hdf5'))):
+        raise ValueError('frame_mean is only stored with output roi in HDF5 output files.')
 
     if isinstance(mask, np.ndarray):
-        if qsec is not None and 'sec' in output:
+        if qsec is not None and use_sec:
             mask = mask[qsec[0][0]:qsec[1][0]+1, qsec[0][1]:qsec[1][1]+1]
         # options['corrections'].append('mask')
 
@@ -515,8 +671,12 @@ def read_data(datafiles, detector=None, last=None, first=None, step=[1, 1, 1], q
             h5opt = xdata.h5opt
         except:
             h5opt = {}
-        if commonmode == 1 and 'commonmode' in h5opt:
+        if commonmode and 'commonmode' in h5opt:
             options['commonmode'] = h5opt['commonmode']
+            # commonmode=True uses the histogram mode; 'median' or 'trimmed'
+            # select the other estimators
+            options['commonmode_method'] = commonmode if isinstance(
+                commonmode, str) else 'hist'
             options['corrections'].append('commonmode')
             if verbose:
                 print('Using commonmode correction.')
@@ -534,32 +694,51 @@ def read_data(datafiles, detector=None, last=None, first=None, step=[1, 1, 1], q
             options['datapath'] = h5opt['data']
         if 'chunk_size' in h5opt:
             chunk_size = h5opt['chunk_size']
-        if 'arrange_tiles' in h5opt and '2d' in output:
+        if 'arrange_tiles' in h5opt and ('2d' in output or output in ['roi', 'lut']):
             options['arrange_tiles'] = h5opt['arrange_tiles']
             if verbose:
                 print('Rearranging tiles.')
         if 'mask' in vars(xdata.setup):
             mask = xdata.setup.mask.copy()
-            if qsec is not None and 'sec' in output:
+            if qsec is not None and use_sec:
                 mask = xdata.setup.qsec_mask
 
+    if photonize:
+        # photonize is True or a dict with adusPphoton (scalar or gain map),
+        # threshold and max_photons; it is applied after all other corrections
+        phopt = dict(photonize) if isinstance(photonize, dict) else {}
+        if 'adusPphoton' in phopt:
+            phopt['adusPphoton'] = np.asarray(phopt['adusPphoton'], dtype=np.float32)
+        options['phopt'] = phopt
+        options['corrections'].append('photonize')
+        if verbose:
+            print('Converting ADUs to photon counts.')
+
     if isinstance(mask, np.ndarray):
+        # the mask has already been cropped to the q-section
         mask = np.where(mask)
-        if qsec is not None:
-            mask = (mask[0]-qsec[0][0], mask[1]-qsec[0][1])
         options['mask'] = mask
     else:
         mask = None
+        options['mask'] = None
 
-    if qroi is not None and 'sec' in output:
-        options['qroi'] = qroi
-        for iq in range(len(qroi)):
-            options['qroi'][iq] = (qroi[iq][0]-qsec[0][0], qroi[iq][1]-qsec[0][1])
+    if qroi is not None and use_sec and qsec is not None:
+        # qrois in the coordinates of the q-section
+        secdim = (qsec[1][0]-qsec[0][0]+1, qsec[1][1]-qsec[0][1]+1)
+        options['qroi'] = section_qroi(qroi, qsec[0], secdim)
 
-    if 'sec' not in output:
+    if not use_sec:
         options['qsec'] = None
         qsec = None
 
+    # dark, gain and flatfield maps are combined once and applied first
+    pipeline = make_pipeline(dark, calib, dtype)
+    if pipeline is not None:
+        if verbose:
+            print('Applying corrections: {}.'.format(', '.join(pipeline.applied)))
+        options['calib'] = pipeline
+        options['corrections'].insert(0, 'calib')
+
     # dcls is the data class that contains all necessary functions
     # to deal with different file formats
     if detector is None and xdata is not None:
@@ -574,7 +753,7 @@ def read_data(datafiles, detector=None, last=None, first=None, step=[1, 1, 1], q
     elif case in [1, 2]:
         dcls = hdf5(masterfile, options)
     elif case in [3]:
-        dcls = multiedf
+        dcls = multiedf(masterfile, datafiles, options)
     else:
         raise ValueError('Case %d not defined.' % case)
 
@@ -587,6 +766,20 @@ def read_data(datafiles, detector=None, last=None, first=None, step=[1, 1, 1], q
 
     first, last = get_firstnlast(first, last, nf, dim)
 
+    if qsec is not None and len(dim) == 2:
+        # maps of the full detector are cropped to the q-section; maps of tiled
+        # detectors are applied to the tiles before they are arranged
+        secdim = (qsec[1][0]-qsec[0][0]+1, qsec[1][1]-qsec[0][1]+1)
+        if pipeline is not None:
+            maps = [m for m in (pipeline.offset, pipeline.scale) if m is not None]
+            if any(m.shape[-2:] != secdim for m in maps):
+                dcls.calib = pipeline.crop(qsec)
+        if photonize and dcls.phopt.get('adusPphoton') is not None:
+            gain = dcls.phopt['adusPphoton']
+            if gain.ndim >= 2 and gain.shape[-2:] != secdim:
+                dcls.phopt['adusPphoton'] = gain[..., qsec[0][0]:qsec[1][0]+1,
+                                                 qsec[0][1]:qsec[1][1]+1]
+
     if qsec is not None and len(dim) < 3:
         dim = list(dim)
         dim[-2:] = (qsec[1][0]-qsec[0][0]+1, qsec[1][1]-qsec[0][1]+1)
@@ -594,6 +787,18 @@ def read_data(datafiles, detector=None, last=None, first=None, step=[1, 1, 1], q
     imgindx = np.arange(first[0], last[0]+1, step[0])
     nimg = len(imgindx)
 
+    if output == 'roi':
+        if len(dim) > 2:
+            # tiled detectors: indices in the arranged image; the pixels are
+            # gathered from the full tiles
+            dcls.qsec = None
+            roi = QRoi.from_tuples(qroi_abs, (1800, 1800))
+            dcls.roi_tiles = np.divmod(roi.index.astype(np.intp), roi.shape[1])
+        else:
+            roi = QRoi.from_tuples(options['qroi'], dim)
+        dcls.roi_index = roi.index
+        dcls.roi_offsets = roi.offsets
+
     dcls.update_shape(nimg, dim)
 
     if verbose:
@@ -619,10 +824,16 @@ def read_data(datafiles, detector=None, last=None, first=None, step=[1, 1, 1], q
             progress(i, max([nargin, 1]))
 
             dcls.load_chunk(chunks[i])
-            dcls.process_chunk()
-            dcls.dstream[chunks[i]-first[0]] = dcls.chunk
+            dcls.process_chunk(chunks[i])
+            if output_file is None:
+                dcls.dstream[chunks[i]-first[0]] = dcls.chunk
+            else:
+                dcls.write_chunk(chunks[i]-first[0])
 
-        dcls.prepare_output()
+        if output_file is None:
+            dcls.prepare_output()
+        else:
+            dcls.close_output_file()
         progress(1, 1)
 
     elif method == 'events':
@@ -631,7 +842,7 @@ def read_data(datafiles, detector=None, last=None, first=None, step=[1, 1, 1], q
             progress(i, max([nargin, 1]))
 
             dcls.load_chunk(chunks[i])
-            dcls.process_chunk()
+            dcls.process_chunk(chunks[i])
             for qi in range(len(dcls.dstream)):
                 if i == 0:
                     dcls.dstream = dcls.chunk.copy()
@@ -655,15 +866,38 @@ def read_data(datafiles, detector=None, last=None, first=None, step=[1, 1, 1], q
             progress(i, max([nargin, 1]))
 
             dcls.load_chunk(chunks[i])
-            dcls.process_chunk()
-            if i == 0:
-                dcls.dstream = np.empty(
-                    (len(chunks), *dcls.chunk.shape[1:]), dtype=dtype)
-                dcls.variance = dcls.dstream.copy()
-            dcls.dstream[i] = dcls.chunk.mean(0)
-            dcls.variance[i] = dcls.chunk.var(0)
-
-        dcls.calc_mean(weighted=var_weight)
+            dcls.process_chunk(chunks[i])
+            if var_weight:
+                # weight the chunk averages by their inverse variance
+                if i == 0:
+                    dcls.dstream = np.empty(
+                        (len(chunks), *dcls.chunk.shape[1:]), dtype=dtype)
+                    dcls.variance = dcls.dstream.copy()
+                dcls.dstream[i] = dcls.chunk.mean(0)
+                dcls.variance[i] = dcls.chunk.var(0)
+                if i == 0:
+                    dcls.vmin = dcls.chunk.min(0)
+                    dcls.vmax = dcls.chunk.max(0)
+                else:
+                    np.minimum(dcls.vmin, dcls.chunk.min(0), out=dcls.vmin)
+                    np.maximum(dcls.vmax, dcls.chunk.max(0), out=dcls.vmax)
+            else:
+                if i == 0:
+                    dcls.stats = RunningStats()
+                    if frame_weights is not None:
+                        frame_weights = np.asarray(frame_weights)
+                weights = None
+                if frame_weights is not None:
+                    weights = frame_weights[chunks[i]-first[0]]
+                dcls.stats.update(dcls.chunk, weights)
+
+        if var_weight:
+            dcls.calc_mean(weighted=True)
+        else:
+            dcls.dstream = dcls.stats.mean
+            dcls.variance = dcls.stats.variance()
+            dcls.vmin = dcls.stats.min
+            dcls.vmax = dcls.stats.max
         dcls.prepare_output()
         progress(1, 1)
 
@@ -672,7 +906,7 @@ def read_data(datafiles, detector=None, last=None, first=None, step=[1, 1, 1], q
         while not indxQ.empty():
             indx, chunk = indxQ.get()
             dcls.load_chunk(chunk)
-            dcls.process_chunk()
+            dcls.process_chunk(chunk)
             dcls.dstream = dcls.chunk
             dcls.prepare_output()
             dataQ.put((indx, dcls.dstream))
@@ -683,6 +917,7 @@ def read_data(datafiles, detector=None, last=None, first=None, step=[1, 1, 1], q
     if method == 'queue_chunk':
         return None
     elif method == 'average':
-        return dcls.dstream, dcls.variance/np.sqrt(nimg)
+        return {'mean': dcls.dstream, 'variance': dcls.variance, 'min': dcls.vmin,
+                'max': dcls.vmax, 'count': nimg}
     else:
         return dcls.dstream
@@ -0,0 +1,87 @@
+import os
+import hashlib
+import h5py
+import numpy as np
+from .Corrections import CorrectionPipeline
+from ..misc.qroi import QRoi
+
+
+def _update_hash(h, obj):
+    """Feed arrays, containers and other objects to a hash.
+    """
+    if isinstance(obj, CorrectionPipeline):
+        _update_hash(h, (obj.offset, obj.scale))
+        if obj.per_cell is not None:
+            _update_hash(h, obj.per_cell)
+    elif isinstance(obj, QRoi):
+        _update_hash(h, (obj.shape, obj.index, obj.offsets))
+    elif isinstance(obj, np.ndarray):
+        h.update(str((obj.shape, obj.dtype.str)).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        for key in sorted(obj, key=str):
+            h.update(str(key).encode())
+            _update_hash(h, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'(')
+        for item in obj:
+            _update_hash(h, item)
+        h.update(b')')
+    elif callable(obj):
+        h.update(getattr(obj, '__name__', repr(obj)).encode())
+    else:
+        h.update(repr(obj).encode())
+
+
+def roi_cache_key(*items):
+    """Hash of the series, qrois, mask and corrections defining a ROI cache.
+    """
+    h = hashlib.sha1()
+    for item in items:
+        _update_hash(h, item)
+    return h.hexdigest()[:16]
+
+
+def roi_cache_file(savdir, series, key):
+    return os.path.join(os.path.abspath(savdir), 'roicache_s{}_{}.h5'.format(series, key))
+
+
+def write_roi_cache(get_series, sid, filename, key, read_opt):
+    """Read a series with output='roi' and write the ROI pixel stream and the
+    mean intensity of the masked section per frame to a compressed HDF5 file.
+
+    Args:
+        get_series (callable): data reader, e.g., Xdata.get_series.
+        sid (int): series index.
+        filename (str): name of the cache file.
+        key (str): cache key stored as attribute.
+        read_opt (dict): options for the data reader; must contain qroi.
+    """
+    tmpfile = os.path.splitext(filename)[0] + '_tmp.h5'
+    opt = dict(read_opt, method='full', output='roi', output_file=tmpfile,
+               compression='gzip', frame_mean=True)
+    dset = get_series(sid, **opt)
+    dset.file.close()
+    with h5py.File(tmpfile, 'a') as f:
+        f.attrs['key'] = key
+        f.attrs['first'] = read_opt['first']
+        qroi = read_opt['qroi']
+        f.attrs['roi_offsets'] = qroi.offsets if isinstance(qroi, QRoi) else np.cumsum(
+            [0] + [len(q[0]) for q in qroi])
+    os.replace(tmpfile, filename)
+
+
+def read_roi_cache(filename, first=0, last=None):
+    """Load the frames first to last (including) from a ROI cache.
+
+    Returns:
+        tuple: ROI pixel stream (nframes, number of ROI pixels) and mean
+            intensity of the masked section per frame (None if not stored).
+    """
+    with h5py.File(filename, 'r') as f:
+        last = f['data'].shape[0] - 1 if last is None else last
+        data = f['data'][first:last+1]
+        frame_mean = None
+        if 'frame_mean' in f:
+            frame_mean = f['frame_mean'][first:last+1]
+    return data, frame_mean
@@ -124,8 +124,27 @@ class Xdata(Xfmt):
             **kwargs: arguments passed to the data loader.
 
         Returns:
-            np.ndarray: if method is :code:`full` or tuple of average images and variance
-            if method is :code:`average`.
+            np.ndarray: if method is :code:`full` or dict with the average image
+            (:code:`mean`), pixel :code:`variance`, :code:`min`, :code:`max` and the
+            number of images (:code:`count`) if method is :code:`average`. If
+            :code:`output_file` is passed with method :code:`full`, the images are written
+            chunk by chunk to a memory-mapped array (:code:`.npy` or raw file) or to an
+            HDF5 dataset (:code:`.h5`). The HDF5 file is closed when all images are
+            written and the dataset is returned from the file opened read-only.
+            The average and variance are accumulated frame by frame in float64; use
+            :code:`frame_weights` (one weight per image) for a weighted average.
+            With :code:`photonize` (True or dict with :code:`adusPphoton`, :code:`threshold`
+            and :code:`max_photons`) the images are converted to integer photon counts.
+            :code:`dark` and :code:`calib` (dict with :code:`dark`, :code:`gain` and
+            :code:`flatfield` maps, 2D or per memory cell, or a CorrectionPipeline) are
+            applied in place; :code:`cells` gives the memory cell of each image.
+            :code:`output='roi'` returns only the pixels of :code:`qroi` as array
+            (nframes, number of ROI pixels) with the ROIs one after another.
+            HDF5 output files can be compressed (:code:`compression`) and, with
+            :code:`frame_mean` and :code:`output='roi'`, store the mean of the masked
+            section of each frame.
+            :code:`output='lut'` reduces every image with the sparse matrix :code:`lut`,
+            e.g., for the azimuthal integration of each frame.
         """
         if 'subset' in self.meta:
             nf = self.meta.loc[series_id, 'nframes']
@@ -1,6 +1,6 @@
 from .ReadData import read_data
 from .getmeta import get_attrs_from_dict, get_attrs_h5, get_header_h5
-from .H5Methods import common_mode_from_hist
+from .H5Methods import common_mode
 import warnings
 
 class Xfmt:
@@ -187,7 +187,7 @@ class Xfmt:
                       'CsPad::ElementV2/XcsEndstation.0:Cspad.0/data',
                       'ExternalLinks': False,
                       'chunk_size': 256,
-                      'commonmode': common_mode_from_hist,
+                      'commonmode': common_mode,
                       'arrange_tiles': arrange_cspad_tiles,
                       'dropletize': dropletizedata
                       },
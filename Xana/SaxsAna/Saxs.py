@@ -1,4 +1,4 @@
-from .pysaxs3 import pysaxs
+from .pysaxs3 import pysaxs, pysaxs_tr, pycake
 from .defineqrois import defineqrois
 from .find_center import find_center
 
@@ -12,6 +12,12 @@ class Saxs:
     def pysaxs(*args, **kwargs):
         return pysaxs(*args, **kwargs)
 
+    def pysaxs_tr(*args, **kwargs):
+        return pysaxs_tr(*args, **kwargs)
+
+    def pycake(*args, **kwargs):
+        return pycake(*args, **kwargs)
+
     def defineqrois(*args, **kwargs):
         defineqrois(*args, **kwargs)
 
@@ -1,5 +1,7 @@
 import numpy as np
+import warnings
 from ..Xplot.plotqrois import plotqrois
+from ..misc.qroi import QRoi
 
 def check_dimension(setup, img):
     s = np.shape(img)
@@ -9,46 +11,106 @@ def check_dimension(setup, img):
     else:
         return None
 
-def getqroi(saxs, setup, qr, phir=None, mirror=False):
+def bin_index(x, lower, width, period=None):
+    """Index of the bin [lower, lower+width] that contains x or -1.
+
+    Bins are assumed not to overlap. If they do, values are assigned to the
+    bin with the largest lower edge below them. For a period, e.g., of angles,
+    x and the lower edges are taken modulo the period.
+    """
+    lower = np.asarray(lower, dtype=float)
+    width = np.asarray(width, dtype=float)
+    if period is not None:
+        x = x % period
+        lower = lower % period
+    order = np.argsort(lower, kind='stable')
+    lower = lower[order]
+    j = np.searchsorted(lower, x, side='right') - 1
+    d = x - lower[j]
+    if period is not None:
+        # values before the first lower edge belong to the last bin
+        d %= period
+    inside = (d <= width[order][j])
+    if period is None:
+        inside &= (j >= 0)
+    return np.where(inside, order[j], -1)
+
+
+def bins_overlap(lower, width, period=None):
+    """Whether any of the bins [lower, lower+width] overlap (modulo period).
+    """
+    lower = np.asarray(lower, dtype=float)
+    width = np.asarray(width, dtype=float)
+    if period is not None:
+        lower = lower % period
+    order = np.argsort(lower, kind='stable')
+    lower, width = lower[order], width[order]
+    upper = lower + width
+    tol = 1e-6 * width
+    if np.any(upper[:-1] - lower[1:] > tol[:-1]):
+        return True
+    return period is not None and upper[-1] - period - lower[0] > tol[-1]
+
 
-    q = setup.ai.array_from_unit(unit='q_nm^-1')
-    radius = setup.ai.array_from_unit(unit='r_m')/75e-6
-    phi = setup.ai.chiArray()
+def getqroi(saxs, setup, qr, phir=None, mirror=False):
+    """Define q-ROIs from q rings (qr: q, dq) and sectors (phir: start, width
+    in degree) in one pass over the detector.
+
+    Pixels in overlapping sectors belong to every sector that contains them;
+    the sectors are then evaluated one after another. Overlapping q rings are
+    not supported: their shared pixels are assigned to the ring with larger q
+    and a warning is issued.
+
+    Returns:
+        tuple: QRoi with the ROIs ordered by q and then by phi, array of
+            (outer radius, width) in pixels and index (q index * number of
+            sectors + phi index) of each ROI. Empty ROIs are skipped.
+    """
+    geom = setup.geometry()
+    q = geom['q']
+    radius = geom['r']/75e-6
+    phi = geom['chi']
 
     qv = qr[:,0]
     dqv = qr[:,1]
 
     if phir is None:
-        phiv = [0.]
-        dphi = [360.]
+        phiv = np.array([0.])
+        dphi = np.array([360.])
     else:
         phiv = phir[:,0]
         dphi = phir[:,1]
 
     phiv = phiv*np.pi/180
     dphi = dphi*np.pi/180
+    nphi = len(phiv)
+
+    if bins_overlap(qv - dqv/2, dqv):
+        warnings.warn('Q-ROIs overlap. Pixels are assigned to the ring with larger q.')
+
+    # label of each pixel: q index * number of sectors + phi index
+    period = np.pi if mirror else 2*np.pi
+    iq = bin_index(q, qv - dqv/2, dqv).ravel()
+    pix = np.flatnonzero((iq >= 0) & setup.mask.astype(bool).ravel())
+    if bins_overlap(phiv, dphi, period):
+        phi_pix = phi.ravel()[pix] % period
+        inside = [(phi_pix - phiv[j]) % period <= dphi[j] for j in range(nphi)]
+        label = np.concatenate([iq[pix][x] * nphi + j for j, x in enumerate(inside)])
+        pix = np.concatenate([pix[x] for x in inside])
+    else:
+        iphi = bin_index(phi.ravel()[pix], phiv, dphi, period=period)
+        pix = pix[iphi >= 0]
+        label = iq[pix] * nphi + iphi[iphi >= 0]
+
+    order = np.argsort(label, kind='stable')
+    counts = np.bincount(label, minlength=len(qv)*nphi)
+    roi_id = np.flatnonzero(counts)
+    ind = QRoi(pix[order], np.cumsum(np.append(0, counts[roi_id])), q.shape)
 
-    ind = []
-    r = []
-    ph = []
-
-    for i in range(len(qv)):
-        for j in range(len(phiv)):
-            tmp_q = (q>=(qv[i]-dqv[i]/2)) & (q<=(qv[i]+dqv[i]/2)) & setup.mask
-            phit = phi.copy()
-            phit = (phit - phiv[j]) % (2*np.pi)
-            if mirror:
-                tmp_phi = (phit <= dphi[j]) | (((phit - np.pi) % (2*np.pi)) <= dphi[j])
-            else:
-                tmp_phi = (phit<=(dphi[j]))
-            tmp = np.where(tmp_q & tmp_phi)
-            del phit
-            if len(tmp[0]):
-                ind.append(tmp)
-                r_min = radius[tmp].min()
-                r_max = radius[tmp].max()
-                r.append((r_max, r_max - r_min))
-    return ind, r
+    r = radius.ravel()[ind.index]
+    r_min = np.minimum.reduceat(r, ind.offsets[:-1]) if r.size else r
+    r_max = np.maximum.reduceat(r, ind.offsets[:-1]) if r.size else r
+    return ind, np.stack((r_max, r_max - r_min), axis=-1), roi_id
 
 def flatten_init(inp):
 
@@ -92,22 +154,19 @@ def defineqrois(setup, Isaxs, qv_init=None, phiv_init=[(0,360)],
 
     phiv_init[:,0] -= phiv_init[:,1]/2
 
-    qroi, radii = getqroi(Isaxs, setup, qv_init,
-                          phir=phiv_init, mirror=mirror)
+    qroi, radii, roi_id = getqroi(Isaxs, setup, qv_init,
+                                  phir=phiv_init, mirror=mirror)
 
     setup.dqv = qv_init[:,1]
     setup.phiv = phiv_init
-    setup.qv = np.tile(qv_init[:,0],setup.phiv.shape[0])
     setup.radii = radii
 
-    setup.gproi = np.array([len(x[0]) for x in qroi], dtype=int)
     setup.qroi = qroi
-    setup.qv = setup.qv[:len(setup.qroi)]
+    setup.gproi = setup.qroi.sizes.astype(int)
+    # q-value of each ROI; ROIs are ordered by q and then by phi
+    setup.qv = qv_init[roi_id // setup.phiv.shape[0], 0]
 
-    xmin = min([x[0].min() for x in setup.qroi])
-    ymin = min([x[1].min() for x in setup.qroi])
-    xmax = max([x[0].max() for x in setup.qroi])
-    ymax = max([x[1].max() for x in setup.qroi])
+    (xmin, ymin), (xmax, ymax) = setup.qroi.bbox()
 
     qsec = ((xmin, ymin), (xmax, ymax))
     qsec_dim = (xmax - xmin + 1, ymax - ymin + 1)
@@ -115,7 +174,7 @@ def defineqrois(setup, Isaxs, qv_init=None, phiv_init=[(0,360)],
     setup.qsec_dim = qsec_dim
     setup.qsec_mask = setup.mask[qsec[0][0]:qsec_dim[0]+qsec[0][0], qsec[0][1]:qsec_dim[1]+qsec[0][1]]
     setup.qsec_center = (setup.center[0]-qsec[0][1], setup.center[1]-qsec[0][0])
-    setup.qsec_ai = setup.update_ai(setup.qsec_center)
+    setup.qsec_ai = None # created for the new q-section when needed
 
     print('Added the following Q-values [nm-1]:\n{}'.format(setup.qv))
 
@@ -1,41 +1,105 @@
 import numpy as np
-import numpy as np
-from matplotlib import pyplot as plt
-from scipy import fftpack as fp
 
-def cross_correlation(q):
-    ind = np.argmin(np.abs(q-0.6))
-    inten = I2d[:,ind]
-    print('Found %d angles' % len(inten))
-    phi = chi.copy()
 
-    N = len(inten)
-    lags = np.arange(-N+1, N)
+class Cake:
+    """Integration of images in (q, phi) bins.
+
+    The bin label of every pixel is computed once from the cached geometry of
+    the setup. Chunks of images are reduced by a single bincount over the
+    flattened (frame, bin) index.
+
+    Args:
+        setup (Setup): setup with geometry and mask.
+        nq (int, optional): number of q-bins. Defaults to 100.
+        nphi (int, optional): number of azimuthal bins. Defaults to 72.
+        qrange (tuple, optional): q-range in nm^-1. Defaults to the range of the
+            unmasked pixels.
+        section (bool, optional): use the q-section instead of the full detector.
+    """
+
+    def __init__(self, setup, nq=100, nphi=72, qrange=None, section=False):
+        geom = setup.geometry(section)
+        mask = setup.qsec_mask if section else setup.mask
+        q = geom['q']
+        valid = np.ones(q.shape, dtype=bool) if mask is None else mask.astype(bool)
+        if qrange is None:
+            qrange = (q[valid].min(), q[valid].max())
+
+        qedges = np.linspace(qrange[0], qrange[1], nq+1)
+        iq = np.searchsorted(qedges, q, side='right') - 1
+        iq[q == qrange[1]] = nq - 1
+        iphi = np.floor((geom['chi'] + np.pi) / (2*np.pi) * nphi).astype(np.int64) % nphi
+        valid &= (iq >= 0) & (iq < nq)
+
+        self.nq = nq
+        self.nphi = nphi
+        self.q = (qedges[1:] + qedges[:-1]) / 2 #: np.ndarray: q-values in nm^-1.
+        self.phi = (np.arange(nphi) + .5) * 360 / nphi - 180 #: np.ndarray: phi in degree.
+        self.label = np.where(valid, iq * nphi + iphi, -1).astype(np.int32)
+        self.pixels = np.flatnonzero(valid)
+        self.shape = (nq * nphi, q.size)
+        self.norm = np.bincount(self.label.ravel()[self.pixels],
+                                geom['solid_angle'].ravel()[self.pixels],
+                                minlength=nq*nphi)
+        # limit the size of the (frame, bin) index of one bincount
+        self.batch = max(1, int(2**24 // max(self.pixels.size, 1)))
+
+    def __call__(self, arr):
+        """Intensities of a chunk (nframes, ...) as array (nframes, nq*nphi);
+        empty bins are NaN.
+        """
+        flat = arr.reshape(arr.shape[0], -1)
+        nf = flat.shape[0]
+        nb = self.shape[0]
+        lab = self.label.ravel()[self.pixels]
+        sums = np.empty((nf, nb))
+        for i in range(0, nf, self.batch):
+            sub = flat[i:i+self.batch, self.pixels]
+            index = (np.arange(sub.shape[0])[:, None] * nb + lab).ravel()
+            sums[i:i+self.batch] = np.bincount(index, sub.ravel(),
+                                               minlength=sub.shape[0]*nb).reshape(-1, nb)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.norm > 0, sums / self.norm, np.nan)
+
+    def integrate(self, arr):
+        """Cake (nframes, nq, nphi) of a chunk of images."""
+        return self(arr).reshape(-1, self.nq, self.nphi)
+
+
+def angular_correlation(cake):
+    """Angular autocorrelation along phi computed by FFT.
 
-    inten = inten - inten.mean()
+    C(q, dphi) = <I(phi) I(phi+dphi)>_phi / <I>_phi^2 - 1 with empty (NaN)
+    bins excluded from the averages.
 
-    acf = np.correlate(inten, inten, mode='full')
-    acf /= (N * inten.std()**2)
+    Args:
+        cake (np.ndarray): intensities (..., nq, nphi).
 
-    l = len(acf)
-    x = np.linspace(-4*np.pi,4*np.pi,l)
-    print( N, 'Mean Intensity is: ' + str(mean_int_2))
-    figure()
-    plt.plot(lags,acf,'-')
-    plt.grid()
+    Returns:
+        np.ndarray: C of the same shape; dphi = k * 360 / nphi degree.
+    """
+    nphi = cake.shape[-1]
+    w = np.isfinite(cake).astype(float)
+    mean = np.nansum(cake, -1) / np.maximum(w.sum(-1), 1)
+    x = np.where(w > 0, cake - mean[..., None], 0)
+    num = np.fft.irfft(np.abs(np.fft.rfft(x, axis=-1))**2, n=nphi, axis=-1)
+    den = np.fft.irfft(np.abs(np.fft.rfft(w, axis=-1))**2, n=nphi, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(den > .5, num / den, np.nan) / mean[..., None]**2
 
-    fourier = fp.fft(acf)
-    xf = fp.fftfreq(l,d=1/(2*360))
-    xf = fp.fftshift(xf)
-    fourier = fp.fftshift(fourier)
-    fourier = 1./l * np.absolute(fourier)
-    # fourier = fourier[1:]
-    # xf = xf[:l//2]
 
-    plt.figure()
-    plt.plot(xf,fourier)
-    plt.grid()
-    # # plt.savefig(savdir + 'phi_corr_long_fourier.png', format='png',dpi=400)
+def anisotropy(cake, order=2):
+    """Amplitude of the angular Fourier component of given order relative to
+    the mean intensity, e.g., order=2 for the anisotropy of sheared samples.
 
+    Args:
+        cake (np.ndarray): intensities (..., nq, nphi).
 
-    # plt.show()
+    Returns:
+        np.ndarray: anisotropy (..., nq).
+    """
+    mean = np.nanmean(cake, -1)
+    filled = np.where(np.isfinite(cake), cake, mean[..., None])
+    f = np.fft.rfft(filled, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 2 * np.abs(f[..., order]) / np.abs(f[..., 0])
@@ -1,24 +1,49 @@
 import numpy as np
 import copy
+from scipy import sparse
+from .phicorr import Cake, angular_correlation, anisotropy
+from ..Geometry import get_lut
 
 
-def get_soq(Isaxs, setup, Vsaxs=None, nbins=1000):
+def get_soq(Isaxs, setup, Vsaxs=None, nbins=1000, method='pyfai'):
+    """Azimuthally integrate an average image of the detector or the q-section.
 
+    With method 'pyfai', the image is integrated by pyFAI. With 'lut', the
+    cached lookup table of the setup is used, which is faster for repeated
+    integrations but does not split pixels and uses the q-range of the
+    unmasked pixels; its q-bins and errors are therefore not the same as
+    pyFAI's.
+    """
 
     sI = np.shape(Isaxs)
     if sI == setup.detector.dim:
-        ai = setup.ai
+        section = False
         mask = setup.mask
     elif sI == setup.qsec_dim:
-        ai = setup.qsec_ai
+        section = True
         mask = setup.qsec_mask
     else:
         raise ValueError(f'Average image of shape {sI} does not match defined Azimuthal Integrators.')
 
     if mask is None:
-        mask = np.ones_like(sI)
+        mask = np.ones(sI, dtype=bool)
         print('No mask defined.')
 
+    if method == 'lut':
+        if section:
+            lut = get_lut(setup, nbins, mask, setup.qsec)
+        else:
+            lut = get_lut(setup, nbins, mask)
+        norm = lut['norm']
+        nz = norm > 0
+        ii = np.zeros(nbins)
+        e = np.zeros(nbins)
+        ii[nz] = (lut['csr'] @ np.ravel(Isaxs))[nz] / norm[nz]
+        var = np.ravel(Isaxs if Vsaxs is None else Vsaxs)
+        e[nz] = np.sqrt(np.abs(lut['csr'] @ var)[nz]) / norm[nz]
+        return lut['q'], ii, e
+
+    ai = setup.qsec_ai if section else setup.ai
     if Vsaxs is None:
         q, ii, e = ai.integrate1d(Isaxs, nbins, mask=~(mask.astype(bool)),
                                   unit='q_nm^-1', error_model='poisson')
@@ -35,7 +60,9 @@ def pysaxs(data, load=False, calc_soq=True, **kwargs):
     elif isinstance(data, dict):
         sid = data['sid']
         setup = data['setup']
-        Isaxs, Vsaxs = data['get_series'](sid, method='average', **kwargs)
+        avg = data['get_series'](sid, method='average', **kwargs)
+        Isaxs = avg['mean']
+        Vsaxs = avg['variance'] / np.sqrt(avg['count'])
         saxsd = {'Isaxs':Isaxs, 'Vsaxs':Vsaxs}
     else:
         raise ValueError('Could not handle input type during SAXS analysis.')
@@ -46,3 +73,68 @@ def pysaxs(data, load=False, calc_soq=True, **kwargs):
     saxsd['soq'] = soq
 
     return saxsd
+
+
+def saxs_matrix(setup, nbins=1000, section=False):
+    """Sparse matrix (nbins, number of pixels) of the azimuthal integration.
+
+    The product with a flattened image is the intensity in each q-bin, i.e.,
+    the sum of the unmasked pixels divided by the sum of their solid angles.
+
+    Returns:
+        tuple: q-values of the bins and the scipy.sparse.csr_matrix.
+    """
+    lut = setup.lut(nbins, section)
+    norm = lut['norm']
+    scale = np.zeros(nbins)
+    scale[norm > 0] = 1. / norm[norm > 0]
+    return lut['q'], sparse.csr_matrix(sparse.diags(scale) @ lut['csr'])
+
+
+def pysaxs_tr(data, nbins=1000, tbin=1, **kwargs):
+    """Time-resolved SAXS: the azimuthal intensity of every image.
+
+    The images are integrated chunk by chunk while they are read.
+
+    Args:
+        nbins (int, optional): number of q-bins. Defaults to 1000.
+        tbin (int, optional): average the intensities of tbin consecutive
+            images. An incomplete last time bin is dropped. Defaults to 1.
+    """
+    sid = data['sid']
+    setup = data['setup']
+    q, lut = saxs_matrix(setup, nbins)
+    soqt = data['get_series'](sid, method='full', lut=lut, **kwargs)
+
+    tbin = int(tbin)
+    if tbin > 1:
+        nt = soqt.shape[0] // tbin
+        soqt = soqt[:nt*tbin].reshape(nt, tbin, -1).mean(1)
+    t = (np.arange(soqt.shape[0]) * tbin + (tbin - 1) / 2) * data.get('dt', 1.)
+
+    return {'soqt': soqt, 'q': q, 't': t, 'tbin': tbin}
+
+
+def pycake(data, nq=100, nphi=72, qrange=None, tbin=1, order=2, **kwargs):
+    """Time-resolved (q, phi) integration and angular correlations.
+
+    The images are integrated chunk by chunk while they are read. For every
+    (time-binned) image the result contains the cake I(q, phi), its angular
+    autocorrelation along phi and the anisotropy (relative amplitude of the
+    angular Fourier component of the given order).
+    """
+    sid = data['sid']
+    setup = data['setup']
+    cake = Cake(setup, nq, nphi, qrange)
+    I = data['get_series'](sid, method='full', lut=cake, **kwargs)
+    I = I.reshape(-1, nq, nphi)
+
+    tbin = int(tbin)
+    if tbin > 1:
+        nt = I.shape[0] // tbin
+        I = I[:nt*tbin].reshape(nt, tbin, nq, nphi).mean(1)
+    t = (np.arange(I.shape[0]) * tbin + (tbin - 1) / 2) * data.get('dt', 1.)
+
+    return {'cake': I, 'q': cake.q, 'phi': cake.phi, 't': t, 'tbin': tbin,
+            'phicorr': angular_correlation(I), 'anisotropy': anisotropy(I, order)}
+
@@ -1,5 +1,6 @@
 from . import detectors
 from pyFAI.azimuthalIntegrator import AzimuthalIntegrator
+from .Geometry import get_geometry, get_lut
 import os
 import numpy as np
 
@@ -12,6 +13,10 @@ class Setup:
             to :code:`'eiger500k'`.
         maskfile (str, optional): Mask to load in :code:`.npy` format. Defaults
             to None.
+
+    The azimuthal integrators are created when they are first used. Geometry
+    arrays and integration lookup tables are cached in :code:`cachedir`
+    (default :code:`~/.cache/xana`).
     """
 
     def __init__(self, detector='eiger500k', maskfile=None):
@@ -35,6 +40,7 @@ class Setup:
         self.qv = None
         self.phiv = None
         self.radii = None
+        self.cachedir = None #: str: directory of the geometry cache.
 
     @property
     def detector(self):
@@ -48,10 +54,31 @@ class Setup:
         else:
             self.__detector = detectors.grab(name)
 
+    @property
+    def ai(self):
+        if self._ai is None and all(x is not None for x in
+                                    (self.center, self.distance, self.wavelength)):
+            self._ai = self._update_ai()
+        return self._ai
+
+    @ai.setter
+    def ai(self, ai):
+        self._ai = ai
+
+    @property
+    def qsec_ai(self):
+        if self._qsec_ai is None and self.qsec is not None and self.center is not None:
+            self._qsec_ai = self._update_ai(self.qsec_center)
+        return self._qsec_ai
+
+    @qsec_ai.setter
+    def qsec_ai(self, ai):
+        self._qsec_ai = ai
+
     def __getstate__(self):
         d = dict(vars(self))
         d['detector'] = self.detector.aliases[0].lower()
-        del d['ai'], d['qsec_ai'], d['_Setup__detector']
+        del d['_ai'], d['_qsec_ai'], d['_Setup__detector']
         return d
 
     def __setstate__(self, d):
@@ -61,12 +88,11 @@ class Setup:
             d['center'] = d['ctr']
 
         self.detector = d.pop('detector', None)
+        d.setdefault('cachedir', None)
         self.__dict__.update(d)
-        self.ai = self._update_ai()
-        if d['qsec'] is not None:
-            self.qsec_ai = self._update_ai(self.qsec_center)
-        else:
-            self.qsec_ai = None
+        # the azimuthal integrators are created when needed
+        self.ai = None
+        self.qsec_ai = None
 
     def make(self, **kwargs):
         keys = ['center', 'distance', 'wavelength', ]
@@ -100,6 +126,20 @@ class Setup:
         ai.wavelength = self.wavelength * 1e-10
         return ai
 
+    def geometry(self, section=False):
+        """Cached q (nm^-1), chi (rad), r (m) and solid angle arrays of the
+        detector or of the q-section.
+        """
+        return get_geometry(self, self.qsec if section else None)
+
+    def lut(self, nbins=1000, section=False):
+        """Cached lookup table of the azimuthal integration of the masked
+        detector or q-section.
+        """
+        if section:
+            return get_lut(self, nbins, self.qsec_mask, self.qsec)
+        return get_lut(self, nbins, self.mask)
+
     def load_mask(self):
         if isinstance(self.maskfile, str):
             self.maskfile = os.path.abspath(self.maskfile)
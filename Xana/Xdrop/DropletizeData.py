@@ -1,45 +1,108 @@
 import numpy as np
 import numpy.ma as ma
-from Xdrop.dropletizem import dropimgood_sel
+from scipy import ndimage
 import time
 import pickle
 import re
 from matplotlib import pyplot as plt
 
 
-def dropletizedata(data, pars, mask=None, dark=None, savdir='./', savname=None):
-    #print(dropimgood_sel.__doc__)
+def dropletize(data, pars, mask=None, dark=None, output='image'):
+    """Dropletize a stack of images at once.
+
+    Pixels above pars['background'] are labeled as droplets (connected within
+    each frame). The number of photons of a droplet is its ADU sum divided by
+    pars['adusPphoton'] rounded to the next integer. Droplets with an ADU sum
+    outside [lower_threshold, upper_threshold] or with more than pixelPdroplet
+    pixels are discarded. The photons are assigned to the pixels of a droplet
+    by the integer part of their ADUs/adusPphoton and the remaining photons to
+    the pixels with the largest remainders. number_photons is the maximum number
+    of photons per pixel.
+
+    Args:
+        data (np.ndarray): images with shape (..., ny, nx), e.g., a stack of
+            CSPAD tiles (nframes, 32, 185, 388).
+        pars (dict): dropletizing parameters.
+        mask (np.ndarray, optional): boolean mask of valid pixels with the shape
+            of an image, e.g., (ny, nx) or the tiles of one frame.
+        dark (np.ndarray, optional): dark image subtracted before dropletizing;
+            same shape as the mask.
+        output (str): 'image' returns uint16 photon images with the shape of data;
+            'list' returns a list with a tuple (flat pixel indices, photons) per frame.
+    """
     dim = data.shape
     mshape = dim[-2:]
-    data = data.reshape(-1,*mshape)
-    datdrop = np.zeros(data.shape, dtype=np.uint16)
-
-    if dark is None:
-        dark = np.zeros(mshape)
-
-    if mask is None:
-        mask = np.ones(mshape, dtype=np.bool)
-
-    pix  = []
-    for imgn in range(data.shape[0]):
-        img = data[imgn].astype(int)
-        imd = dropimgood_sel(img, dark, ~mask,
-                             pars['background'],
-                             pars['lower_threshold'],
-                             pars['upper_threshold'],
-                             pars['number_photons'],
-                             pars['adusPphoton'],
-                             pars['pixelPdroplet'])
-
-        datdrop[imgn] = imd[-1]
-#        pix.append(imd[:-1])
+    npix_frame = mshape[0] * mshape[1]
+    img = data.astype(np.float32)
+
+    # dark and mask broadcast against the data before the images are stacked
+    if dark is not None:
+        img -= dark
+
+    adupph = pars['adusPphoton']
+    hit = img > pars.get('background', 0)
+    if mask is not None:
+        hit &= mask.astype(bool)
+    img = img.reshape(-1, *mshape)
+    hit = hit.reshape(-1, *mshape)
+    nimg = img.shape[0]
+
+    # connect pixels within frames only
+    structure = np.zeros((3, 3, 3), dtype=bool)
+    structure[1] = ndimage.generate_binary_structure(2, 1)
+    labels, ndrop = ndimage.label(hit, structure=structure)
+
+    pos = np.flatnonzero(labels)
+    lab = labels.ravel()[pos] - 1
+    adus = img.ravel()[pos]
+    del labels, hit
+
+    npix = np.bincount(lab, minlength=ndrop)
+    dropsum = np.bincount(lab, weights=adus, minlength=ndrop)
+    nphot = np.floor(dropsum/adupph + .5).astype(np.int64)
+    valid = ((dropsum >= pars.get('lower_threshold', -np.inf))
+             & (dropsum <= pars.get('upper_threshold', np.inf))
+             & (npix <= pars.get('pixelPdroplet', np.inf)))
+    nphot[~valid] = 0
+
+    # integer part per pixel, remaining photons by the largest remainder
+    phot = np.floor(adus/adupph).astype(np.int64)
+    phot[~valid[lab]] = 0
+    remain = nphot - np.bincount(lab, weights=phot, minlength=ndrop).astype(np.int64)
+    order = np.lexsort((phot*adupph - adus, lab))
+    start = np.concatenate(([0], np.cumsum(npix)[:-1]))
+    rank = np.arange(lab.size) - start[lab[order]]
+    phot[order[rank < remain[lab[order]]]] += 1
+
+    if 'number_photons' in pars:
+        np.minimum(phot, pars['number_photons'], out=phot)
+
+    if output == 'image':
+        datdrop = np.zeros(nimg*npix_frame, dtype=np.uint16)
+        datdrop[pos] = np.minimum(phot, np.iinfo(np.uint16).max)
+        return datdrop.reshape(dim)
+    elif output == 'list':
+        keep = phot > 0
+        pos = pos[keep]
+        phot = phot[keep]
+        split = np.searchsorted(pos, np.arange(1, nimg)*npix_frame)
+        return [(p - i*npix_frame, c) for i, (p, c) in
+                enumerate(zip(np.split(pos, split), np.split(phot, split)))]
+    else:
+        raise ValueError('Output {} not understood.'.format(output))
+
+
+def dropletizedata(data, pars, mask=None, dark=None, savdir='./', savname=None,
+                   output='image'):
+    datdrop = dropletize(data, pars, mask=mask, dark=dark, output=output)
     if savname is not None:
-        np.save(savdir + savname + '_dropletized.npy', datdrop)
-        f = open(savdir + savname + '_pix.pkl', 'wb')
-        pickle.dump({'pix':pix},f)
-        f.close()
+        if output == 'image':
+            np.save(savdir + savname + '_dropletized.npy', datdrop)
+        else:
+            f = open(savdir + savname + '_pix.pkl', 'wb')
+            pickle.dump({'pix':datdrop},f)
+            f.close()
 
-    datdrop = np.squeeze(datdrop.reshape(dim))
     return datdrop
 
 def testDropletizing(data, pars, dark=None, mask=None):
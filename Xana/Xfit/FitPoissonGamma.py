@@ -1,14 +1,16 @@
 #! /usr/bin/env python
 import numpy as np
 import lmfit
-from .PoissonGammaDistribution import PoissonGamma as poisgam
+from scipy.special import digamma
+from .PoissonGammaDistribution import PoissonGamma as poisgam, log_PoissonGamma
 from ..Xplot.PlotPoissonGamma import plot_poissongamma
 
 
 def fit_pg(prob, err=None, ind_var='kb', krange=None, init={}, fix=None, logscale=False, qv=None,
             modes=1, pbthres=0, vary_par=False, method='leastsq', doplot=False):
     """ Fit the Poisson-Gamma distribution
-    by minimizing the residuals"""
+    by minimizing the residuals. With method='batch' the fit is done by
+    fit_pg_batch without lmfit; out and the fit report are then None."""
 
     if krange is None:
         krange = np.arange(prob.shape[0]-2)
@@ -25,6 +27,14 @@ def fit_pg(prob, err=None, ind_var='kb', krange=None, init={}, fix=None, logscal
         x = kv
         p = kb
         pn = 'kb'
+
+    if method == 'batch':
+        pars_arr, gof = fit_pg_batch([np.vstack((np.zeros_like(kb), kb, prob))],
+                                     err=None if err is None else [err],
+                                     init=init, fix=fix, logscale=logscale)
+        if doplot:
+            plot_poissongamma(x, prob, p, pars_arr[0], ind_var=ind_var)
+        return pars_arr[0], gof[0], None, None
         
     #make initial guess for parameters
     for vn in ['M', 'kb']:
@@ -86,3 +96,113 @@ def fit_pg(prob, err=None, ind_var='kb', krange=None, init={}, fix=None, logscal
 
     return pars_arr, gof, out, lmfit.fit_report(out)
 
+
+
+def fit_pg_batch(probs, err=None, krange=None, init=None, fix=None, logscale=False,
+                 maxiter=200, tol=1e-10):
+    """Fit the Poisson-Gamma distribution to many data sets (cells) at once.
+
+    The cells are stacked into arrays padded with NaN and M is fitted for all of
+    them by a vectorized Levenberg-Marquardt in log(M) with the analytic
+    derivative of the log-space model log PG(kb, M, k). Each cell stops when it
+    has converged.
+
+    Args:
+        probs (list): photon probabilities of each cell in the layout of fit_pg.
+        err (list, optional): errors of the probabilities of each cell.
+        init (dict, optional): {'M': (initial value, min, max)}.
+        fix (dict, optional): {'M0': value} to fix M.
+
+    Returns:
+        tuple: pars_arr (ncells, 1, 2) with M and its error and gof (ncells, 4)
+            with chisqr, redchi, bic and aic as returned by fit_pg.
+    """
+    ncell = len(probs)
+    if krange is None:
+        krange = np.arange(probs[0].shape[0]-2)
+    if init is None or 'M' not in init:
+        init = {'M': (1, 0, None)}
+    m0, mmin, mmax = init['M']
+    mmin = 1e-6 if not mmin else mmin
+    mmax = 1e6 if mmax is None else mmax
+
+    # stack the cells: kb (ncell, 1, nx), k (ncell, nk, 1), data and weights (ncell, nk, nx);
+    # the model does not depend on the choice of the independent variable
+    nx = max(pr.shape[1] for pr in probs)
+    kb = np.full((ncell, 1, nx), np.nan)
+    k = np.zeros((ncell, krange.size, 1))
+    data = np.full((ncell, krange.size, nx), np.nan)
+    wgt = np.ones_like(data)
+    for c, pr in enumerate(probs):
+        n = pr.shape[1]
+        kb[c,0,:n] = pr[1]
+        k[c,:,0] = pr[krange+2,0]
+        data[c,:,:n] = pr[krange+2]
+        if err is not None:
+            w = np.abs(err[c]).astype(float)
+            w[w>0] = 1./w[w>0]**2
+            wgt[c,:,:n] = w
+
+    def model(M):
+        Mc = M[:,None,None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            lpg = log_PoissonGamma(kb, Mc, k)
+            dlpg = digamma(k + Mc) - digamma(Mc) + np.log(Mc/(Mc+kb)) + (kb - k)/(Mc + kb)
+        if logscale:
+            return lpg / np.log(10), dlpg * Mc / np.log(10)
+        pg = np.exp(lpg)
+        return pg, pg * dlpg * Mc
+
+    def residuals(M):
+        f, J = model(M)
+        r = (data - f) * wgt
+        valid = np.isfinite(r) & np.isfinite(J)
+        r = np.where(valid, r, 0)
+        J = np.where(valid, -J * wgt, 0)
+        return r, J, valid
+
+    M = np.full(ncell, float(m0))
+    if fix is not None and ('M0' in fix or 'M' in fix):
+        M[:] = fix.get('M0', fix.get('M'))
+        r, J, valid = residuals(M)
+        nvarys = 0
+    else:
+        M = np.clip(M, mmin, mmax)
+        r, J, valid = residuals(M)
+        chisqr = (r**2).sum((1, 2))
+        lam = np.full(ncell, 1e-3)
+        active = np.ones(ncell, dtype=bool)
+        for _ in range(maxiter):
+            JJ = (J**2).sum((1, 2))
+            Jr = (J*r).sum((1, 2))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                step = np.where(JJ > 0, -Jr / (JJ * (1. + lam)), 0.)
+            step = np.clip(step, -2., 2.) * active
+            Mnew = np.clip(M * np.exp(step), mmin, mmax)
+            rn, Jn, validn = residuals(Mnew)
+            chinew = (rn**2).sum((1, 2))
+            better = active & (chinew <= chisqr)
+            converged = better & (np.abs(chisqr - chinew) <= tol * chisqr)
+            M = np.where(better, Mnew, M)
+            r = np.where(better[:,None,None], rn, r)
+            J = np.where(better[:,None,None], Jn, J)
+            valid = np.where(better[:,None,None], validn, valid)
+            chisqr = np.where(better, chinew, chisqr)
+            lam = np.where(better, lam / 10., lam * 10.)
+            active &= ~converged & (lam < 1e10)
+            if not active.any():
+                break
+        nvarys = 1
+
+    ndata = valid.sum((1, 2))
+    chisqr = (r**2).sum((1, 2))
+    nfree = np.maximum(ndata - nvarys, 1)
+    redchi = chisqr / nfree
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # J is the derivative with respect to log(M)
+        dM = M * np.sqrt(redchi / (J**2).sum((1, 2))) if nvarys else np.zeros(ncell)
+        n_ln = ndata * np.log(chisqr / ndata)
+    pars_arr = np.stack((M, dM), -1)[:,None,:]
+    gof = np.stack((chisqr, redchi, n_ln + np.log(ndata) * nvarys, n_ln + 2 * nvarys), -1)
+
+    return pars_arr, gof
@@ -1,6 +1,7 @@
 #! /usr/bin/env python
 import numpy as np
 import lmfit
+from scipy.special import gammaln, digamma, polygamma, xlogy
 from .PoissonGammaDistribution import PoissonGamma as poisgam
 
 def fit_pg_likelihood(prob, npix, err=None, kv=None, init={}, fix=None, method='Nelder-mead'):
@@ -59,3 +60,116 @@ def fit_pg_likelihood(prob, npix, err=None, kv=None, init={}, fix=None, method='
 
     return pars_arr, gof, out, lmfit.fit_report(out)
 
+
+def ml_contrast(prob, npix, kv=None, init=None, fix=None, maxiter=100, tol=1e-10):
+    """Maximum likelihood estimate of the number of modes M for many data sets at once.
+
+    The log-likelihood of the Poisson-Gamma distribution is written in terms of
+    the weights W_k = sum_f P_k(f) and the per-frame moments sum_k P_k(f) and
+    sum_k k P_k(f), so that score and observed Fisher information of all data sets
+    are evaluated with a few vectorized operations. M is found by Newton
+    iterations in log(M).
+
+    Args:
+        prob (list): photon probabilities (nq+1, nbins+2, nframes) as calculated by
+            pyxsvs, e.g., one for each exposure time; nframes may differ.
+        npix (array): number of pixels of each q-ROI.
+        kv (array, optional): photon counts used for the fit. Defaults to all.
+        init (dict, optional): {'M': (initial value, min, max)}. Defaults to
+            {'M': (4, 1, None)}. The initial value is only used if M cannot be
+            estimated from the variance of the photon counts.
+        fix (dict, optional): {'M': value} to fix M.
+
+    Returns:
+        dict: M, dM, beta (1/M), dbeta, deviance (-2 npix sum P log(PG/P)) and
+            redchi (deviance per degree of freedom), each of shape (len(prob), nq).
+    """
+    nt = len(prob)
+    nq = prob[0].shape[0] - 1
+    if kv is None:
+        kv = np.arange(prob[0].shape[1]-2)
+    kv = np.asarray(kv)
+    if init is None or 'M' not in init:
+        init = {'M': (4, 1, None)}
+    m0, mmin, mmax = init['M']
+    mmin = 1e-6 if mmin is None else mmin
+    mmax = 1e6 if mmax is None else mmax
+
+    # per-frame statistics of all (t, q) cells concatenated; cell index c = it*nq + iq
+    W = np.zeros((nt*nq, kv.size))
+    kb, p, m, cid = [], [], [], []
+    nterms = np.zeros(nt*nq)
+    const = np.zeros(nt*nq)
+    for it, pr in enumerate(prob):
+        P = pr[1:,kv+2].astype(float)
+        kbi = np.broadcast_to(pr[1:,1], (nq, pr.shape[-1])).astype(float)
+        c = it*nq + np.arange(nq)
+        W[c] = P.sum(-1)
+        nterms[c] = (P > 0).sum((1, 2))
+        # constant part of the log-likelihood and the entropy term
+        const[c] = (xlogy(np.einsum('qkf,k->qf', P, kv), kbi).sum(-1)
+                    - (P.sum(-1) * gammaln(kv + 1.)).sum(-1) - xlogy(P, P).sum((1, 2)))
+        kb.append(kbi.ravel())
+        p.append(P.sum(1).ravel())
+        m.append(np.einsum('qkf,k->qf', P, kv).ravel())
+        cid.append(np.repeat(c, pr.shape[-1]))
+    kb, p, m, cid = (np.concatenate(x) for x in (kb, p, m, cid))
+    ncell = nt * nq
+    npix = np.tile(np.asarray(npix, dtype=float)[:nq], nt)
+
+    def cellsum(x):
+        return np.bincount(cid, x, minlength=ncell)
+
+    def loglik(M):
+        Mf = M[cid]
+        lf = p*xlogy(Mf, Mf) - (m + Mf*p) * np.log(Mf + kb)
+        return (W * (gammaln(kv + M[:,None]) - gammaln(M[:,None]))).sum(-1) + cellsum(lf)
+
+    def score(M):
+        Mf = M[cid]
+        a = Mf + kb
+        S = (W * (digamma(kv + M[:,None]) - digamma(M[:,None]))).sum(-1)
+        S += cellsum(p*(np.log(Mf/a) + 1.) - (m + Mf*p) / a)
+        H = (W * (polygamma(1, kv + M[:,None]) - polygamma(1, M[:,None]))).sum(-1)
+        H += cellsum(p*(1./Mf - 2./a) + (m + Mf*p) / a**2)
+        return S, H
+
+    if fix is not None and 'M' in fix:
+        M = np.full(ncell, float(fix['M']))
+        dM = np.zeros(ncell)
+    else:
+        # moment estimate: var(k) = kb + kb^2 / M
+        k2 = cellsum(np.concatenate([np.einsum('qkf,k->qf', pr[1:,kv+2], kv**2).ravel()
+                                     for pr in prob]))
+        kb2 = cellsum(p * kb**2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            M = kb2 / (k2 - cellsum(p * kb) - kb2)
+        M = np.where(np.isfinite(M) & (M > 0), M, m0)
+        M = np.clip(M, mmin, mmax)
+
+        u = np.log(M)
+        active = np.ones(ncell, dtype=bool)
+        for _ in range(maxiter):
+            S, H = score(M)
+            # Newton step in u = log(M), at most a factor of 2 in M
+            Su = M * S
+            Hu = M**2 * H + Su
+            step = np.where(Hu < 0, -Su / np.where(Hu < 0, Hu, 1.), np.sign(Su) * np.log(2))
+            step = np.clip(step, -np.log(2), np.log(2)) * active
+            unew = np.clip(u + step, np.log(mmin), np.log(mmax))
+            active &= np.abs(unew - u) > tol
+            u = unew
+            M = np.exp(u)
+            if not active.any():
+                break
+        S, H = score(M)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dM = np.where(H < 0, 1. / np.sqrt(-npix * H), np.nan)
+
+    deviance = -2 * npix * (loglik(M) + const)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        redchi = deviance / (nterms - 1)
+
+    res = {'M': M, 'dM': dM, 'beta': 1./M, 'dbeta': dM / M**2,
+           'deviance': deviance, 'redchi': redchi}
+    return {key: val.reshape(nt, nq) for key, val in res.items()}
@@ -1,7 +1,7 @@
 #! /usr/bin/env python
 import numpy as np
 from numpy import log
-from scipy.special import gamma
+from scipy.special import gamma, gammaln, xlogy
 
 
 def PoissonGamma(x, M, p, ind_var='kb'):
@@ -14,7 +14,17 @@ def PoissonGamma(x, M, p, ind_var='kb'):
     elif ind_var == 'k':
         k = x
         kb = p
-    return gamma(1.*k+M)/(gamma(1.*M)*gamma(1.*k+1.))*1.*(1.*kb/(M*1.+kb))**k*(1.*M/(kb+M))**M
+    return np.exp(log_PoissonGamma(kb, M, k))
+
+
+def log_PoissonGamma(kb, M, k):
+    """Logarithm of the Poisson-Gamma distribution computed with gammaln,
+    which does not overflow for large k+M.
+    """
+    k = np.asarray(k, dtype=float)
+    kb = np.asarray(kb, dtype=float)
+    return (gammaln(k+M) - gammaln(M) - gammaln(k+1.) + xlogy(k, kb/(M+kb))
+            + M*np.log(M/(kb+M)))
 
 # def stirling(x):
 #     return np.sqrt(2*np.pi/x)*(x/np.e)**x
@@ -8,6 +8,8 @@ import matplotlib
 from matplotlib import pyplot as plt
 import re
 from scipy.special import gamma
+from types import SimpleNamespace
+from .g2batch import fit_kww
 
 class G2:
 
@@ -89,9 +91,12 @@ class G2:
             pass
 
 
-    def fit(self, mode='sig', nmodes=1, fitglobal=[], init={}, fix={}, lmfit_pars={}, fitqdep={}):
+    def fit(self, mode='sig', nmodes=1, fitglobal=[], init={}, fix={}, lmfit_pars={}, fitqdep={},
+            engine='lmfit'):
         '''
-        Function that computes the fits using lmfit's minimizer
+        Function that computes the fits using lmfit's minimizer. With engine='batch'
+        all q-values are fitted at once by a vectorized Levenberg-Marquardt (see
+        g2batch.fit_kww); global fits and q-dependent constraints use lmfit.
         '''
 
         self.fitglobal = fitglobal
@@ -108,6 +113,15 @@ class G2:
         # setting the weights of the data
         self._get_weights(mode)
 
+        if engine == 'batch':
+            if self.fitglobal or self.fitqdep or ('__lnsigma' in init) or ('b0' in fix):
+                print('Batch fitting does not support global fits and constraints. Using lmfit.')
+            else:
+                self._fit_batch(init, fix, **lmfit_pars)
+                self.pars['q'] = self.qv[self.nq]
+                self.pars = self.pars.apply(pd.to_numeric)
+                return self.pars, self.fit_result
+
         self._minimizer = lmfit.Minimizer(self._residuals, params=self._lmpars,
                                           reduce_fcn=self._reduce_func,
                                           iter_cb=self._iter_cb,
@@ -492,6 +506,31 @@ class G2:
                     if cond:
                         break
 
+    def _fit_batch(self, init, fix, maxiter=1000, tol=1e-10, **kwargs):
+        """Fit all q-values at once and save the results in self.pars
+        """
+        wgt = self._weights[self.nq] if np.ndim(self._weights) == 2 else self._weights
+        values, stderr, gof, success = fit_kww(self.t, self.cf[self.nq], wgt, self.nmodes,
+                                               init, fix, maxiter=maxiter, tol=tol)
+        data = {}
+        for vn in values:
+            data[vn] = values[vn]
+            data['d'+vn] = stderr[vn] if vn not in fix else np.zeros(len(self.nq))
+        for i, gn in enumerate(['chisqr', 'redchi', 'bic', 'aic']):
+            data[gn] = gof[:,i]
+        self.pars = pd.DataFrame(data, columns=self.pars.columns, index=range(len(self.nq)))
+
+        for line in range(len(self.nq)):
+            out = SimpleNamespace(success=bool(success[line]),
+                                  errorbars=bool(np.isfinite([stderr[vn][line] for vn in stderr
+                                                              if vn not in fix]).all()),
+                                  params={vn: values[vn][line] for vn in values},
+                                  chisqr=gof[line,0], redchi=gof[line,1],
+                                  bic=gof[line,2], aic=gof[line,3])
+            report = ', '.join(f'{vn}: {values[vn][line]:.4g} +/- {stderr[vn][line]:.2g}'
+                               for vn in values)
+            self.fit_result.append((out, report))
+
     def _write_to_pars(self, out, line=0):
         """ Save fit results in self.pars variable
         """
@@ -0,0 +1,176 @@
+import numpy as np
+
+
+def kww_names(nmodes):
+    """Names of the free parameters of the multi mode KWW model. The contrast
+    of the first mode b0 is given by the constraint of G2.
+    """
+    names = ['a', 'beta']
+    for i in range(nmodes):
+        names.extend([f't{i}', f'g{i}'] + [f'b{i}'] * bool(i))
+    return names
+
+
+def kww_model(x, p, nmodes):
+    """Multi mode KWW function and its Jacobian for many curves at once.
+
+    g2 = a + sum_i b_i exp(-2 (x/t_i)^g_i) with b0 = beta for one mode and
+    b0 = a + beta - 1 - sum_{i>0} b_i otherwise.
+
+    Args:
+        x (np.ndarray): delay times (ncurves, nt).
+        p (np.ndarray): parameters (ncurves, nparams) in the order of kww_names.
+
+    Returns:
+        tuple: model (ncurves, nt) and Jacobian (ncurves, nt, nparams).
+    """
+    names = kww_names(nmodes)
+    ip = {n: i for i, n in enumerate(names)}
+    col = lambda n: p[:, ip[n], None]
+
+    b = [col('beta') if nmodes == 1 else
+         col('a') + col('beta') - 1 - sum(col(f'b{i}') for i in range(1, nmodes))]
+    b += [col(f'b{i}') for i in range(1, nmodes)]
+
+    model = np.broadcast_to(col('a'), x.shape).copy()
+    jac = np.zeros(x.shape + (len(names),))
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for i in range(nmodes):
+            t, g = col(f't{i}'), col(f'g{i}')
+            xt = x / t
+            xg = xt**g
+            e = np.exp(-2 * xg)
+            model += b[i] * e
+            jac[..., ip[f't{i}']] = b[i] * e * 2 * g * xg / t
+            jac[..., ip[f'g{i}']] = -2 * b[i] * e * xg * np.log(xt)
+            if i == 0:
+                jac[..., ip['beta']] = e
+                if nmodes > 1:
+                    jac[..., ip['a']] += e
+            else:
+                jac[..., ip[f'b{i}']] = e - jac[..., ip['beta']]
+    jac[..., ip['a']] += 1
+    return model, jac
+
+
+def fit_kww(t, cf, wgt, nmodes, init, fix={}, maxiter=1000, tol=1e-10):
+    """Fit the multi mode KWW function to many correlation functions at once.
+
+    All curves are stacked into arrays (masked points are excluded) and fitted
+    by a vectorized Levenberg-Marquardt with the analytic Jacobian of
+    kww_model. Each curve stops when it has converged. Bounds are applied by
+    projection and the relaxation times are kept in ascending order.
+
+    Args:
+        t (np.ndarray): delay times (nt,).
+        cf (np.ma.MaskedArray): correlation functions (ncurves, nt).
+        wgt (np.ma.MaskedArray): weights of the residuals (broadcastable to cf).
+        nmodes (int): number of modes.
+        init (dict): (value, min, max) of each parameter.
+        fix (dict, optional): values of fixed parameters.
+
+    Returns:
+        tuple: dicts of values and standard errors of the parameters including b0
+            (each of shape (ncurves,)), gof (ncurves, 4) with chisqr, redchi, bic and
+            aic and the boolean array success.
+    """
+    names = kww_names(nmodes)
+    npar = len(names)
+    x = np.ma.filled(np.ma.masked_invalid(np.ma.asarray(t, dtype=float)), np.nan)
+    y = np.ma.filled(np.ma.masked_invalid(np.ma.asarray(cf, dtype=float)), np.nan)
+    w = np.ma.filled(np.ma.masked_invalid(np.ma.asarray(wgt, dtype=float)), np.nan)
+    w = np.broadcast_to(w, y.shape)
+    x = np.broadcast_to(x, y.shape)
+    valid = np.isfinite(x) & np.isfinite(y) & np.isfinite(w)
+    x, y, w = (np.where(valid, z, 1.) for z in (x, y, w))
+    ncurve = y.shape[0]
+
+    vary = np.array([n not in fix for n in names])
+    p = np.array([fix.get(n, init[n][0]) for n in names], dtype=float)
+    p = np.tile(p, (ncurve, 1))
+    lo = np.array([-np.inf if init[n][1] is None else init[n][1] for n in names], dtype=float)
+    hi = np.array([np.inf if init[n][2] is None else init[n][2] for n in names], dtype=float)
+    itau = np.array([n.startswith('t') for n in names])
+    # relaxation times are positive and varied in log space
+    lo[itau] = np.maximum(lo[itau], 1e-300)
+    p = np.clip(p, lo, hi)
+
+    def project(p):
+        p = np.where(vary, np.clip(p, lo, hi), p)
+        if nmodes > 1:
+            p[:, itau] = np.maximum.accumulate(p[:, itau], axis=1)
+        return p
+
+    def residuals(p):
+        model, jac = kww_model(x, p, nmodes)
+        r = np.where(valid, (y - model) * w, 0.)
+        jac = np.where(valid[..., None], -jac * w[..., None], 0.)
+        bad = ~np.isfinite(r).all(-1) | ~np.isfinite(jac).all((1, 2))
+        return r, jac, np.where(bad, np.inf, (r**2).sum(-1))
+
+    p = project(p)
+    r, jac, chisqr = residuals(p)
+    lam = np.full(ncurve, 1e-3)
+    active = np.isfinite(chisqr)
+    eye = np.eye(npar)
+    idx = np.arange(npar)
+    for _ in range(maxiter):
+        # derivatives with respect to log(t) for the relaxation times
+        scale = np.where(itau, p, 1.) * vary
+        J = jac * scale[:, None, :]
+        A = np.einsum('cni,cnj->cij', J, J)
+        g = np.einsum('cni,cn->ci', J, r)
+        D = np.diagonal(A, axis1=1, axis2=2).copy()
+        D[D <= 0] = 1.
+        A[:, idx, idx] += lam[:, None] * D + ~vary
+        A[~active] = eye
+        delta = -np.linalg.solve(A, np.where(active[:, None], g, 0.)[..., None])[..., 0]
+        delta *= vary
+        pnew = np.where(itau, p * np.exp(np.clip(delta, -5, 5)), p + delta)
+        pnew = project(pnew)
+        rn, jacn, chinew = residuals(pnew)
+        better = active & (chinew <= chisqr)
+        converged = better & (chisqr - chinew <= tol * chisqr)
+        p = np.where(better[:, None], pnew, p)
+        r = np.where(better[:, None], rn, r)
+        jac = np.where(better[:, None, None], jacn, jac)
+        chisqr = np.where(better, chinew, chisqr)
+        lam = np.where(better, lam / 10., np.where(active, lam * 10., lam))
+        active &= ~converged & (lam < 1e12)
+        if not active.any():
+            break
+    success = ~active & np.isfinite(chisqr)
+
+    nvarys = vary.sum()
+    ndata = valid.sum(-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        redchi = chisqr / (ndata - nvarys)
+        n_ln = ndata * np.log(chisqr / ndata)
+    gof = np.stack((chisqr, redchi, n_ln + np.log(ndata) * nvarys, n_ln + 2 * nvarys), -1)
+
+    # covariance of the varied parameters
+    J = jac[..., vary]
+    A = np.einsum('cni,cnj->cij', J, J)
+    cov = np.full(A.shape, np.nan)
+    ok = np.isfinite(A).all((1, 2))
+    ok[ok] = np.linalg.matrix_rank(A[ok]) == nvarys
+    cov[ok] = np.linalg.inv(A[ok]) * redchi[ok, None, None]
+    err = np.full(p.shape, np.nan)
+    err[:, vary] = np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+
+    values = {n: p[:, i] for i, n in enumerate(names)}
+    stderr = {n: err[:, i] for i, n in enumerate(names)}
+    # contrast of the first mode from the constraint
+    db0 = np.zeros(npar)
+    if nmodes == 1:
+        db0[names.index('beta')] = 1
+        values['b0'] = values['beta']
+    else:
+        db0[[names.index('a'), names.index('beta')]] = 1
+        db0[[names.index(f'b{i}') for i in range(1, nmodes)]] = -1
+        values['b0'] = values['a'] + values['beta'] - 1 - sum(values[f'b{i}']
+                                                              for i in range(1, nmodes))
+    db0 = db0[vary]
+    stderr['b0'] = np.sqrt(np.einsum('i,cij,j->c', db0, cov, db0))
+
+    return values, stderr, gof, success
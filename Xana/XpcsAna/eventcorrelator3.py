@@ -4,7 +4,7 @@ import numpy as np
 import sys
 from scipy.ndimage import gaussian_filter
 from ..misc.progressbar import progress
-from .xpcsmethods import cftomt, mat2evt
+from .xpcsmethods import cftomt, mat2evt, roi2evt
 
 try:
     from .fecorrt3m import fecorrt3m
@@ -15,9 +15,10 @@ except ImportError:
 
 #---MAIN FUNCTION---
 def eventcorrelator(data, qroi, qv=None, dt=1., method='matrix',
-                    twotime_par=-1, **kwargs):
+                    twotime_par=-1, chunk_size=256, **kwargs):
     '''
-    Event correlator
+    Event correlator. With method 'matrix', data can be an array, a memory-mapped
+    array or an HDF5 dataset that is read in chunks of chunk_size images.
     '''
     time0 = time()
     lqv = len(qroi)
@@ -30,9 +31,9 @@ def eventcorrelator(data, qroi, qv=None, dt=1., method='matrix',
     for roii in rlqv:
         print('\nAnalyzing ROI: {}'.format(roii), flush=1)
         if method == 'matrix':
-            roi = data[:,qroi[roii][0],qroi[roii][1]]
-            ntimes, npix = np.shape(roi)
-            pix, t, s = mat2evt(roi)
+            ntimes = data.shape[0]
+            npix = qroi[roii][0].size
+            pix, t, s = roi2evt(data, qroi[roii], chunk_size)
         elif method == 'events':
             npix = qroi[roii][0].size
             pix, t, s = data[roii]
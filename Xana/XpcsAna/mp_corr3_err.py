@@ -186,7 +186,9 @@ def mp_corr(nf, chn, srch, rcr, lind, nq, quc=None, quce=None, data=None, use_mp
         chunk_size = chunk[0].shape[0]
         ni = 0
         while ni < chunk_size:
-            matr = [qchunk[ni] for qchunk in chunk]
+            # integer photon counts are converted to float only per frame
+            matr = [qchunk[ni] if qchunk.dtype.kind == 'f' else qchunk[ni].astype(np.float32)
+                    for qchunk in chunk]
             correlator(0,matr)
             ni += 1
             n += 1
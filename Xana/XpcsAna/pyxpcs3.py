@@ -1,10 +1,12 @@
 from time import time
+import hashlib
 import numpy as np
 import pickle as pkl
 from multiprocessing import Process, Queue
 from .mp_corr3_err import mp_corr
 from scipy.optimize import leastsq
 from ..misc.progressbar import progress
+from ..misc.qroi import QRoi, section_qroi
 import sys
 from matplotlib import pyplot as plt
 
@@ -92,38 +94,48 @@ def avr(saxs, ctr=-1, mask=None):
         saxs[i] = np.mean(saxs[i])
     return saxs.reshape(dim1,dim2)
 
+# radial geometry of the last sections used by avr_better
+_radial_cache = {}
+
+def _radial_geometry(ctr, mask):
+    """Radius bins and interpolation weights of the pixels of a section.
+    """
+    key = (tuple(float(x) for x in ctr), mask.shape,
+           hashlib.sha1(np.packbits(mask == 1).tobytes()).hexdigest())
+    if key not in _radial_cache:
+        cx, cy = ctr
+        dim1, dim2 = np.shape(mask)
+        X, Y = np.ogrid[1-cy : dim1+1-cy, 1-cx : dim2+1-cx]
+        q = np.float32(np.sqrt(X**2 + Y**2))
+        valid = (mask == 1)
+        n = (q + np.float32(0.5)).astype(np.int64)[valid]
+        q[~valid] = 0
+        par = q.astype(np.int64)
+        f1 = q - par.astype(np.float32)
+        if len(_radial_cache) > 1:
+            _radial_cache.pop(next(iter(_radial_cache)))
+        _radial_cache[key] = (valid, n, par, f1, q > 0)
+    return _radial_cache[key]
+
 def avr_better( saxs, ctr, mask ):
     """Return an average saxs image for normalization of images.
+
+    The mean intensity is computed for radii rounded to full pixels and
+    linearly interpolated at the radius of each pixel. The geometry of the
+    section is cached.
     """
-    cx, cy = ctr
-    dim1, dim2 = np.shape(saxs)
-    [X,Y] = np.mgrid[1-cy : dim1+1-cy, 1-cx : dim2+1-cx]
-    q = np.float32(np.sqrt(X**2 + Y**2))
-    n = np.int16(q + 0.5)
-    q[mask==0] = 0
-    n[mask==0] = 0
-    max_n = n.max() + 1
+    valid, n, par, f1, inside = _radial_geometry(ctr, mask)
+    max_n = (n.max() if n.size else 0) + 1
+    counts = np.bincount(n, minlength=max_n+1)
+    sums = np.bincount(n, saxs[valid], minlength=max_n+1)
     mean_saxs = np.zeros(max_n+1, np.float32)
-    new_saxs = np.zeros_like(saxs, np.float32)
-    radi = np.zeros((max_n,2), np.float32)
-
-    for i in range(max_n):
-        ind = np.where((n==i) & (mask==1))
-        if ind[0].size:
-            mean_saxs[i] = np.mean(saxs[ind])
-
-    for i in range(dim1):
-        for j in range(dim2):
-            if q[i,j] > 0:
-                par = int(q[i,j])
-                f1 = q[i,j] - par
-                if mean_saxs[par+1]>0 and mean_saxs[par]>0 :
-                    new_saxs[i,j] = mean_saxs[par+1]*f1 + mean_saxs[par]*(1-f1)
-                if mean_saxs[par+1]>0 and mean_saxs[par]==0 :
-                    new_saxs[i,j] = mean_saxs[par+1]
-                if mean_saxs[par+1]==0 and mean_saxs[par]>0 :
-                    new_saxs[i,j] = mean_saxs[par]
-    return new_saxs
+    mean_saxs[counts > 0] = sums[counts > 0] / counts[counts > 0]
+
+    lo = mean_saxs[par]
+    hi = mean_saxs[par+1]
+    new_saxs = np.where((lo > 0) & (hi > 0), hi*f1 + lo*(1-f1), np.where(hi > 0, hi, lo))
+    new_saxs[~inside] = 0
+    return new_saxs.astype(np.float32)
 
 def calculate_twotime_correlation_function(ttdata, tt_max_images=5000):
     """Calculate two-time correlation function:
@@ -192,8 +204,21 @@ def calculate_twotime_correlation_function(ttdata, tt_max_images=5000):
 #####################
 def pyxpcs( data, qroi, dt=1., qv=None, saxs=None, mask=None, ctr=(0,0), twotime_par=-1,
             qsec=(0,0), norm='symmetric_whole', nprocs=1, verbose=True, chn=16,
-            tt_max_images=5000):
+            tt_max_images=5000, chunk_size=None, frame_mean=None, qsec_dim=None):
     """Calculate g2 correlation functions with a given dataset or chunks of a data set.
+
+    The dataset can be an array, a memory-mapped array or an HDF5 dataset
+    (e.g., written by read_data with output_file). Memory-mapped arrays and
+    HDF5 datasets are processed in chunks of chunk_size images (default 256)
+    such that they are never loaded completely.
+
+    Chunks of shape (nframes, number of ROI pixels), as read by read_data with
+    output='roi', contain the pixels of the qrois one after another. In this
+    case, qsec_dim is the shape of the q-section that starts at qsec. Without
+    qsec_dim, it is taken from saxs if saxs has already been cropped to the
+    section and otherwise reaches from qsec to the end of the mask. Norm
+    'symmetric_whole' needs frame_mean, the mean intensity of the masked
+    section of each frame.
     """
 
     USE_MP = True if nprocs > 1 else False
@@ -206,16 +231,35 @@ def pyxpcs( data, qroi, dt=1., qv=None, saxs=None, mask=None, ctr=(0,0), twotime
     if qv is None:
         qv = np.arange(lqv)
 
-    if isinstance(data, np.ndarray):
-        nf, *dim = np.shape(data)
-        def get_chunk():
-            return (0, data)
-    elif isinstance(data, dict):
+    if isinstance(data, dict):
         USE_MP = True # make sure that the correlator runs in the background
         nf = data['nimages']
         dim = data['dim']
+        roi_mode = data.get('output', '') == 'roi'
         def get_chunk():
             return data['dataQ'].get()
+    elif hasattr(data, 'shape') and hasattr(data, '__getitem__'):
+        nf, *dim = data.shape
+        roi_mode = len(dim) == 1
+        if roi_mode:
+            if qsec_dim is not None:
+                dim = tuple(qsec_dim)
+            elif saxs is not None and not (isinstance(mask, np.ndarray)
+                                           and saxs.shape == mask.shape):
+                dim = saxs.shape
+            elif isinstance(mask, np.ndarray):
+                dim = (mask.shape[0]-qsec[0], mask.shape[1]-qsec[1])
+            else:
+                raise ValueError('The shape of the q-section (qsec_dim) is needed '
+                                 'for ROI pixel streams.')
+        if chunk_size is None:
+            in_memory = isinstance(data, np.ndarray) and not isinstance(data, np.memmap)
+            chunk_size = nf if in_memory else 256
+        if chunk_size < nf:
+            USE_MP = True # the correlator has to run in the background for several chunks
+        tiles = ((i, data[t:t+chunk_size]) for i, t in enumerate(range(0, nf, chunk_size)))
+        def get_chunk():
+            return next(tiles)
     else:
         raise ValueError(f"Cannot process data of type {type(data)}")
 
@@ -223,13 +267,21 @@ def pyxpcs( data, qroi, dt=1., qv=None, saxs=None, mask=None, ctr=(0,0), twotime
         print('Number of images is:', nf)
         print('shape of image section is:', dim)
 
+    if roi_mode and norm == 'symmetric_whole' and frame_mean is None:
+        raise ValueError("Normalization 'symmetric_whole' needs the full image section "
+                         "or frame_mean.")
+
     if not isinstance(mask, np.ndarray):
         mask = np.ones(dim, 'int8')
 
-    mask = mask[qsec[0]:qsec[0]+dim[0],qsec[1]:qsec[1]+dim[1]]
+    if len(dim) == 2:
+        mask = mask[qsec[0]:qsec[0]+dim[0],qsec[1]:qsec[1]+dim[1]]
     if saxs is not None and saxs.shape!=mask.shape:
         saxs = saxs[qsec[0]:qsec[0]+dim[0],qsec[1]:qsec[1]+dim[1]]
 
+    # qrois as flat indices in the image section
+    sec_roi = section_qroi(qroi, qsec, dim) if len(dim) == 2 else None
+
 
 
    # normalize with average saxs image
@@ -242,14 +294,11 @@ def pyxpcs( data, qroi, dt=1., qv=None, saxs=None, mask=None, ctr=(0,0), twotime
         ctr = (ctr[0]-qsec[1],ctr[1]-qsec[0])
         saxs_img = saxs_img * mask
         saxs_img = avr_better(saxs_img, ctr, mask)
-        saxs_imgc = np.ones((dim2,dim1))
         saxs_img[saxs_img==0] = 1.
-        for i in rlqv:
-            q0 = qroi[i][0] - qsec[0]
-            q1 = qroi[i][1] - qsec[1]
-            saxs_imgc[q0,q1] = np.mean(saxs_img[q0,q1])/saxs_img[q0,q1]
-
-        # saxs_imgc[np.where(np.isinf(saxs_imgc))] = 1.0
+        # normalization factors of the ROI pixels in the order of the ROIs
+        saxs_roi = saxs_img.ravel()[sec_roi.index]
+        roi_mean = np.add.reduceat(saxs_roi, sec_roi.offsets[:-1]) / sec_roi.sizes
+        saxs_imgc = np.repeat(roi_mean, sec_roi.sizes) / saxs_roi
 
         if verbose:
             print('Done')
@@ -259,12 +308,51 @@ def pyxpcs( data, qroi, dt=1., qv=None, saxs=None, mask=None, ctr=(0,0), twotime
     if verbose:
         print('Number of ROIs: ', lqv)
 
-    lind = []
-    total_pixels = 0
-    for iq in rlqv:
-        npixel = len(qroi[iq][0])
-        lind.append(npixel)
-        total_pixels += npixel
+    lind = [int(x) for x in (qroi.sizes if isinstance(qroi, QRoi)
+                             else [len(q[0]) for q in qroi])]
+    total_pixels = sum(lind)
+    roi_offsets = np.cumsum([0] + lind)
+
+    def normalize_chunk(chunk, idx):
+        """Gather the pixels of all ROIs of a chunk, fill the trace and normalize
+        the pixels in one pass. Returns the ROI pixels one ROI after another.
+        """
+        if roi_mode:
+            rois = chunk
+        else:
+            rois = chunk.reshape(chunk.shape[0], -1)[:, sec_roi.index]
+        if saxs is not None:
+            rois = rois * saxs_imgc # normalize with mean saxs image
+
+        # mean intensity of all ROIs with a segment reduction
+        trace[idx] = np.add.reduceat(rois, roi_offsets[:-1], axis=1, dtype=np.float64) / np.diff(roi_offsets)
+
+        # save data for two time correlation
+        if twotime_par != -1:
+            ttdata[idx,:] = rois[:, roi_offsets[twotime_par]:roi_offsets[twotime_par+1]]
+
+        if norm == 'none':
+            return rois
+        if rois is chunk or rois.dtype.kind != 'f':
+            rois = rois.astype(np.float64)
+
+        if norm == 'symmetric_whole':
+            if frame_mean is not None:
+                whole = frame_mean[idx]
+            else:
+                whole = chunk.reshape(chunk.shape[0], -1)[:, lin_mask].mean(1)
+            rois /= whole[:,None]
+        elif norm == 'symmetric':
+            normfactor = trace[idx].copy()
+            normfactor[normfactor==0] = 1.
+            for qi in rlqv:
+                rois[:, roi_offsets[qi]:roi_offsets[qi+1]] /= normfactor[:,qi,None]
+        elif norm == 'corrcoef':
+            for qi in rlqv:
+                roi = rois[:, roi_offsets[qi]:roi_offsets[qi+1]]
+                roi -= trace[idx,qi,None]
+                roi /= np.sqrt(np.mean(roi**2, -1))[:,None]
+        return rois
 
     nprocs = min(nprocs,lqv) # cannot use more processes than q-values
     tmp_pix = 0
@@ -341,7 +429,7 @@ def pyxpcs( data, qroi, dt=1., qv=None, saxs=None, mask=None, ctr=(0,0), twotime
     tcalc_cum = 0
     t0 = 0
     last_chunk = -1
-    lin_mask = np.where(mask)
+    lin_mask = np.flatnonzero(mask)
     while t0 < nf - 1:
         if verbose:
             progress(t0,nf)
@@ -357,31 +445,10 @@ def pyxpcs( data, qroi, dt=1., qv=None, saxs=None, mask=None, ctr=(0,0), twotime
                              chunk_diff)
         last_chunk = c_idx
 
-        if saxs is not None:
-            chunk = chunk * saxs_imgc # normalize with mean saxs image
-
-        # save data for two time correlation
-        if twotime_par != -1:
-            ttdata[idx,:] = chunk[:,qroi[twotime_par][0]-qsec[0],qroi[twotime_par][1]-qsec[1]]
+        rois = normalize_chunk(chunk, idx)
 
         for jj,(i,j) in enumerate(zip(q_sec[:-1], q_sec[1:])):
-            tmp_put = []
-            for qi in range(i,j):
-                q0 = qroi[qi][0] - qsec[0]
-                q1 = qroi[qi][1] - qsec[1]
-                trace[idx,qi] = chunk[:,q0,q1].mean(-1)
-                if norm == 'symmetric':
-                    normfactor = trace[idx,qi].copy()
-                    normfactor[normfactor==0] = 1.
-                    tmp_put.append(chunk[:,q0,q1]/normfactor[:,None])
-                elif norm == 'symmetric_whole':
-                    tmp_put.append(chunk[:,q0,q1]/np.mean(chunk[:,lin_mask[0],lin_mask[1]], axis=1)[:,None])
-                elif norm == 'none':
-                    tmp_put.append(chunk[:,q0,q1])
-                elif norm == 'corrcoef':
-                    tmp_mat = chunk[:,q0,q1]/trace[idx,qi,None]
-                    tmp_put.append((tmp_mat-tmp_mat.mean(-1)[:,None])
-                                   /np.sqrt(np.var(tmp_mat,-1))[:,None])
+            tmp_put = [rois[:, roi_offsets[qi]:roi_offsets[qi+1]] for qi in range(i,j)]
             if USE_MP:
                 qur[jj].put(tmp_put)
             else:
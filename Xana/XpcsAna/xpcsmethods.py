@@ -24,6 +24,21 @@ def mat2evt(roi):
 
     return pix, t, s
 
+def roi2evt(data, roi, chunk_size=256):
+    '''Convert the pixels of a ROI of an image series into events. The series
+       is read in chunks of chunk_size images, so arrays, memory-mapped arrays
+       and HDF5 datasets are never loaded completely.
+    '''
+    ntimes = data.shape[0]
+    pix, t, s = [], [], []
+    for t0 in range(0, ntimes, chunk_size):
+        chunk = np.asarray(data[t0:t0+chunk_size])
+        pixi, ti, si = mat2evt(chunk[:, roi[0], roi[1]])
+        pix.append(pixi)
+        t.append(ti + t0)
+        s.append(si)
+    return np.concatenate(pix), np.concatenate(t), np.concatenate(s)
+
 def cftomt(d, par=16, err2=None):
     '''Function to bin the correlation function. Returns correlation
        functions similar to the multi tau approach.
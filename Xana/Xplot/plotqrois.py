@@ -4,6 +4,7 @@ from matplotlib.collections import PatchCollection
 import matplotlib.patches as patches
 from matplotlib.colors import LogNorm
 from ..misc.add_colorbar import add_colorbar
+from ..misc.qroi import QRoi
 from .niceplot import niceplot
 from ..SaxsAna.pysaxs3 import get_soq
 from mpl_toolkits.axes_grid1 import make_axes_locatable
@@ -104,15 +105,16 @@ def plotqrois(Isaxs, setup, method='S(Q)', d=0, shade=False, color='r', ax=None,
 
         uq = np.unique(setup.qv)
         cmaprois = plt.get_cmap(cmaprois, uq.size)
-        flt = np.zeros_like(Isaxs)*np.nan
+        qroi = setup.qroi
+        if not isinstance(qroi, QRoi):
+            qroi = QRoi.from_tuples(qroi, dim)
 
         saxs_sec = (Isaxs*setup.mask)[y1:y2,x1:x2]
         im = ax.imshow(saxs_sec, cmap=cmapdata, norm=LogNorm())
-        for i,iuq in enumerate(uq):
-            for j in np.where(setup.qv==iuq)[0]:
-                qi = setup.qroi[j]
-                flt[qi] = i
-        im2 = ax.imshow(flt[y1:y2,x1:x2], cmap=cmaprois, alpha=.8)
+        # map the labels of the qrois to the index of their q-value
+        qindex = np.append(np.nan, np.searchsorted(uq, setup.qv[:len(qroi)]))
+        flt = qindex[qroi.labels[y1:y2,x1:x2]]
+        im2 = ax.imshow(flt, cmap=cmaprois, alpha=.8)
 
         # shade_wedges(ax, setup, alpha=0.6, cmap='inferno', qsec=(y1,x1), mirror=mirror)
 
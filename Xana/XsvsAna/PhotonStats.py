@@ -1,41 +1,31 @@
 import numpy as np
-from .betaratio import betaratio
-from ..Xfit.FitPoissonGammaLikelihood import fit_pg_likelihood
+from .contrast import frame_beta, ratio_beta, beta_stats
+from ..Xfit.FitPoissonGammaLikelihood import ml_contrast
 
 
-def prob2beta( prob, gproi):
+def prob2beta( prob, gproi, chunk_size=65536):
     """Use betaratios to calculate the speckle contrast of a given data set of 
-    photon probabilities.
+    photon probabilities. All q-values and frames are evaluated at once by
+    frame_beta; invalid values are masked.
     """
-    nq, nbins, ltimes = np.shape(prob[1:,1:])
-    beta = np.ma.array(np.empty((nq, nbins-1, ltimes), dtype=np.float32))
-    k = prob[0,2:,0]
-
-    for j in range(nq):
-        kb = prob[j+1,1]
-        beta[j,1:] = betaratio(k, kb, prob[j+1,2:], (ltimes, gproi[j]))[0]
-        beta[j,0] = kb
-    
-    return beta
+    return np.ma.masked_invalid(frame_beta(prob, chunk_size))
 
 def prob2betasigma( prob, gproi, sigma=3):
     """Use betaratios to calculate the speckle contrast of a given data set of 
     photon probabilities using only kbar values in a sigma-sigma intercal.
     """
     nq, nbins, ltimes = np.shape(prob[1:,1:])
-    beta = np.ma.array(np.empty((nq, nbins-1, 1), dtype=np.float32))
     k = prob[0,2:,0]
-    for j in range(nq):
-        kb = prob[j+1,1]
-        mean_kb = np.mean(kb[kb>0])
-        std_kb = np.std(kb[kb>0])
-        ind = np.where(np.abs(kb-mean_kb) < std_kb*sigma)[0]
-        prob_sel = prob[j+1,2:]
-        prob_sel = np.mean(prob_sel[:,ind],-1)
-        beta[j,1:] = betaratio(k, mean_kb, prob_sel, (ltimes, gproi[j]))[0]
-        beta[j,0] = mean_kb
-    
-    return beta
+    kb = prob[1:,1]
+    mean_kb = np.nanmean(np.where(kb > 0, kb, np.nan), -1)
+    std_kb = np.nanstd(np.where(kb > 0, kb, np.nan), -1)
+    sel = (np.abs(kb - mean_kb[:,None]) < std_kb[:,None]*sigma).astype(float)
+    prob_sel = (prob[1:,2:] * sel[:,None]).sum(-1) / sel.sum(-1)[:,None]
+    beta = np.empty((nq, nbins-1, 1), dtype=np.float32)
+    beta[:,0,0] = mean_kb
+    beta[:,1:,0] = ratio_beta(k, mean_kb[:,None], prob_sel[...,None])[...,0]
+
+    return np.ma.masked_invalid(beta)
 
 def average_beta(t, q, contrast, ratio=0):
     """calculate the speckle contrast of a series of speckle patterns in three ways:
@@ -50,26 +40,23 @@ def average_beta(t, q, contrast, ratio=0):
     v2_mx = v2_av.copy()
 
     for it in range(t.size):
-        for iq in range(q.size):
-            beta = contrast[0][it][iq,ratio+1]
-            v2_av[it+1,iq+1] = np.ma.mean(beta), np.ma.std(beta)
-            v2_md[it+1,iq+1] = np.ma.median(beta), np.ma.std(beta)
-            h = np.histogram(beta[~beta.mask], bins=200, range=(-2,8), normed=True)
-            e = h[1][:-1] + np.diff(h[1][:2])/2
-            v2_mx[it+1,iq+1] = e[np.argmax(h[0])], .05
+        beta = np.ma.filled(np.ma.masked_invalid(contrast[0][it][:q.size,ratio+1]), np.nan)
+        mean, std, median, mode = beta_stats(beta, bins=200, range=(-2,8))
+        v2_av[it+1,1:,0], v2_av[it+1,1:,1] = mean, std
+        v2_md[it+1,1:,0], v2_md[it+1,1:,1] = median, std
+        v2_mx[it+1,1:,0], v2_mx[it+1,1:,1] = mode, .05
 
     return v2_av, v2_md, v2_mx
 
 def beta_from_likelihood(t, q, prob, npix, **kwargs):
-    """Use likelihood ratio minimization to estimate the contrast.
+    """Use likelihood ratio minimization to estimate the contrast. All exposure
+    times and q-values are fitted at once by ml_contrast; kwargs are passed to it.
     """
     v2_ml = np.zeros((t.size+1, q.size+1, 2), dtype=np.float32)
     v2_ml[1:,0,0] = t
     v2_ml[0,1:,0] = q
-    for it in range(t.size):
-        for iq in range(q.size):
-            probi = prob[0][it][iq+1]
-            v2_ml[it+1,iq+1] = fit_pg_likelihood(probi, npix[iq], **kwargs)[0]
+    res = ml_contrast(prob[0][:t.size], npix, **kwargs)
+    v2_ml[1:,1:,0] = res['beta'][:,:q.size]
+    v2_ml[1:,1:,1] = res['dbeta'][:,:q.size]
 
     return v2_ml
-    
@@ -39,17 +39,17 @@ class VisbFunc(AnaList):
         """
         self.db_id = db_id
         self.prob =  [[] for _ in range(2)]
-        t_exposure = np.empty(len(db_id))
         l = []
         for i, sid in enumerate(db_id):
             try:
                 d = self.Xana.get_item(sid)
-                l.append(d['prob'])
-                t_exposure[i] = d['prob'][0,0,0]
+                # multi-exposure results contain one prob array per binning level
+                l.extend(d.get('prob_binned', [d['prob']]))
             except KeyError:
                 print('Could not load item {}'.format(sid))
 
-        ind = np.argsort(t_exposure)
+        t_exposure = np.array([prob[0,0,0] for prob in l])
+        ind = np.argsort(t_exposure, kind='stable')
         self.t_exposure = t_exposure[ind]
         self.prob[0] = [l[i] for i in ind]
 
@@ -1,4 +1,5 @@
 from .pyxsvs3 import pyxsvs
+from .evtprob import evtxsvs
 
 class Xsvs:
 
@@ -9,3 +10,6 @@ class Xsvs:
 
     def pyxsvs(*args, **kwargs):
         return pyxsvs(*args, **kwargs)
+
+    def evtxsvs(*args, **kwargs):
+        return evtxsvs(*args, **kwargs)
@@ -0,0 +1,89 @@
+import warnings
+import numpy as np
+
+
+def ratio_beta(kv, kb, prob):
+    """Speckle contrast from the ratios of consecutive photon probabilities.
+
+    beta_k = (a kb - (k+1)) / (kb (1 + (1-a) k)) with a = P(k) / P(k+1). Values
+    that cannot be calculated, i.e., if P(k+1) or P(k+2) or kb is zero, are NaN.
+
+    Args:
+        kv (array): photon counts k of the probabilities (nk,).
+        kb (array): mean photon counts (..., nframes).
+        prob (array): photon probabilities (..., nk, nframes).
+
+    Returns:
+        np.ndarray: beta (..., nk-1, nframes).
+    """
+    kv = np.asarray(kv, dtype=float)[:-1,None]
+    kb = np.asarray(kb, dtype=float)[...,None,:]
+    p1 = prob[...,:-1,:]
+    p2 = prob[...,1:,:]
+    invalid = (p2 == 0) | (kb == 0)
+    # P(k+1) is only used if P(k+2) is not zero
+    invalid[...,:-1,:] |= prob[...,2:,:] == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = p1 / p2
+        beta = (a*kb - (kv + 1.)) / kb / (1. + (1.-a) * kv)
+    beta[invalid | ~np.isfinite(beta)] = np.nan
+    return beta
+
+
+def frame_beta(prob, chunk_size=65536):
+    """Per-frame contrast of all q-values and photon counts.
+
+    Args:
+        prob (np.ndarray): photon probabilities (nq+1, nbins+2, nframes) as
+            calculated by pyxsvs.
+        chunk_size (int, optional): number of frames evaluated at once.
+
+    Returns:
+        np.ndarray: float32 array (nq, nbins, nframes); [:,0] is the mean photon
+            count and [:,i] the contrast from the ratio P(i-1)/P(i). Invalid
+            values are NaN.
+    """
+    kv = prob[0,2:,0]
+    nq, nbins, nf = prob[1:,1:].shape
+    beta = np.empty((nq, nbins-1, nf), dtype=np.float32)
+    for t0 in range(0, nf, chunk_size):
+        sl = slice(t0, t0+chunk_size)
+        kb = prob[1:,1,sl]
+        beta[:,0,sl] = kb
+        beta[:,1:,sl] = ratio_beta(kv, kb, prob[1:,2:,sl])
+    return beta
+
+
+def beta_stats(beta, bins=200, range=(-2, 8)):
+    """Mean, standard deviation, median and most frequent value of the contrast
+    along the last axis; NaN values are ignored.
+
+    The most frequent value is the center of the highest bin of the histogram
+    with the given bins and range. The histograms of all rows are calculated by
+    one bincount.
+
+    Returns:
+        tuple: arrays mean, std, median and mode of shape beta.shape[:-1].
+    """
+    beta = np.asarray(beta, dtype=float)
+    shape = beta.shape[:-1]
+    beta = beta.reshape(-1, beta.shape[-1])
+    nrows = beta.shape[0]
+    with warnings.catch_warnings():
+        # rows without valid values are NaN
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        mean = np.nanmean(beta, -1)
+        std = np.nanstd(beta, -1)
+        median = np.nanmedian(beta, -1)
+
+    edges = np.linspace(range[0], range[1], bins+1)
+    idx = np.floor((beta - range[0]) / (edges[1] - edges[0]))
+    idx[beta == range[1]] = bins - 1
+    idx = np.where((idx >= 0) & (idx < bins), idx, bins).astype(np.intp)
+    idx += (np.arange(nrows) * (bins+1))[:,None]
+    h = np.bincount(idx.ravel(), minlength=nrows*(bins+1)).reshape(nrows, bins+1)[:,:bins]
+    mode = edges[:-1][np.argmax(h, -1)] + (edges[1] - edges[0]) / 2
+    mode[h.max(-1) == 0] = np.nan
+
+    return tuple(x.reshape(shape) for x in (mean, std, median, mode))
+
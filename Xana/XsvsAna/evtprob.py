@@ -0,0 +1,87 @@
+from time import time
+import numpy as np
+from ..misc.qroi import QRoi
+
+
+def evt_histogram(pix, t, npix, nf, nbins):
+    """Photon count histograms (nf, nbins) of a ROI from its events.
+
+    Each event is one photon in pixel pix at frame t. The number of photons of
+    the occupied pixels is obtained from the run lengths of the sorted
+    (frame, pixel) keys and histogrammed with one bincount. The number of
+    empty pixels P(0) follows from the number of occupied pixels per frame.
+    Counts larger than nbins-1 are dropped.
+    """
+    key = np.asarray(t, dtype=np.int64) * npix + np.asarray(pix, dtype=np.int64)
+    if key.size and np.any(key[1:] < key[:-1]):
+        key = np.sort(key)
+    start = np.flatnonzero(np.append(True, key[1:] != key[:-1])) if key.size else key
+    k = np.diff(np.append(start, key.size))
+    tocc = key[start] // npix
+    k = np.where(k < nbins, k, nbins)
+    h = np.bincount(tocc * (nbins+1) + k, minlength=nf*(nbins+1)).reshape(nf, nbins+1)
+    h[:,0] = npix - h[:,1:].sum(-1)
+    return h[:,:nbins]
+
+
+def evtxsvs(data, qroi, nbins=15, t_e=1., qv=None, binning=None, verbose=1):
+    """Calculate photon probabilities from events.
+
+    Time and memory scale with the number of photons instead of the number of
+    pixels times the number of frames, which is favorable for low count rates.
+
+    Args:
+        data (list): (pix, t, s) tuple of each ROI as returned by read_data with
+            method='events' (without the mean intensities in the first element),
+            i.e., pixel index in the ROI and frame of each photon and the number
+            of photons per frame.
+        qroi (list or QRoi): q-ROIs.
+        binning (list, optional): binning factors as in pyxsvs; frames are summed
+            by merging the events of b consecutive frames.
+
+    Returns:
+        dict: same content as returned by pyxsvs.
+    """
+    time0 = time()
+    lqv = len(qroi)
+
+    if qv is None:
+        qv = np.arange(lqv)
+
+    lind = [int(x) for x in (qroi.sizes if isinstance(qroi, QRoi)
+                             else [len(q[0]) for q in qroi])]
+    nf = len(data[0][2])
+    if verbose:
+        print('Number of images is:', nf)
+        print('Number of ROIs: ', lqv)
+        print('Number of photons: ', sum(len(d[0]) for d in data))
+
+    levels = [1] if binning is None else sorted(set(int(b) for b in binning if 0 < b <= nf))
+    if not len(levels):
+        raise ValueError('Binning factors must be between 1 and the number of images.')
+
+    trace = np.stack([np.asarray(d[2]) / l for d, l in zip(data, lind)], -1)
+    probl = []
+    for b in levels:
+        nfb = nf // b
+        prob = np.zeros((lqv+1,nbins+2,nfb), dtype=np.float32)
+        for qi in range(lqv):
+            pix, t, s = (np.asarray(x) for x in data[qi])
+            t = t // b
+            valid = t < nfb
+            s = s[:nfb*b].reshape(nfb, b).sum(1)
+            prob[qi+1,1] = s / lind[qi]
+            prob[qi+1,2:] = evt_histogram(pix[valid], t[valid], lind[qi], nfb, nbins).T / lind[qi]
+        prob[0,0,0] = t_e * b
+        prob[1:,0,0] = qv
+        prob[0,1:,0] = np.append(0,np.arange(nbins))
+        probl.append(prob)
+
+    if verbose:
+        print('Elapsed time: {:.2f} min'.format((time()-time0)/60.))
+
+    probd = {'prob':probl[0], 't_exposure':t_e, 'trace':trace, 'qv':qv, 'qroi':qroi,}
+    if binning is not None:
+        probd.update({'prob_binned':probl, 'binning':levels})
+
+    return probd
@@ -2,28 +2,51 @@ import numpy as np
 from time import time
 
 
-def mp_prob(method, nbins, nf, lind, nq, quc, quce):
+def mp_prob(method, nbins, nf, lind, nq, quc, quce, binning=None):
 
-    def xsvs_full(chunk):
+    def xsvs_full(chunk, prob, t0):
         for qi in xnq:
             roi = chunk[qi]
-            for i,line in enumerate(roi):
-                tmp = np.append(np.sum(line), np.histogram(line, bins=np.arange(nbins+1)-0.5)[0])
-                prob[qi,:,t0+i] = tmp / lind[qi]
+            n = roi.shape[0]
+            prob[qi,0,t0:t0+n] = roi.sum(-1) / lind[qi]
+            prob[qi,1:,t0:t0+n] = histogram(roi).T / lind[qi]
+
+    def histogram(roi):
+        """Photon count histograms (nframes, nbins) of all frames of a ROI
+        (nframes, npixels) with one bincount. Counts outside 0 to nbins-1
+        are collected in an overflow bin which is dropped.
+        """
+        n = roi.shape[0]
+        k = np.floor(roi + .5) if roi.dtype.kind == 'f' else roi
+        k = np.where((k >= 0) & (k < nbins), k, nbins).astype(np.intp)
+        k += offset[:n,None]
+        h = np.bincount(k.ravel(), minlength=n*(nbins+1))
+        return h.reshape(n, nbins+1)[:,:nbins]
 
     tcalc = time()
     xnq = range(nq)
-    prob = np.zeros((nq,nbins+1,nf), dtype=np.float32)
+    # one probability array per binning level; the chunks of summed frames
+    # of all levels arrive in the same message
+    levels = (1,) if binning is None else binning
+    nfl = [nf // b for b in levels]
+    prob = [np.zeros((nq,nbins+1,n), dtype=np.float32) for n in nfl]
+    offset = np.zeros(0, dtype=np.intp)
 
-    t0 = 0
-    while t0 < nf:
+    t0 = [0] * len(levels)
+    while any(t < n for t, n in zip(t0, nfl)):
         chunk = quc.get()
-        chunk_size = chunk[0].shape[0]
-        xsvs_full(chunk)
-        t0 += chunk_size
+        if binning is None:
+            chunk = [chunk]
+        for l, lchunk in enumerate(chunk):
+            chunk_size = lchunk[0].shape[0]
+            if offset.size < chunk_size:
+                # offset of the histogram of each frame in the bincount
+                offset = np.arange(chunk_size, dtype=np.intp) * (nbins+1)
+            xsvs_full(lchunk, prob[l], t0[l])
+            t0[l] += chunk_size
 
     # END OF MAIN LOOP put results to output queue
     quc.close()
     quc.join_thread()
     tcalc = time() - tcalc
-    quce.put([prob, tcalc])
+    quce.put([prob[0] if binning is None else prob, tcalc])
@@ -4,12 +4,22 @@ import pickle as pkl
 from multiprocessing import Process, Queue
 from .mp_prob import mp_prob
 from ..misc.progressbar import progress
+from ..misc.qroi import QRoi, section_qroi
 import sys
 
 
 def pyxsvs( data, qroi, nbins=15, t_e=1., qv=None, method='full', nprocs=1,
-            verbose=1, qsec=(0,0)):
+            verbose=1, qsec=(0,0), binning=None):
     """Calculate photon proababilities.
+
+    The data can also be chunks of shape (nframes, number of ROI pixels) as read
+    by read_data with output='roi', i.e., the pixels of the qrois one after another.
+
+    With a list of binning factors, e.g., binning=(1, 2, 4, 8), consecutive frames
+    are summed on the fly and the probabilities of every binning level are
+    calculated in the same pass. They are returned as list prob_binned with one
+    prob array per effective exposure time t_e * b; prob is the one of the
+    smallest binning factor.
     """
     time0 = time()
     lqv = len(qroi)
@@ -19,25 +29,41 @@ def pyxsvs( data, qroi, nbins=15, t_e=1., qv=None, method='full', nprocs=1,
         qv = np.arange(lqv)
 
     if isinstance(data, np.ndarray):
-        nf, dim2, dim1 = np.shape(data)
+        nf = data.shape[0]
         def get_chunk():
-            return data
+            return 0, data
     elif isinstance(data, dict):
         nf = data['nimages']
         def get_chunk():
             return data['dataQ'].get()
 
+    if binning is not None:
+        binning = sorted(set(int(b) for b in binning if 0 < b <= nf))
+        if not len(binning):
+            raise ValueError('Binning factors must be between 1 and the number of images.')
+        # frames of each level and ROI that are left over from the last chunk
+        rest = [[None] * lqv for _ in binning]
+
+    def sum_frames(roi, level, qi):
+        b = binning[level]
+        if b == 1:
+            return roi
+        if rest[level][qi] is not None:
+            roi = np.concatenate((rest[level][qi], roi))
+        n = roi.shape[0] // b
+        rest[level][qi] = roi[n*b:]
+        return roi[:n*b].reshape(n, b, roi.shape[1]).sum(1)
+
     if verbose:
         print('Number of images is:', nf)
         print('Loading data in chunks.')
         print('Number of ROIs: ', lqv)
 
-    lind = []
-    total_pixels = 0
-    for iq in rlqv:
-        npixel = len(qroi[iq][0])
-        lind.append(npixel)
-        total_pixels += npixel
+    lind = [int(x) for x in (qroi.sizes if isinstance(qroi, QRoi)
+                             else [len(q[0]) for q in qroi])]
+    total_pixels = sum(lind)
+    roi_offsets = np.cumsum([0] + lind)
+    sec_roi = None
 
     nprocs = min(nprocs,lqv) # cannot use more processes than q-values
     tmp_pix = 0
@@ -73,7 +99,7 @@ def pyxsvs( data, qroi, nbins=15, t_e=1., qv=None, method='full', nprocs=1,
         q_beg = q_sec[i]
         q_end = q_sec[i+1]
         pcorr.append(Process(target=mp_prob, args=(method, nbins, nf,
-                lind[q_beg:q_end], q_end-q_beg, qur[i], qure[i])))
+                lind[q_beg:q_end], q_end-q_beg, qur[i], qure[i], binning)))
 
     # start processes
     for i in range(nprocs):
@@ -97,14 +123,27 @@ def pyxsvs( data, qroi, nbins=15, t_e=1., qv=None, method='full', nprocs=1,
                              chunk_diff)
         last_chunk = c_idx
 
+        if chunk.ndim == 3:
+            if sec_roi is None:
+                # qrois as flat indices in the image section
+                sec_roi = section_qroi(qroi, qsec, chunk.shape[1:])
+            chunk = chunk.reshape(chunk_size, -1)
+
         for jj,(i,j) in enumerate(zip(q_sec[:-1], q_sec[1:])):
             tmp_put = []
             for qi in range(i,j):
-                q0 = qroi[qi][0] - qsec[0]
-                q1 = qroi[qi][1] - qsec[1]
-                roi = chunk[:,q0,q1]
+                if sec_roi is None:
+                    roi = chunk[:,roi_offsets[qi]:roi_offsets[qi+1]]
+                else:
+                    roi = chunk[:,sec_roi.flat(qi)]
                 trace[idx,qi] = roi.mean(-1)
                 tmp_put.append(roi)
+            if binning is not None:
+                tmp_put = [[sum_frames(roi, l, qi) for qi, roi in zip(range(i,j), tmp_put)]
+                           for l in range(len(binning))]
+                if not any(x[0].shape[0] for x in tmp_put):
+                    # no binning level is complete in this chunk
+                    continue
             qur[jj].put(tmp_put)
 
         t0 += chunk_size
@@ -120,18 +159,23 @@ def pyxsvs( data, qroi, nbins=15, t_e=1., qv=None, method='full', nprocs=1,
         qure[i].join_thread()
 
     # concatenate data from different processes
-    p = from_proc[0][0]
-    tcalc_cum = from_proc[0][1]
-    for i in range(1,nprocs):
-        p = np.concatenate((p,from_proc[i][0]), axis=0)
-        tcalc_cum = max(tcalc_cum,from_proc[i][1])
-
-    # initialize correlation array 'cc'
-    prob = np.zeros((lqv+1,nbins+2,nf), dtype=np.float32)
-    prob[1:,1:] = p
-    prob[0,0,0] = t_e
-    prob[1:,0,0] = qv
-    prob[0,1:,0] = np.append(0,np.arange(nbins))
+    tcalc_cum = max(x[1] for x in from_proc)
+    if binning is None:
+        p = [np.concatenate([x[0] for x in from_proc], axis=0)]
+    else:
+        p = [np.concatenate([x[0][l] for x in from_proc], axis=0)
+             for l in range(len(binning))]
+
+    # initialize probability arrays with t_e, qv and photon counts as header
+    probl = []
+    for l, pl in enumerate(p):
+        prob = np.zeros((lqv+1,nbins+2,pl.shape[-1]), dtype=np.float32)
+        prob[1:,1:] = pl
+        prob[0,0,0] = t_e * (1 if binning is None else binning[l])
+        prob[1:,0,0] = qv
+        prob[0,1:,0] = np.append(0,np.arange(nbins))
+        probl.append(prob)
+    prob = probl[0]
 
     if verbose:
         print("\rFinished calculating correlation functions.") 
@@ -143,6 +187,8 @@ def pyxsvs( data, qroi, nbins=15, t_e=1., qv=None, method='full', nprocs=1,
         print('Elapsed time for calulating probabilities: {:.2f} min'.format(tcalc_cum/60.))
 
     probd = {'prob':prob, 't_exposure':t_e, 'trace':trace, 'qv':qv, 'qroi':qroi,}
+    if binning is not None:
+        probd.update({'prob_binned':probl, 'binning':binning})
 
     return probd
 
@@ -0,0 +1,129 @@
+import numpy as np
+
+
+class QRoi:
+    """Compact representation of q-ROIs.
+
+    The pixels of all ROIs are stored as flat uint32 indices into an image of
+    the given shape, one ROI after another. The pixels of ROI i are
+    :code:`index[offsets[i]:offsets[i+1]]`. A uint16 label image (0 is the
+    background, ROI i has label i+1) is created on demand and is not pickled.
+
+    The object behaves like the list of :code:`np.where` tuples used before:
+    :code:`len(qroi)` is the number of ROIs and :code:`qroi[i]` returns the
+    tuple of row and column indices of ROI i.
+    """
+
+    def __init__(self, index, offsets, shape):
+        self.shape = tuple(int(x) for x in shape) #: tuple: shape of the image.
+        self.index = np.ascontiguousarray(index, dtype=np.uint32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self._labels = None
+
+    @classmethod
+    def from_tuples(cls, rois, shape):
+        """Create a QRoi from a list of (rows, columns) tuples.
+        """
+        if isinstance(rois, QRoi):
+            return rois.crop(((0, 0), (shape[0]-1, shape[1]-1)))
+        index = [np.ravel_multi_index(tuple(np.asarray(x) for x in q), shape) for q in rois]
+        offsets = np.cumsum([0] + [x.size for x in index])
+        index = np.concatenate(index) if len(index) else []
+        return cls(index, offsets, shape)
+
+    @classmethod
+    def from_labels(cls, labels):
+        """Create a QRoi from a label image (0 is the background).
+        """
+        labels = np.asarray(labels)
+        flat = labels.ravel()
+        index = np.flatnonzero(flat)
+        lab = flat[index]
+        order = np.argsort(lab, kind='stable')
+        counts = np.bincount(lab, minlength=lab.max()+1 if lab.size else 1)[1:]
+        return cls(index[order], np.cumsum(np.append(0, counts)), labels.shape)
+
+    def __len__(self):
+        return self.offsets.size - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('q-ROI index out of range.')
+        return np.unravel_index(self.flat(i), self.shape)
+
+    def __iter__(self):
+        return iter(self.to_tuples())
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_labels'] = None
+        return state
+
+    def __repr__(self):
+        return 'QRoi(nroi={}, npixel={}, shape={})'.format(len(self), self.index.size,
+                                                            self.shape)
+
+    @property
+    def sizes(self):
+        """Number of pixels per ROI."""
+        return np.diff(self.offsets)
+
+    @property
+    def labels(self):
+        """uint16 label image; overlapping pixels carry the label of the last ROI."""
+        if self._labels is None:
+            if len(self) >= np.iinfo(np.uint16).max:
+                raise ValueError('Too many q-ROIs for a uint16 label image.')
+            labels = np.zeros(np.prod(self.shape), dtype=np.uint16)
+            labels[self.index] = np.repeat(np.arange(1, len(self)+1, dtype=np.uint16),
+                                           self.sizes)
+            self._labels = labels.reshape(self.shape)
+        return self._labels
+
+    def flat(self, i):
+        """Flat pixel indices of ROI i."""
+        return self.index[self.offsets[i]:self.offsets[i+1]]
+
+    def to_tuples(self):
+        """Return the list of (rows, columns) tuples.
+        """
+        rows, cols = np.divmod(self.index.astype(np.intp), self.shape[1])
+        return [(rows[b:e], cols[b:e]) for b, e in zip(self.offsets[:-1], self.offsets[1:])]
+
+    def bbox(self):
+        """Smallest section ((row_min, col_min), (row_max, col_max)) with all pixels.
+        """
+        rows, cols = np.divmod(self.index.astype(np.intp), self.shape[1])
+        return ((rows.min(), cols.min()), (rows.max(), cols.max()))
+
+    def crop(self, qsec):
+        """Return the ROIs in a section ((row_min, col_min), (row_max, col_max))
+        of the image. Also used to change the image shape, e.g., of tiled
+        detectors.
+        """
+        (r0, c0), (r1, c1) = qsec
+        shape = (r1 - r0 + 1, c1 - c0 + 1)
+        rows, cols = np.divmod(self.index.astype(np.int64), self.shape[1])
+        rows -= r0
+        cols -= c0
+        if rows.size and (rows.min() < 0 or cols.min() < 0 or rows.max() >= shape[0]
+                          or cols.max() >= shape[1]):
+            raise ValueError('q-ROIs exceed the section {}.'.format(qsec))
+        return QRoi(rows * shape[1] + cols, self.offsets, shape)
+
+
+def section_qroi(qroi, origin, dim):
+    """Return qroi (QRoi or list of (rows, columns) tuples in detector
+    coordinates) as QRoi in the section of shape dim that starts at origin
+    (row, column).
+    """
+    dim = tuple(dim)
+    if isinstance(qroi, QRoi):
+        return qroi.crop(((origin[0], origin[1]),
+                          (origin[0] + dim[0] - 1, origin[1] + dim[1] - 1)))
+    return QRoi.from_tuples([(np.asarray(q[0]) - origin[0], np.asarray(q[1]) - origin[1])
+                             for q in qroi], dim)
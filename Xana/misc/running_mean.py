@@ -32,3 +32,83 @@ def runavr(x):
             Si = out[i-1,2] + (x[i] - out[i-1,0])*(x[i] - out[i,0])
             out[i,:] = (Mi,np.sqrt(Si/i**2),Si)
     return out
+
+
+class RunningStats:
+    """Streaming statistics of an image series along the first axis.
+
+    Mean and variance are updated in float64 chunk by chunk with the parallel
+    algorithm of Chan et al. Frames can be weighted individually and the
+    statistics of chunks read by different processes can be combined with
+    :code:`merge`.
+    """
+
+    def __init__(self):
+        self.count = 0 #: int: number of frames.
+        self.weight = 0. #: float: sum of the frame weights.
+        self.mean = None
+        self.m2 = None
+        self.min = None
+        self.max = None
+
+    def update(self, chunk, weights=None):
+        """Add a chunk of frames with optional weights per frame. Chunks with
+        zero total weight are skipped.
+        """
+        n = chunk.shape[0]
+        if n == 0:
+            return self
+        if weights is None:
+            w = float(n)
+            mean = chunk.mean(0, dtype=np.float64)
+            m2 = chunk.var(0, dtype=np.float64)
+            m2 *= n
+        else:
+            weights = np.asarray(weights, dtype=np.float64)
+            w = weights.sum()
+            if w == 0:
+                # frames without weight do not contribute
+                return self
+            mean = np.tensordot(weights, chunk, axes=(0, 0)) / w
+            dev = chunk - mean
+            dev *= dev
+            m2 = np.tensordot(weights, dev, axes=(0, 0))
+        self._combine(n, w, mean, m2, chunk.min(0), chunk.max(0))
+        return self
+
+    def merge(self, other):
+        """Merge the statistics of another RunningStats instance.
+        """
+        if other.count:
+            self._combine(other.count, other.weight, other.mean, other.m2,
+                          other.min, other.max)
+        return self
+
+    def _combine(self, n, w, mean, m2, cmin, cmax):
+
+        if self.count == 0:
+            self.count = n
+            self.weight = w
+            self.mean = np.array(mean, dtype=np.float64)
+            self.m2 = np.array(m2, dtype=np.float64)
+            self.min = np.array(cmin, dtype=np.float64)
+            self.max = np.array(cmax, dtype=np.float64)
+            return
+
+        wt = self.weight + w
+        delta = mean - self.mean
+        self.mean += delta * (w / wt)
+        delta *= delta
+        delta *= self.weight * w / wt
+        self.m2 += m2
+        self.m2 += delta
+        np.minimum(self.min, cmin, out=self.min)
+        np.maximum(self.max, cmax, out=self.max)
+        self.count += n
+        self.weight = wt
+
+    def variance(self, ddof=0):
+        """Return the pixel variance. Use ddof=1 for the unbiased estimate of
+        unweighted data.
+        """
+        return self.m2 / (self.weight - ddof)
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def edf_series(tmp_path):
+    """Two multi image edf files with five uint16 frames (6, 7) each.
+
+    Returns:
+        tuple: file names and frames.
+    """
+    nfiles, nf, shape = 2, 5, (6, 7)
+    rng = np.random.default_rng(10)
+    data = rng.integers(0, 1000, (nfiles*nf, *shape)).astype(np.uint16)
+    files = []
+    for i in range(nfiles):
+        filename = str(tmp_path / 'multi_{}.edf'.format(i))
+        with open(filename, 'wb') as f:
+            for j, img in enumerate(data[i*nf:(i+1)*nf]):
+                header = ('{{\nHeaderID = EH:{:06d}:000000:000000 ;\nImage = {} ;\n'
+                          'ByteOrder = LowByteFirst ;\nDataType = UnsignedShort ;\n'
+                          'Dim_1 = {} ;\nDim_2 = {} ;\nSize = {} ;\nframe = {} ;\n').format(
+                              j+1, j+1, shape[1], shape[0], img.astype('<u2').nbytes, j)
+                f.write((header.ljust(510) + '}\n').encode())
+                f.write(img.astype('<u2').tobytes())
+        files.append(filename)
+    return files, data
@@ -0,0 +1,32 @@
+import numpy as np
+from Xana.ProcData.ArrangeModules import (arrange_cspad_tiles, cspad_index,
+                                          cspad_tile_geometry, gather_cspad_roi)
+
+
+def loop_arrange(img):
+    """Arrange the tiles of one image tile by tile."""
+    slices, isTran, isLR, isUD = cspad_tile_geometry()
+    out = np.zeros((1800, 1800), img.dtype)
+    for i, tile in enumerate(img):
+        if isTran[i]:
+            tile = tile.T
+        if isLR[i]:
+            tile = np.fliplr(tile)
+        if isUD[i]:
+            tile = np.flipud(tile)
+        out[slices[i]] = tile
+    return out
+
+
+def test_arrange_cspad_tiles():
+    rng = np.random.default_rng(9)
+    data = rng.uniform(1, 2, (2, 32, 185, 388)).astype(np.float32)
+    img = arrange_cspad_tiles(data)
+    for i in range(2):
+        np.testing.assert_array_equal(img[i], loop_arrange(data[i]))
+    index, inverse, gaps = cspad_index()
+    np.testing.assert_array_equal(gaps, img[0].ravel() == 0)
+    np.testing.assert_array_equal(img.reshape(2, -1)[:, inverse], data.reshape(2, -1)
+                                  [:, index[inverse]])
+    roi = np.unravel_index(np.arange(0, 1800*1800, 997), (1800, 1800))
+    np.testing.assert_array_equal(gather_cspad_roi(data, roi), img[:, roi[0], roi[1]])
@@ -0,0 +1,17 @@
+import numpy as np
+from scipy import stats
+from Xana.ProcData.H5Methods import common_mode, common_mode_from_hist
+
+
+def test_common_mode():
+    rng = np.random.default_rng(11)
+    offsets = rng.integers(-20, 20, (3, 5))
+    arr = rng.normal(offsets[..., None, None] + .5, 3., (3, 5, 18, 20))
+    arr[..., :3, :] += 100. # photons
+    cm = common_mode(arr, block=4)
+    assert cm.shape == (3, 5)
+    ref = [common_mode_from_hist(t) for t in arr.reshape(-1, 18, 20)]
+    np.testing.assert_array_equal(cm.ravel(), ref)
+    np.testing.assert_allclose(common_mode(arr, 'median'), np.median(arr, (-2, -1)))
+    np.testing.assert_allclose(common_mode(arr, 'trimmed').ravel(),
+                               [stats.trim_mean(t.ravel(), .1) for t in arr.reshape(-1, 18, 20)])
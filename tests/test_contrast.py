@@ -0,0 +1,56 @@
+import numpy as np
+from Xana.XsvsAna.contrast import ratio_beta, frame_beta, beta_stats
+
+
+def beta_loop(kv, kb, prob):
+    # the former betaratio loop over photon counts, per frame
+    beta = np.full((kv.size-1, kb.size), np.nan)
+    for i, ki in enumerate(kv[:-1]):
+        for f in range(kb.size):
+            p1, p2 = prob[i, f], prob[i+1, f]
+            if p2 == 0 or kb[f] == 0 or (i+2 < kv.size and prob[i+2, f] == 0):
+                continue
+            a = p1 / p2
+            beta[i, f] = (a*kb[f] - (ki + 1.)) / kb[f] / (1. + (1.-a) * ki)
+    return beta
+
+
+def make_prob(rng, nq=3, nbins=6, nf=40):
+    prob = np.zeros((nq+1, nbins+2, nf), dtype=np.float32)
+    prob[0, 2:, 0] = np.arange(nbins)
+    prob[1:, 1] = rng.uniform(.05, .5, (nq, nf))
+    prob[1:, 1, :3] = 0
+    p = rng.uniform(0, 1, (nq, nbins, nf)) * .5**np.arange(nbins)[:, None]
+    p[rng.uniform(size=p.shape) < .1] = 0
+    prob[1:, 2:] = p
+    return prob
+
+
+def test_ratio_beta():
+    rng = np.random.default_rng(9)
+    prob = make_prob(rng)
+    kv = prob[0, 2:, 0]
+    beta = frame_beta(prob, chunk_size=7)
+    for iq in range(3):
+        kb = prob[iq+1, 1].astype(float)
+        ref = beta_loop(kv, kb, prob[iq+1, 2:])
+        np.testing.assert_allclose(ratio_beta(kv, kb, prob[iq+1, 2:]), ref, rtol=1e-6)
+        np.testing.assert_allclose(beta[iq, 1:], ref, rtol=1e-5)
+        np.testing.assert_array_equal(beta[iq, 0], prob[iq+1, 1])
+
+
+def test_beta_stats():
+    rng = np.random.default_rng(10)
+    beta = rng.normal(.3, 1., (2, 3, 500))
+    beta[beta > 7.9] = np.nan
+    beta[0, 1] = np.nan
+    mean, std, median, mode = beta_stats(beta, bins=50, range=(-2, 8))
+    for idx in np.ndindex(beta.shape[:-1]):
+        b = beta[idx][np.isfinite(beta[idx])]
+        if not b.size:
+            assert np.isnan([mean[idx], std[idx], median[idx], mode[idx]]).all()
+            continue
+        np.testing.assert_allclose([mean[idx], std[idx], median[idx]],
+                                   [b.mean(), b.std(), np.median(b)])
+        h, e = np.histogram(b, bins=50, range=(-2, 8))
+        np.testing.assert_allclose(mode[idx], e[np.argmax(h)] + (e[1] - e[0]) / 2)
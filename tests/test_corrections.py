@@ -0,0 +1,23 @@
+import numpy as np
+from Xana.ProcData.Corrections import CorrectionPipeline
+
+
+def test_tile_maps():
+    rng = np.random.default_rng(4)
+    arr = rng.uniform(0, 10, (3, 4, 5, 6)).astype(np.float32)
+    dark = rng.uniform(0, 1, (4, 5, 6))
+    gain = rng.uniform(1, 2, (4, 5, 6))
+    out = CorrectionPipeline(dark, gain)(arr.copy())
+    np.testing.assert_allclose(out, (arr - dark) / gain, rtol=1e-5)
+
+
+def test_cell_maps():
+    rng = np.random.default_rng(5)
+    arr = rng.uniform(0, 10, (4, 5, 6)).astype(np.float32)
+    dark = rng.uniform(0, 1, (2, 5, 6))
+    cells = np.array([0, 1, 1, 0])
+    out = CorrectionPipeline(dark)(arr.copy(), cells)
+    np.testing.assert_allclose(out, arr - dark[cells], rtol=1e-5)
+    # tiled frames with maps per cell
+    out = CorrectionPipeline(dark[:, None], per_cell=True)(arr[:, None].copy(), cells)
+    np.testing.assert_allclose(out[:, 0], arr - dark[cells], rtol=1e-5)
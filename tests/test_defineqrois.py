@@ -0,0 +1,37 @@
+import numpy as np
+from Xana.Setup import Setup
+from Xana.SaxsAna.defineqrois import getqroi
+
+
+def loop_qroi(setup, qr, phir, mirror=False):
+    """q-ROIs with one mask per ring and sector."""
+    geom = setup.geometry()
+    q, phi = geom['q'], geom['chi']
+    mask = setup.mask.astype(bool)
+    ind = []
+    for qi, dq in qr:
+        for p0, dp in np.deg2rad(phir):
+            phit = (phi - p0) % (2*np.pi)
+            inphi = phit <= dp
+            if mirror:
+                inphi |= ((phit - np.pi) % (2*np.pi)) <= dp
+            roi = np.where((q >= qi - dq/2) & (q <= qi + dq/2) & inphi & mask)
+            if len(roi[0]):
+                ind.append(roi)
+    return ind
+
+
+def test_getqroi_sectors(tmp_path):
+    setup = Setup('eiger500k')
+    setup.cachedir = str(tmp_path)
+    setup.make(center=(500, 200), distance=5., wavelength=1.5)
+    qr = np.array([[0.05, 0.02], [0.08, 0.02], [0.2, 0.05]])
+    # disjoint and overlapping sectors (start, width in degree)
+    for phir in (np.array([[-20., 40.], [70., 40.], [160., 60.]]),
+                 np.array([[-20., 60.], [10., 60.], [100., 200.]])):
+        for mirror in (False, True):
+            qroi = getqroi(None, setup, qr, phir=phir.copy(), mirror=mirror)[0]
+            ref = loop_qroi(setup, qr, phir, mirror)
+            assert len(qroi) == len(ref)
+            for a, b in zip(qroi, ref):
+                np.testing.assert_array_equal(a, b)
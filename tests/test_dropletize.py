@@ -0,0 +1,28 @@
+import numpy as np
+from Xana.Xdrop.DropletizeData import dropletize
+
+pars = {'background': 5., 'adusPphoton': 10., 'lower_threshold': 0.,
+        'upper_threshold': np.inf, 'pixelPdroplet': 100}
+
+
+def test_droplet_photons():
+    img = np.zeros((1, 6, 6), np.float32)
+    img[0, 1, 1:3] = [14, 13]
+    img[0, 4, 4] = 3000.
+    out = dropletize(img, pars)
+    assert out.dtype == np.uint16
+    assert out[0, 1, 1:3].sum() == 3
+    assert out[0, 4, 4] == 300
+
+
+def test_tiles_mask_dark():
+    rng = np.random.default_rng(8)
+    data = rng.poisson(.3, (3, 4, 8, 9)).astype(np.float32) * 10
+    data += rng.normal(0, 1, data.shape)
+    dark = rng.uniform(0, 2, data.shape[1:])
+    mask = rng.uniform(size=data.shape[1:]) > .1
+    out = dropletize(data, pars, mask=mask, dark=dark)
+    assert out.shape == data.shape
+    for t in range(data.shape[1]):
+        ref = dropletize(data[:, t], pars, mask=mask[t], dark=dark[t])
+        np.testing.assert_array_equal(out[:, t], ref)
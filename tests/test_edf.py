@@ -0,0 +1,17 @@
+import numpy as np
+from Xana.ProcData.EdfFile3 import EdfFile
+from Xana.ProcData.EdfMethods import headeredf
+
+
+def test_lazy_edf(edf_series):
+    files, data = edf_series
+    eager = EdfFile(files[1])
+    lazy = EdfFile(files[1], lazy=True)
+    assert lazy.GetNumImages() == eager.GetNumImages() == 5
+    for i in (3, 0, 4):
+        np.testing.assert_array_equal(lazy.GetData(i), data[5+i])
+        assert lazy.GetHeader(i) == eager.GetHeader(i)
+        assert lazy.GetStaticHeader(i) == eager.GetStaticHeader(i)
+    assert headeredf(files[1], 2)['frame'] == '2'
+    lazy.close()
+    eager.close()
@@ -0,0 +1,67 @@
+import numpy as np
+from scipy.optimize import least_squares
+from Xana.Xfit.g2batch import kww_names, kww_model, fit_kww
+
+
+def kww_ref(x, a, beta, modes):
+    # modes: list of (t, g, b) with b of the first mode from the constraint
+    b0 = beta if len(modes) == 1 else a + beta - 1 - sum(m[2] for m in modes[1:])
+    return a + sum(b * np.exp(-2 * (x/t)**g)
+                   for t, g, b in [(modes[0][0], modes[0][1], b0)] + list(modes[1:]))
+
+
+def test_kww_model():
+    x = np.tile(np.logspace(-3, 2, 20), (2, 1))
+    p = np.array([[1.01, .3, .02, .8, 5., 1.2, .1],
+                  [.99, .25, .5, 1.5, 40., .7, .05]])
+    model, jac = kww_model(x, p, 2)
+    for c in range(2):
+        a, beta, t0, g0, t1, g1, b1 = p[c]
+        np.testing.assert_allclose(model[c], kww_ref(x[c], a, beta, [(t0, g0), (t1, g1, b1)]))
+    eps = 1e-7
+    for i in range(p.shape[1]):
+        dp = np.zeros_like(p)
+        dp[:, i] = eps * np.abs(p[:, i])
+        num = (kww_model(x, p + dp, 2)[0] - kww_model(x, p - dp, 2)[0]) / (2 * dp[:, i, None])
+        np.testing.assert_allclose(jac[..., i], num, rtol=1e-5, atol=1e-6)
+
+
+def test_fit_kww():
+    rng = np.random.default_rng(16)
+    t = np.logspace(-3, 2, 40)
+    truth = [(1., .3, [(.05, 1., 0), (3., .8, .1)]),
+             (1.02, .25, [(.2, 1.3, 0), (20., 1., .08)])]
+    cf = np.ma.array([kww_ref(t, a, beta, modes) for a, beta, modes in truth])
+    cf += rng.normal(0, 2e-3, cf.shape)
+    cf[0, 5] = np.ma.masked
+    err = np.full(cf.shape, 2e-3)
+    wgt = np.ma.array(1 / err)
+    init = {'a': (1., .9, 1.1), 'beta': (.3, 0, 1), 't0': (.1, 1e-4, 1e3),
+            'g0': (1., .2, 2.), 't1': (1., 1e-4, 1e3), 'g1': (1., .2, 2.),
+            'b1': (.05, 0, 1)}
+    names = kww_names(2)
+    values, stderr, gof, success = fit_kww(t, cf, wgt, 2, init)
+    assert success.all()
+    for c in range(2):
+        sel = ~np.ma.getmaskarray(cf[c])
+
+        def res(v):
+            a, beta, t0, g0, t1, g1, b1 = v
+            return (cf[c][sel] - kww_ref(t[sel], a, beta, [(t0, g0), (t1, g1, b1)])) / err[c][sel]
+
+        p0 = [values[n][c] * (1.05 if n.startswith('t') else 1.) for n in names]
+        ref = least_squares(res, p0, bounds=([init[n][1] for n in names],
+                                             [init[n][2] for n in names]),
+                            xtol=1e-14, ftol=1e-14, gtol=1e-14)
+        chisqr = (ref.fun**2).sum()
+        np.testing.assert_allclose(gof[c, 0], chisqr, rtol=1e-6)
+        np.testing.assert_allclose([values[n][c] for n in names], ref.x, rtol=1e-4)
+        redchi = chisqr / (sel.sum() - len(names))
+        np.testing.assert_allclose(gof[c, 1], redchi, rtol=1e-6)
+        dp = np.sqrt(np.diag(np.linalg.inv(ref.jac.T @ ref.jac)) * redchi)
+        np.testing.assert_allclose([stderr[n][c] for n in names], dp, rtol=1e-2)
+    # one mode with a fixed baseline
+    init1 = {k: init[k] for k in kww_names(1)}
+    values, stderr, gof, success = fit_kww(t, cf[:1], wgt[:1], 1, init1, fix={'a': 1.})
+    assert values['a'][0] == 1. and np.isnan(stderr['a'][0])
+    np.testing.assert_allclose(values['b0'], values['beta'])
@@ -0,0 +1,35 @@
+import numpy as np
+from pyFAI.azimuthalIntegrator import AzimuthalIntegrator
+from Xana.Setup import Setup
+from Xana.Geometry import geometry_key, get_geometry
+from Xana.SaxsAna.pysaxs3 import get_soq
+
+
+def make_setup(tmp_path):
+    setup = Setup('eiger500k')
+    setup.cachedir = str(tmp_path)
+    setup.make(center=(500, 200), distance=5., wavelength=1.5)
+    return setup
+
+
+def test_geometry_key_ai(tmp_path):
+    setup = make_setup(tmp_path)
+    key = geometry_key(setup)
+    q = get_geometry(setup)['q']
+    ai = AzimuthalIntegrator(detector=setup.detector)
+    ai.setFit2D(5000., 500, 200, tilt=2., tiltPlanRotation=30.)
+    ai.wavelength = 1.5e-10
+    setup.ai = ai
+    assert geometry_key(setup) != key
+    np.testing.assert_allclose(get_geometry(setup)['q'], ai.array_from_unit(unit='q_nm^-1'))
+    assert not np.allclose(get_geometry(setup)['q'], q)
+
+
+def test_soq_pyfai_default(tmp_path):
+    setup = make_setup(tmp_path)
+    img = np.random.default_rng(6).uniform(1, 2, setup.detector.shape)
+    q, ii, e = get_soq(img, setup)
+    ref = setup.ai.integrate1d(img, 1000, mask=~(setup.mask.astype(bool)),
+                               unit='q_nm^-1', error_model='poisson')
+    np.testing.assert_allclose(q, ref[0])
+    np.testing.assert_allclose(ii, ref[1])
@@ -0,0 +1,82 @@
+import numpy as np
+from scipy.optimize import minimize_scalar
+from scipy.special import gamma
+from Xana.Xfit.PoissonGammaDistribution import PoissonGamma
+from Xana.Xfit.FitPoissonGammaLikelihood import ml_contrast
+from Xana.Xfit.FitPoissonGamma import fit_pg, fit_pg_batch
+
+
+def simulate_prob(rng, M, kb, nf, npix, nbins=12):
+    # (nq+1, nbins+2, nf) as returned by pyxsvs
+    prob = np.zeros((len(M)+1, nbins+2, nf), dtype=np.float32)
+    for qi, (m, n) in enumerate(zip(M, npix)):
+        k = rng.negative_binomial(m, m/(m+kb), (nf, n))
+        prob[qi+1, 1] = k.mean(-1)
+        prob[qi+1, 2:] = np.stack([np.bincount(x, minlength=nbins)[:nbins] for x in k], -1) / n
+    return prob
+
+
+def loglik(M, P, kb, kv):
+    # log-likelihood per pixel summed over frames
+    pg = PoissonGamma(kv[:, None], M, kb[None], ind_var='k')
+    return (P * np.log(pg)).sum()
+
+
+def test_ml_contrast():
+    rng = np.random.default_rng(8)
+    npix = [400, 900]
+    prob = [simulate_prob(rng, [3., 8.], kb, 6, npix) for kb in (.2, .9)]
+    res = ml_contrast(prob, npix)
+    kv = np.arange(12)
+    for it, pr in enumerate(prob):
+        for iq in range(2):
+            P = pr[iq+1, 2:].astype(float)
+            kb = pr[iq+1, 1].astype(float)
+            ref = minimize_scalar(lambda u: -loglik(np.exp(u), P, kb, kv),
+                                  bounds=(-3, 8), method='bounded',
+                                  options={'xatol': 1e-10})
+            np.testing.assert_allclose(res['M'][it, iq], np.exp(ref.x), rtol=1e-4)
+            entropy = (P[P > 0] * np.log(P[P > 0])).sum()
+            dev = -2 * npix[iq] * (loglik(res['M'][it, iq], P, kb, kv) - entropy)
+            np.testing.assert_allclose(res['deviance'][it, iq], dev, rtol=1e-6)
+    np.testing.assert_allclose(res['beta'], 1/res['M'])
+    # fixed M
+    res = ml_contrast(prob, npix, fix={'M': 5.})
+    assert np.all(res['M'] == 5.)
+
+
+def test_poisson_gamma():
+    k = np.arange(10.)
+    for M, kb in [(1., .3), (4.5, 2.)]:
+        ref = gamma(k+M)/(gamma(M)*gamma(k+1.))*(kb/(M+kb))**k*(M/(kb+M))**M
+        np.testing.assert_allclose(PoissonGamma(k, M, kb, ind_var='k'), ref, rtol=1e-10)
+    assert np.isfinite(PoissonGamma(np.array([300.]), 200., 250., ind_var='k')).all()
+
+
+def pg_curves(rng, M, nk=5, nx=8):
+    # fit_pg layout: k in column 0 of rows 2:, kb in row 1
+    kb = np.sort(rng.uniform(.05, 1.5, nx))
+    kb[0] = 0
+    k = np.arange(nk)
+    prob = np.zeros((nk+2, nx))
+    prob[1] = kb
+    prob[2:] = PoissonGamma(k[:, None], M, kb[None], ind_var='k') * rng.normal(1, .03, (nk, nx))
+    prob[2:, 0] = k
+    return prob
+
+
+def test_fit_pg_batch():
+    rng = np.random.default_rng(11)
+    probs = [pg_curves(rng, M) for M in (.8, 2., 6.)]
+    err = [rng.uniform(.01, .05, pr[2:].shape) for pr in probs]
+    for logscale, errs in [(False, None), (False, err), (True, None)]:
+        pars, gof = fit_pg_batch(probs, err=errs, logscale=logscale)
+        for c, pr in enumerate(probs):
+            ref = fit_pg(pr, err=None if errs is None else errs[c], init={},
+                         logscale=logscale)
+            np.testing.assert_allclose(pars[c, 0, 0], ref[0][0, 0], rtol=1e-4)
+            np.testing.assert_allclose(pars[c, 0, 1], ref[0][0, 1], rtol=1e-2)
+            np.testing.assert_allclose(gof[c], ref[1], rtol=1e-5)
+            single = fit_pg(pr, err=None if errs is None else errs[c], init={},
+                            logscale=logscale, method='batch')
+            np.testing.assert_allclose(single[0], pars[c], rtol=1e-6)
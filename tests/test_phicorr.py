@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+import numpy as np
+from Xana.SaxsAna.phicorr import Cake, angular_correlation, anisotropy
+
+
+def fake_setup(shape=(30, 40)):
+    rng = np.random.default_rng(12)
+    # off-grid center: no pixel on a bin edge
+    rows, cols = np.indices(shape) - np.array([10.3, 12.6])[:, None, None]
+    geom = {'q': np.hypot(rows, cols) * .01,
+            'chi': np.arctan2(rows, cols),
+            'solid_angle': rng.uniform(.9, 1., shape)}
+    mask = rng.uniform(size=shape) > .1
+    return SimpleNamespace(geometry=lambda section=False: geom, mask=mask), geom
+
+
+def test_cake():
+    setup, geom = fake_setup()
+    cake = Cake(setup, nq=6, nphi=8, qrange=(.02, .2))
+    cake.batch = 2
+    imgs = np.random.default_rng(13).uniform(0, 5, (5, 30, 40))
+    out = cake.integrate(imgs)
+    qedges = np.linspace(.02, .2, 7)
+    phiedges = np.linspace(-np.pi, np.pi, 9)
+    for i in range(6):
+        for j in range(8):
+            sel = ((geom['q'] >= qedges[i]) & (geom['q'] < qedges[i+1]) &
+                   (geom['chi'] >= phiedges[j]) & (geom['chi'] < phiedges[j+1]) & setup.mask)
+            if sel.any():
+                ref = imgs[:, sel].sum(-1) / geom['solid_angle'][sel].sum()
+                np.testing.assert_allclose(out[:, i, j], ref)
+            else:
+                assert np.isnan(out[:, i, j]).all()
+
+
+def test_angular_correlation():
+    rng = np.random.default_rng(14)
+    cake = rng.uniform(1, 2, (3, 4, 12))
+    cake[0, 1, [2, 7]] = np.nan
+    corr = angular_correlation(cake)
+    for idx in np.ndindex(cake.shape[:-1]):
+        c = cake[idx]
+        valid = np.isfinite(c)
+        mean = c[valid].mean()
+        for k in range(12):
+            pair = valid & np.roll(valid, -k)
+            ref = ((c - mean) * (np.roll(c, -k) - mean))[pair].mean() / mean**2
+            np.testing.assert_allclose(corr[idx + (k,)], ref)
+    phi = np.linspace(0, 2*np.pi, 12, endpoint=False)
+    np.testing.assert_allclose(anisotropy(2 + .4*np.cos(2*phi)), .2)
@@ -0,0 +1,97 @@
+import numpy as np
+from Xana.XpcsAna.pyxpcs3 import pyxpcs, avr_better
+
+
+def section_data(nf=64, shape=(40, 50), qsec=((5, 8), (24, 37))):
+    rng = np.random.default_rng(2)
+    dim = (qsec[1][0]-qsec[0][0]+1, qsec[1][1]-qsec[0][1]+1)
+    data = rng.poisson(3., (nf, *dim)).astype(np.float32)
+    saxs = rng.uniform(1, 2, shape)
+    mask = np.ones(shape, 'int8')
+    rows, cols = np.indices(dim)
+    qroi = [np.where((rows + cols) % 3 == i) for i in range(3)]
+    qroi = [(q[0] + qsec[0][0], q[1] + qsec[0][1]) for q in qroi]
+    return data, saxs, mask, qroi, qsec, dim
+
+
+def test_roi_mode_full_saxs():
+    data, saxs, mask, qroi, qsec, dim = section_data()
+    opt = dict(saxs=saxs, mask=mask, qsec=qsec[0], ctr=(20, 25), norm='symmetric',
+               verbose=False)
+    ref = pyxpcs(data, qroi, **opt)
+    rois = np.concatenate([data[:, q[0]-qsec[0][0], q[1]-qsec[0][1]] for q in qroi], 1)
+    out = pyxpcs(rois, qroi, qsec_dim=dim, **opt)
+    np.testing.assert_allclose(out['corf'], ref['corf'], rtol=1e-5)
+    np.testing.assert_allclose(out['trace'], ref['trace'], rtol=1e-5)
+    # saxs cropped to the section defines the shape of the section
+    sec = (slice(qsec[0][0], qsec[1][0]+1), slice(qsec[0][1], qsec[1][1]+1))
+    out = pyxpcs(rois, qroi, **dict(opt, saxs=saxs[sec]))
+    np.testing.assert_allclose(out['corf'], ref['corf'], rtol=1e-5)
+
+
+def avr_loop(saxs, ctr, mask):
+    # the former per-radius and per-pixel loops of avr_better
+    cx, cy = ctr
+    dim1, dim2 = np.shape(saxs)
+    X, Y = np.mgrid[1-cy:dim1+1-cy, 1-cx:dim2+1-cx]
+    q = np.float32(np.sqrt(X**2 + Y**2))
+    n = np.int16(q + 0.5)
+    q[mask == 0] = 0
+    n[mask == 0] = 0
+    max_n = n.max() + 1
+    mean_saxs = np.zeros(max_n+1, np.float32)
+    new_saxs = np.zeros_like(saxs, np.float32)
+    for i in range(max_n):
+        ind = np.where((n == i) & (mask == 1))
+        if ind[0].size:
+            mean_saxs[i] = np.mean(saxs[ind])
+    for i in range(dim1):
+        for j in range(dim2):
+            if q[i, j] > 0:
+                par = int(q[i, j])
+                f1 = q[i, j] - par
+                lo, hi = mean_saxs[par], mean_saxs[par+1]
+                if hi > 0 and lo > 0:
+                    new_saxs[i, j] = hi*f1 + lo*(1-f1)
+                if hi > 0 and lo == 0:
+                    new_saxs[i, j] = hi
+                if hi == 0 and lo > 0:
+                    new_saxs[i, j] = lo
+    return new_saxs
+
+
+def test_avr_better():
+    rng = np.random.default_rng(3)
+    saxs = rng.uniform(1, 2, (30, 45))
+    mask = np.ones(saxs.shape, 'int8')
+    mask[5:9, :] = 0 # some radii without pixels
+    mask[rng.uniform(size=mask.shape) < .1] = 0
+    for ctr in [(20, 12), (-3.5, 40.2)]:
+        np.testing.assert_allclose(avr_better(saxs, ctr, mask),
+                                   avr_loop(saxs, ctr, mask), rtol=1e-6)
+
+
+def test_chunk_normalization():
+    rng = np.random.default_rng(4)
+    data = rng.poisson(4., (64, 12, 15)).astype(np.float32)
+    mask = np.ones((12, 15), 'int8')
+    mask[:, :3] = 0
+    rows, cols = np.indices(mask.shape)
+    qroi = [np.where((cols >= 3) & (cols % 3 == i)) for i in range(3)]
+    rois = [data[:, q[0], q[1]] for q in qroi]
+    whole = data[:, mask == 1].mean(-1)
+    manual = {
+        'symmetric': [r / r.mean(-1)[:, None] for r in rois],
+        'symmetric_whole': [r / whole[:, None] for r in rois],
+        'corrcoef': [(r - r.mean(-1)[:, None]) / r.std(-1)[:, None] for r in rois],
+    }
+    opt = dict(mask=mask, chunk_size=16, verbose=False)
+    for norm, normed in manual.items():
+        out = pyxpcs(data, qroi, norm=norm, **opt)
+        np.testing.assert_allclose(out['trace'], np.stack([r.mean(-1) for r in rois], 1),
+                                   rtol=1e-6)
+        # the same correlation for data normalized beforehand; standardized
+        # data is left unchanged by 'corrcoef'
+        ref = pyxpcs(np.concatenate(normed, 1), qroi, qsec_dim=mask.shape,
+                     norm='corrcoef' if norm == 'corrcoef' else 'none', **opt)
+        np.testing.assert_allclose(out['corf'], ref['corf'], rtol=1e-5, atol=1e-8)
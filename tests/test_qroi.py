@@ -0,0 +1,41 @@
+import pickle
+import numpy as np
+from Xana.misc.qroi import QRoi, section_qroi
+
+
+def tuple_rois(shape=(30, 40)):
+    rows, cols = np.indices(shape)
+    r = np.hypot(rows - 12, cols - 15)
+    return [np.where((r >= a) & (r < a + 3)) for a in (2, 5, 9)]
+
+
+def test_qroi_tuples():
+    rois = tuple_rois()
+    qroi = QRoi.from_tuples(rois, (30, 40))
+    assert len(qroi) == 3
+    np.testing.assert_array_equal(qroi.sizes, [len(q[0]) for q in rois])
+    for a, b in zip(qroi, rois):
+        np.testing.assert_array_equal(a, b)
+    np.testing.assert_array_equal(qroi[-1], rois[-1])
+    labels = qroi.labels
+    for i, q in enumerate(rois):
+        assert (labels[q] == i + 1).all()
+    np.testing.assert_array_equal(QRoi.from_labels(labels).index, qroi.index)
+    assert pickle.loads(pickle.dumps(qroi)).labels is not None
+    rmin = min(q[0].min() for q in rois)
+    cmin = min(q[1].min() for q in rois)
+    rmax = max(q[0].max() for q in rois)
+    cmax = max(q[1].max() for q in rois)
+    assert qroi.bbox() == ((rmin, cmin), (rmax, cmax))
+
+
+def test_section_qroi():
+    rois = tuple_rois()
+    qsec = ((1, 2), (25, 30))
+    dim = (25, 29)
+    for q in (rois, QRoi.from_tuples(rois, (30, 40))):
+        sec = section_qroi(q, qsec[0], dim)
+        assert sec.shape == dim
+        for a, b in zip(sec, rois):
+            np.testing.assert_array_equal(a[0], b[0] - qsec[0][0])
+            np.testing.assert_array_equal(a[1], b[1] - qsec[0][1])
@@ -0,0 +1,115 @@
+import os
+from types import SimpleNamespace
+import h5py
+import pytest
+import numpy as np
+from Xana.ProcData.ReadData import read_data, photonize, multiedf
+from Xana.ProcData.ArrangeModules import arrange_cspad_tiles
+
+
+def cspad_file(tmp_path, nf=3):
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 100, (nf, 32, 185, 388)).astype(np.float32)
+    filename = str(tmp_path / 'cspad.h5')
+    with h5py.File(filename, 'w') as f:
+        f['data'] = data
+    xdata = SimpleNamespace(h5opt={'data': '/data', 'arrange_tiles': arrange_cspad_tiles},
+                            setup=SimpleNamespace(), fmtstr='xcs_cspad_h5')
+    return filename, data, xdata
+
+
+def test_cspad_roi_dark(tmp_path):
+    filename, data, xdata = cspad_file(tmp_path)
+    dark = np.random.default_rng(3).uniform(0, 5, data.shape[1:]).astype(np.float32)
+    img = arrange_cspad_tiles(data - dark)
+    nz = np.nonzero(img[0])
+    qroi = [(nz[0][::1000], nz[1][::1000])]
+    out = read_data([filename], xdata=xdata, output='roi', qroi=qroi, dark=dark,
+                    chunk_size=2, verbose=False)
+    np.testing.assert_allclose(np.asarray(out), img[:, qroi[0][0], qroi[0][1]], rtol=1e-6)
+
+
+def image_file(tmp_path, nf=4, shape=(20, 30)):
+    rng = np.random.default_rng(1)
+    data = rng.uniform(0, 40, (nf, *shape)).astype(np.float32)
+    filename = str(tmp_path / 'images.h5')
+    with h5py.File(filename, 'w') as f:
+        f['data'] = data
+    return filename, data
+
+
+def test_cspad_roi(tmp_path):
+    filename, data, xdata = cspad_file(tmp_path)
+    img = arrange_cspad_tiles(data)
+    nz = np.nonzero(img[0])
+    qroi = [(nz[0][:50], nz[1][:50]), (nz[0][-20:], nz[1][-20:])]
+    out = read_data([filename], xdata=xdata, output='roi', qroi=qroi,
+                    chunk_size=2, verbose=False)
+    expected = np.concatenate([img[:, q[0], q[1]] for q in qroi], -1)
+    np.testing.assert_allclose(np.asarray(out), expected)
+
+
+def test_photonize_gain_map_qsec(tmp_path):
+    filename, data = image_file(tmp_path)
+    gain = np.linspace(5, 10, data[0].size, dtype=np.float32).reshape(data.shape[1:])
+    qsec = ((3, 5), (12, 24))
+    out = read_data([filename], detector='converted_h5', datapath='/data', qsec=qsec,
+                    output='2dsection', photonize={'adusPphoton': gain},
+                    verbose=False)
+    sec = (slice(qsec[0][0], qsec[1][0]+1), slice(qsec[0][1], qsec[1][1]+1))
+    expected = photonize(data[(slice(None), *sec)], gain[sec])
+    np.testing.assert_array_equal(out, expected)
+
+
+def test_photonize_integer_threshold():
+    arr = np.arange(-2, 300).reshape(2, -1)
+    for threshold in (.2, 1., 1.5, 3.):
+        np.testing.assert_array_equal(photonize(arr, threshold=threshold),
+                                      photonize(arr.astype(float), threshold=threshold))
+
+
+def test_average_stats(tmp_path):
+    filename, data = image_file(tmp_path, nf=7)
+    qsec = ((2, 4), (15, 25))
+    sec = (slice(None), slice(qsec[0][0], qsec[1][0]+1), slice(qsec[0][1], qsec[1][1]+1))
+    weights = [1., 2., 0.5, 1., 3., 1., 2.]
+    avg = read_data([filename], detector='converted_h5', datapath='/data', qsec=qsec,
+                    method='average', chunk_size=3, frame_weights=weights, verbose=False)
+    np.testing.assert_allclose(avg['mean'], np.average(data[sec], 0, weights), rtol=1e-6)
+    np.testing.assert_array_equal(avg['min'], data[sec].min(0))
+    np.testing.assert_array_equal(avg['max'], data[sec].max(0))
+    assert avg['count'] == data.shape[0]
+
+
+def test_output_file(tmp_path):
+    filename, data = image_file(tmp_path)
+    qroi = [np.where(np.ones(data.shape[1:], bool))]
+    outfile = str(tmp_path / 'out.h5')
+    dset = read_data([filename], detector='converted_h5', datapath='/data', output='roi',
+                     qroi=qroi, output_file=outfile, frame_mean=True, chunk_size=3,
+                     verbose=False)
+    assert dset.file.mode == 'r'
+    np.testing.assert_array_equal(dset[()], data.reshape(data.shape[0], -1))
+    with h5py.File(outfile, 'r') as f:
+        np.testing.assert_allclose(f['frame_mean'][()], data.mean((1, 2)), rtol=1e-6)
+    dset.file.close()
+    with pytest.raises(ValueError):
+        read_data([filename], detector='converted_h5', datapath='/data', output='roi',
+                  qroi=qroi, output_file=str(tmp_path / 'out.npy'), frame_mean=True,
+                  verbose=False)
+
+
+def test_multiedf_index(edf_series):
+    files, data = edf_series
+    out = read_data(files, detector='id02_eiger_multi_edf', output='2dsection',
+                    chunk_size=4, verbose=False)
+    np.testing.assert_array_equal(out, data)
+    # frames of one file that are not contiguous in the chunk
+    dcls = multiedf(files[0], np.array(files), {'qsec': None, 'dtype': np.float32})
+    dcls.get_shape()
+    if os.path.isdir('/proc/self/fd'):
+        fds = [os.path.realpath('/proc/self/fd/' + x) for x in os.listdir('/proc/self/fd')]
+        assert not set(files) & set(fds)
+    indx = np.array([0, 6, 2, 9, 3])
+    dcls.load_chunk(indx)
+    np.testing.assert_array_equal(dcls.chunk, data[indx])
@@ -0,0 +1,27 @@
+import numpy as np
+from Xana.ProcData.ReadData import read_data
+from Xana.ProcData.RoiCache import (roi_cache_key, roi_cache_file, write_roi_cache,
+                                    read_roi_cache)
+
+
+def test_roi_cache(edf_series, tmp_path):
+    files, data = edf_series
+    qroi = [np.where(np.arange(42).reshape(6, 7) % 4 == i) for i in range(2)]
+    mask = np.ones(data.shape[1:], bool)
+    mask[0] = False
+
+    def get_series(sid, **opt):
+        return read_data(files, detector='id02_eiger_multi_edf', **opt)
+
+    opt = dict(first=0, last=data.shape[0]-1, qroi=qroi, mask=mask, chunk_size=4,
+               verbose=False)
+    key = roi_cache_key(files, qroi, mask, None, {'dark': None})
+    assert key == roi_cache_key(files, qroi, mask, None, {'dark': None})
+    assert key != roi_cache_key(files, qroi, mask, None, {'dark': np.zeros((6, 7))})
+    cachefile = roi_cache_file(str(tmp_path), 1, key)
+    write_roi_cache(get_series, 0, cachefile, key, opt)
+
+    rois, frame_mean = read_roi_cache(cachefile, 2, 7)
+    ref = np.concatenate([data[:, q[0], q[1]] for q in qroi], 1)
+    np.testing.assert_array_equal(rois, ref[2:8])
+    np.testing.assert_allclose(frame_mean, data[2:8, 1:].mean((1, 2)), rtol=1e-6)
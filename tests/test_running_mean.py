@@ -0,0 +1,24 @@
+import numpy as np
+from Xana.misc.running_mean import RunningStats
+
+
+def test_running_stats():
+    rng = np.random.default_rng(7)
+    data = rng.normal(5, 2, (20, 4, 3)).astype(np.float32)
+    weights = rng.uniform(0, 2, 20)
+    weights[5:10] = 0
+    stats = RunningStats()
+    for t in range(0, 20, 5):
+        stats.update(data[t:t+5], weights[t:t+5])
+    assert np.isfinite(stats.mean).all()
+    mean = np.average(data, 0, weights)
+    np.testing.assert_allclose(stats.mean, mean, rtol=1e-6)
+    np.testing.assert_allclose(stats.variance(),
+                               np.average((data - mean)**2, 0, weights), rtol=1e-6)
+
+    merged = RunningStats().update(data[:7]).merge(RunningStats().update(data[7:]))
+    np.testing.assert_allclose(merged.mean, data.mean(0, dtype=np.float64), rtol=1e-6)
+    np.testing.assert_allclose(merged.variance(ddof=1), data.var(0, ddof=1), rtol=1e-5)
+    np.testing.assert_array_equal(merged.min, data.min(0))
+    np.testing.assert_array_equal(merged.max, data.max(0))
+    assert merged.count == 20
@@ -0,0 +1,78 @@
+import queue
+from multiprocessing import Queue
+import numpy as np
+from Xana.XsvsAna.mp_prob import mp_prob
+from Xana.XsvsAna.pyxsvs3 import pyxsvs
+from Xana.XsvsAna.evtprob import evtxsvs
+
+
+def run_mp_prob(chunks, nbins, nf, lind, binning=None):
+    quc, quce = Queue(), Queue()
+    for chunk in chunks:
+        quc.put(chunk)
+    mp_prob('full', nbins, nf, lind, len(lind), quc, quce, binning)
+    return quce.get()[0]
+
+
+def hist_loop(rois, nbins, lind):
+    # per frame and ROI np.histogram as in the former xsvs_full
+    prob = np.zeros((len(rois), nbins+1, rois[0].shape[0]), dtype=np.float32)
+    for qi, roi in enumerate(rois):
+        for i, line in enumerate(roi):
+            tmp = np.append(np.sum(line), np.histogram(line, bins=np.arange(nbins+1)-0.5)[0])
+            prob[qi, :, i] = tmp / lind[qi]
+    return prob
+
+
+def test_histograms():
+    rng = np.random.default_rng(5)
+    nbins, nf, lind = 6, 24, [30, 11]
+    for dtype in (np.int32, np.float64):
+        rois = [(rng.poisson(2., (nf, n)) - (rng.uniform(size=(nf, n)) < .05)).astype(dtype)
+                for n in lind]
+        if dtype == np.float64:
+            rois = [r + rng.uniform(-.49, .49, r.shape) for r in rois]
+        chunks = [[r[i:i+10] for r in rois] for i in range(0, nf, 10)]
+        np.testing.assert_allclose(run_mp_prob(chunks, nbins, nf, lind),
+                                   hist_loop(rois, nbins, lind), rtol=1e-6)
+
+
+def test_binning():
+    rng = np.random.default_rng(6)
+    nf = 23
+    data = rng.poisson(.5, (nf, 8, 9)).astype(np.int32)
+    rows, cols = np.indices(data.shape[1:])
+    qroi = [np.where(rows < 4), np.where((rows >= 4) & (cols < 5))]
+    dataq = queue.Queue()
+    for i, t in enumerate(range(0, nf, 5)):
+        dataq.put((i, data[t:t+5]))
+    out = pyxsvs({'nimages': nf, 'dataQ': dataq}, qroi, nbins=8, nprocs=2,
+                 verbose=0, binning=(4, 1, 3, 2, 40))
+    assert out['binning'] == [1, 2, 3, 4]
+    for b, prob in zip(out['binning'], out['prob_binned']):
+        n = nf // b
+        summed = data[:n*b].reshape(n, b, *data.shape[1:]).sum(1)
+        ref = pyxsvs(summed, qroi, nbins=8, t_e=b, verbose=0)
+        np.testing.assert_array_equal(prob, ref['prob'])
+    np.testing.assert_array_equal(out['prob'], out['prob_binned'][0])
+
+
+def test_events():
+    rng = np.random.default_rng(7)
+    nf = 17
+    data = rng.poisson(.8, (nf, 8, 9)).astype(np.int32)
+    rows, cols = np.indices(data.shape[1:])
+    qroi = [np.where(rows < 4), np.where((rows >= 4) & (cols < 5))]
+    events = []
+    for q in qroi:
+        roi = data[:, q[0], q[1]]
+        t, pix = np.nonzero(roi)
+        counts = roi[t, pix]
+        order = rng.permutation(counts.sum()) # events need not be sorted
+        events.append((np.repeat(pix, counts)[order], np.repeat(t, counts)[order],
+                       roi.sum(-1)))
+    out = evtxsvs(events, qroi, nbins=3, verbose=0, binning=(1, 2, 5))
+    ref = pyxsvs(data, qroi, nbins=3, verbose=0, binning=(1, 2, 5))
+    for prob, refprob in zip(out['prob_binned'], ref['prob_binned']):
+        np.testing.assert_allclose(prob, refprob, rtol=1e-6)
+    np.testing.assert_allclose(out['trace'], ref['trace'])